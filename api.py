@@ -0,0 +1,450 @@
+"""API HTTP (JSON) das simulações do SecureInvest, como aplicação ASGI sem dependências extras
+
+Rotas (POST com corpo JSON, parâmetros com os mesmos nomes dos métodos do simulador):
+
+    /v1/fixed-income      calculate_fixed_income
+    /v1/treasury          calculate_treasury
+    /v1/variable-income   calculate_variable_income
+    /v1/goal-scenario     calculate_goal_scenario
+    /v1/risk-metrics      calculate_risk_metrics
+    /v1/goal-grid         solve_goal_grid
+    /v1/batch             {"requests": [{"endpoint": "fixed-income", "params": {...}}, ...]}
+
+    GET /health           verificação de disponibilidade
+    GET /metrics          latências p50/p99 por rota, lotes despachados e cache de resultados
+
+As simulações rodam em um pool de processos. Chamadas que chegam juntas são agrupadas em
+lotes (até max_batch chamadas ou max_delay segundos) e enviadas em uma única tarefa ao
+pool; pedidos idênticos em andamento são atendidos por uma única execução, e os resultados
+(já serializados) ficam no cache compartilhado do processo. A grade de objetivos também roda
+no pool, limitada por MAX_GOAL_GRID_CELLS e MAX_GOAL_GRID_MONTHS (acima disso, status 400).
+
+Uso:
+    python api.py [--host 0.0.0.0] [--port 8000] [--workers 4] [--snapshot mercado.sisnap]
+    uvicorn api:app        (configuração pelas variáveis SECUREINVEST_WORKERS e SECUREINVEST_SNAPSHOT)
+"""
+import argparse
+import asyncio
+import datetime
+import inspect
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from parallel import default_workers
+from result_cache import ResultCache, canonical_key
+from simulator import SecureInvestSimulator
+from snapshot import load_snapshot
+
+# Rota -> método do simulador executado no pool de processos
+SIMULATION_ROUTES = {
+    '/v1/fixed-income': 'calculate_fixed_income',
+    '/v1/treasury': 'calculate_treasury',
+    '/v1/variable-income': 'calculate_variable_income',
+    '/v1/goal-grid': 'solve_goal_grid'
+}
+
+# Rota -> método leve, executado direto no processo da API
+INLINE_ROUTES = {
+    '/v1/goal-scenario': 'calculate_goal_scenario',
+    '/v1/risk-metrics': 'calculate_risk_metrics'
+}
+
+DATE_PARAMETERS = ('start_date', 'end_date')
+
+# Tamanho máximo do corpo de uma requisição
+MAX_BODY_BYTES = 1024 * 1024
+
+# Limites da grade de objetivos: células por eixo de meses (modalidades x planos x meses) e
+# do resultado (modalidades x planos x objetivos x prazos), e prazo máximo em meses
+MAX_GOAL_GRID_CELLS = 200000
+MAX_GOAL_GRID_MONTHS = 1200
+
+# Latências guardadas por rota para o cálculo dos percentis
+LATENCY_WINDOW = 10000
+
+
+class APIError(Exception):
+    """Erro com status HTTP para o cliente"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def to_jsonable(value):
+    """Converte resultados do simulador (DataFrames, tipos NumPy, datas) em tipos JSON"""
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, pd.DataFrame):
+        # Colunar: uma lista por coluna, bem mais compacta que uma lista de registros
+        return {column: to_jsonable(value[column].to_numpy()) for column in value.columns}
+    if isinstance(value, np.ndarray):
+        if np.issubdtype(value.dtype, np.datetime64):
+            return np.datetime_as_string(value, unit='D').tolist()
+        return to_jsonable(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None  # inf/NaN não existem em JSON (ex.: objetivo nunca atingido)
+    if isinstance(value, (datetime.date, datetime.datetime, pd.Timestamp)):
+        return value.isoformat()
+    return value
+
+
+def encode(value):
+    return json.dumps(to_jsonable(value), separators=(',', ':')).encode('utf-8')
+
+
+def _signature(method):
+    return inspect.signature(getattr(SecureInvestSimulator, method))
+
+
+def parse_arguments(method, params):
+    """Valida os parâmetros JSON de um método do simulador e converte as datas"""
+    if not isinstance(params, dict):
+        raise APIError(400, 'o corpo deve ser um objeto JSON com os parâmetros')
+    arguments = dict(params)
+    for name in DATE_PARAMETERS:
+        if name in arguments:
+            try:
+                arguments[name] = datetime.date.fromisoformat(str(arguments[name]))
+            except ValueError:
+                raise APIError(400, f"{name} deve estar no formato AAAA-MM-DD")
+    signature = _signature(method)
+    if method in SIMULATION_ROUTES.values() and 'include_history' in signature.parameters:
+        arguments.setdefault('include_history', False)
+    try:
+        signature.bind(None, **arguments)
+    except TypeError as e:
+        raise APIError(400, f"parâmetros inválidos: {e}")
+    if method == 'solve_goal_grid':
+        check_goal_grid(arguments, signature.parameters['max_months'].default)
+    return arguments
+
+
+def check_goal_grid(arguments, default_max_months):
+    """Recusa grades de objetivos grandes demais para uma única chamada"""
+    try:
+        sizes = {name: len(arguments[name]) for name in ('goals', 'horizons', 'mixes', 'modalities')}
+        months = max([int(arguments.get('max_months', default_max_months))] + [int(h) for h in arguments['horizons']])
+    except (TypeError, ValueError):
+        raise APIError(400, 'goals, horizons, mixes e modalities devem ser listas; prazos em meses inteiros')
+    if months > MAX_GOAL_GRID_MONTHS:
+        raise APIError(400, f"prazo máximo da grade de objetivos: {MAX_GOAL_GRID_MONTHS} meses")
+    plans = sizes['modalities'] * sizes['mixes']
+    cells = max(plans * (months + 1), plans * sizes['goals'] * sizes['horizons'])
+    if cells > MAX_GOAL_GRID_CELLS:
+        raise APIError(400, f"grade de objetivos muito grande ({cells} células; máximo {MAX_GOAL_GRID_CELLS})")
+
+
+_simulator = None
+
+
+def _init_worker(snapshot_path):
+    """Cria o simulador usado pelas chamadas executadas neste processo"""
+    global _simulator
+    snapshot = load_snapshot(snapshot_path) if snapshot_path else None
+    _simulator = SecureInvestSimulator(snapshot=snapshot)
+
+
+def _run_calls(calls):
+    """Executa um lote de chamadas [(método, argumentos)] e retorna [(status, JSON em bytes)]"""
+    results = []
+    for method, arguments in calls:
+        try:
+            results.append((200, encode(getattr(_simulator, method)(**arguments))))
+        except (ValueError, TypeError, KeyError, ZeroDivisionError) as e:
+            results.append((400, encode({'error': str(e)})))
+        except Exception as e:
+            results.append((500, encode({'error': f"{type(e).__name__}: {e}"})))
+    return results
+
+
+class LatencyMetrics:
+    """Contadores e janelas de latência por rota"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.routes = {}
+        self.batches = 0
+        self.batched_calls = 0
+
+    def record(self, route, seconds, status):
+        entry = self.routes.setdefault(route, {'latencies': deque(maxlen=self.window), 'count': 0, 'errors': 0})
+        entry['latencies'].append(seconds)
+        entry['count'] += 1
+        if status >= 400:
+            entry['errors'] += 1
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.batched_calls += size
+
+    def snapshot(self):
+        routes = {}
+        for route, entry in sorted(self.routes.items()):
+            latencies = np.fromiter(entry['latencies'], dtype=np.float64) * 1000
+            p50, p99 = np.percentile(latencies, (50, 99)) if len(latencies) else (0.0, 0.0)
+            routes[route] = {
+                'count': entry['count'],
+                'errors': entry['errors'],
+                'p50_ms': round(float(p50), 3),
+                'p99_ms': round(float(p99), 3)
+            }
+        return {
+            'routes': routes,
+            'batches': {
+                'count': self.batches,
+                'mean_size': self.batched_calls / self.batches if self.batches else 0.0
+            }
+        }
+
+
+class SimulationAPI:
+    """Aplicação ASGI com agrupamento de chamadas, pool de processos e cache de resultados
+
+    workers=0 executa as simulações em uma thread do próprio processo (útil com uma única CPU).
+    """
+
+    def __init__(self, workers=None, snapshot_path=None, max_batch=64, max_delay=0.002, result_cache=None):
+        self.workers = default_workers() if workers is None else workers
+        self.snapshot_path = snapshot_path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.result_cache = result_cache or ResultCache(maxsize=4096, ttl=3600)
+        self.metrics = LatencyMetrics()
+        self._executor = None
+        self._pending = []
+        self._inflight = {}
+        self._timer = None
+        # Simulador local: versão das taxas (chave do cache) e métodos leves
+        self._simulator = SecureInvestSimulator(snapshot=load_snapshot(snapshot_path) if snapshot_path else None)
+        self._rates_version = self._simulator.rates_version()
+
+    # Pool de execução
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.workers > 0:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.snapshot_path,)
+                )
+            else:
+                _init_worker(self.snapshot_path)
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # Agrupamento de chamadas
+
+    async def simulate(self, method, arguments):
+        """Retorna (status, JSON em bytes) de uma simulação, pelo cache ou por um lote do pool"""
+        key = canonical_key(method, arguments, self._rates_version)
+        found, payload = self.result_cache.get(key)
+        if found:
+            return 200, payload
+
+        # Pedidos idênticos em andamento compartilham a mesma execução
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[key] = future
+        self._pending.append((key, method, arguments, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.metrics.record_batch(len(batch))
+
+        loop = asyncio.get_running_loop()
+        calls = [(method, arguments) for _, method, arguments, _ in batch]
+        task = loop.run_in_executor(self._get_executor(), _run_calls, calls)
+
+        def resolve(task):
+            try:
+                results = task.result()
+            except Exception as e:
+                results = [(500, encode({'error': f"falha no pool de simulação: {e}"}))] * len(batch)
+            for (key, _, _, future), (status, payload) in zip(batch, results):
+                self._inflight.pop(key, None)
+                if status == 200:
+                    self.result_cache.set(key, payload)
+                if not future.done():
+                    future.set_result((status, payload))
+
+        task.add_done_callback(resolve)
+
+    # Rotas
+
+    async def dispatch(self, route, params):
+        """Executa uma rota e retorna (status, JSON em bytes)"""
+        if route in SIMULATION_ROUTES:
+            method = SIMULATION_ROUTES[route]
+            return await self.simulate(method, parse_arguments(method, params))
+        if route in INLINE_ROUTES:
+            method = INLINE_ROUTES[route]
+            arguments = parse_arguments(method, params)
+            try:
+                return 200, encode(getattr(self._simulator, method)(**arguments))
+            except (ValueError, TypeError, KeyError, ZeroDivisionError) as e:
+                raise APIError(400, str(e))
+        if route == '/v1/batch':
+            return 200, await self.dispatch_batch(params)
+        raise APIError(404, f"rota não encontrada: {route}")
+
+    async def dispatch_batch(self, body):
+        """Executa várias chamadas de uma vez; cada item tem o próprio status"""
+        requests = body.get('requests') if isinstance(body, dict) else None
+        if not isinstance(requests, list):
+            raise APIError(400, 'o corpo deve conter a lista "requests"')
+
+        async def run(item):
+            try:
+                if not isinstance(item, dict):
+                    raise APIError(400, 'cada item deve ser um objeto com endpoint e params')
+                route = '/v1/' + str(item.get('endpoint', '')).strip('/')
+                if route == '/v1/batch':
+                    raise APIError(400, 'lotes não podem ser aninhados')
+                return await self.dispatch(route, item.get('params', {}))
+            except APIError as e:
+                return e.status, encode({'error': e.message})
+
+        results = await asyncio.gather(*(run(item) for item in requests))
+        return b'{"results":[' + b','.join(
+            b'{"status":%d,"body":%s}' % (status, payload) for status, payload in results
+        ) + b']}'
+
+    async def handle(self, method, route, body):
+        if method == 'GET' and route == '/health':
+            return 200, b'{"status":"ok"}'
+        if method == 'GET' and route == '/metrics':
+            return 200, encode({**self.metrics.snapshot(), 'cache': self.result_cache.stats()})
+        if route in SIMULATION_ROUTES or route in INLINE_ROUTES or route == '/v1/batch':
+            if method != 'POST':
+                raise APIError(405, 'use POST')
+            try:
+                params = json.loads(body or b'{}')
+            except ValueError:
+                raise APIError(400, 'JSON inválido')
+            return await self.dispatch(route, params)
+        raise APIError(404, f"rota não encontrada: {route}")
+
+    # Protocolo ASGI
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        started = time.perf_counter()
+        route = scope['path'].rstrip('/') or '/'
+        try:
+            body = await self._read_body(receive)
+            status, payload = await self.handle(scope['method'], route, body)
+        except APIError as e:
+            status, payload = e.status, encode({'error': e.message})
+        except Exception as e:
+            status, payload = 500, encode({'error': f"{type(e).__name__}: {e}"})
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+        if route not in ('/health', '/metrics'):
+            # Rotas desconhecidas ficam agrupadas para não multiplicar as entradas das métricas
+            known = route in SIMULATION_ROUTES or route in INLINE_ROUTES or route == '/v1/batch'
+            self.metrics.record(route if known else 'other', time.perf_counter() - started, status)
+
+    async def _read_body(self, receive):
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise APIError(413, 'corpo da requisição muito grande')
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+class _LazyApp:
+    """Cria a aplicação padrão (uvicorn api:app) só na primeira requisição"""
+
+    def __init__(self):
+        self._app = None
+
+    async def __call__(self, scope, receive, send):
+        if self._app is None:
+            self._app = SimulationAPI(snapshot_path=os.environ.get('SECUREINVEST_SNAPSHOT'))
+        await self._app(scope, receive, send)
+
+
+app = _LazyApp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='API HTTP das simulações do SecureInvest')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processos de simulação (padrão: SECUREINVEST_WORKERS ou nº de CPUs; 0 = no próprio processo)')
+    parser.add_argument('--snapshot', metavar='SISNAP', default=os.environ.get('SECUREINVEST_SNAPSHOT'),
+                        help='snapshot de dados de mercado (padrão: SECUREINVEST_SNAPSHOT)')
+    parser.add_argument('--max-batch', type=int, default=64, help='chamadas por lote enviado ao pool (padrão: 64)')
+    parser.add_argument('--max-delay-ms', type=float, default=2.0, help='espera máxima para completar um lote (padrão: 2 ms)')
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    api = SimulationAPI(
+        workers=args.workers, snapshot_path=args.snapshot,
+        max_batch=args.max_batch, max_delay=args.max_delay_ms / 1000
+    )
+    uvicorn.run(api, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+"""Simulação em lote de perfis de clientes pela linha de comando
+
+Lê um CSV ou Parquet de perfis em blocos (sem carregar o arquivo inteiro), distribui os
+perfis entre processos e grava um resumo por perfil e modalidade (e, opcionalmente, os
+históricos mês a mês) em Parquet, informando a vazão em perfis por segundo.
+
+Colunas aceitas no arquivo de perfis (apenas profile_id, start_date e end_date são obrigatórias):
+
+    profile_id            identificador do perfil
+    monthly_investment    aporte mensal (R$)
+    quarterly_investment  aporte trimestral (R$)
+    annual_investment     aporte anual (R$)
+    start_date, end_date  período da simulação (AAAA-MM-DD)
+    modalities            modalidades separadas por ';' (selic, cdb, fii, stocks, treasury)
+    fii_assets            FIIs separados por ';'
+    stock_assets          ações separadas por ';'
+    treasury              título do Tesouro (padrão: Tesouro Selic)
+    financial_goal        objetivo financeiro (R$)
+    include_taxes         considera impostos (true/false)
+    include_ipca          calcula também os valores reais, descontada a inflação (true/false)
+    scenario              cenário econômico (otimista, neutro, pessimista ou crise)
+
+Uso:
+    python batch.py perfis.csv resumo.parquet [--histories historicos.parquet]
+                    [--workers 8] [--chunk-size 5000] [--snapshot mercado.sisnap]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from parallel import default_workers
+from simulator import CONTRIBUTION_MONTHS, SecureInvestSimulator
+from snapshot import load_snapshot
+
+MODALITIES = ('selic', 'cdb', 'fii', 'stocks', 'treasury')
+
+# Perfis por tarefa enviada a um processo (equilibra custo de comunicação e distribuição)
+TASK_SIZE = 64
+
+# Colunas e tipos (Arrow) dos arquivos de saída; o esquema é fixo para todos os blocos
+SUMMARY_COLUMNS = {
+    'profile_id': 'string',
+    'modality': 'string',
+    'scenario': 'string',
+    'final_balance': 'float64',
+    'total_contributed': 'float64',
+    'earnings': 'float64',
+    'taxes': 'float64',
+    'dividends': 'float64',
+    'monthly_rate': 'float64',
+    'real_final_balance': 'float64',
+    'financial_goal': 'float64',
+    'goal_reached': 'bool',
+    'months_to_goal': 'float64',
+    'required_monthly': 'float64',
+    'additional_monthly': 'float64',
+    'error': 'string'
+}
+
+HISTORY_COLUMNS = {
+    'profile_id': 'string',
+    'modality': 'string',
+    'real': 'bool',
+    'date': 'timestamp[ns]',
+    'balance': 'float64',
+    'contribution': 'float64',
+    'dividends': 'float64'
+}
+
+_simulator = None
+
+
+def _init_worker(snapshot_path):
+    """Cria um simulador por processo
+
+    Sem cache de resultados: perfis de clientes raramente se repetem, e montar a chave de
+    cada chamada custaria mais do que os acertos economizariam.
+    """
+    global _simulator
+    snapshot = load_snapshot(snapshot_path) if snapshot_path else None
+    _simulator = SecureInvestSimulator(snapshot=snapshot)
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NA
+
+
+def _text(value, default=''):
+    return default if _is_missing(value) else str(value).strip()
+
+
+def _number(value, default=0.0):
+    return default if _is_missing(value) or _text(value) == '' else float(value)
+
+
+def _flag(value):
+    if _is_missing(value):
+        return False
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    return _text(value).lower() in ('1', 'true', 'sim', 'yes', 's', 'y')
+
+
+def _date(value):
+    if _is_missing(value) or _text(value) == '':
+        raise ValueError('datas de início e fim são obrigatórias')
+    return pd.Timestamp(value).date()
+
+
+def _split(value):
+    return [item.strip() for item in _text(value).split(';') if item.strip()]
+
+
+def parse_profile(record):
+    """Converte uma linha do arquivo de perfis nos parâmetros da simulação"""
+    modalities = _split(record.get('modalities')) or list(MODALITIES)
+    unknown = set(modalities) - set(MODALITIES)
+    if unknown:
+        raise ValueError(f"modalidades desconhecidas: {', '.join(sorted(unknown))}")
+
+    start_date, end_date = _date(record.get('start_date')), _date(record.get('end_date'))
+    if (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month) <= 0:
+        raise ValueError('a data final deve estar em um mês posterior ao da data inicial')
+
+    goal = _number(record.get('financial_goal'), default=None)
+    return {
+        'params': {
+            'amount': {
+                'monthly': _number(record.get('monthly_investment')),
+                'quarterly': _number(record.get('quarterly_investment')),
+                'annually': _number(record.get('annual_investment'))
+            },
+            'frequency': 'monthly',
+            'start_date': start_date,
+            'end_date': end_date,
+            'include_taxes': _flag(record.get('include_taxes')),
+            'selected_assets': {'fii': _split(record.get('fii_assets')) or None,
+                                'stocks': _split(record.get('stock_assets')) or None},
+            'selected_treasury': _text(record.get('treasury')) or 'Tesouro Selic'
+        },
+        'modalities': modalities,
+        'include_ipca': _flag(record.get('include_ipca')),
+        'scenario': _text(record.get('scenario')) or 'neutro',
+        'financial_goal': goal
+    }
+
+
+def simulate_profile(simulator, record, include_histories=False):
+    """Simula um perfil e retorna (linhas do resumo, [(perfil, modalidade, real, histórico)])"""
+    profile_id = _text(record.get('profile_id'))
+    try:
+        profile = parse_profile(record)
+        params = profile['params']
+        batch = simulator.simulate_batch(
+            params, profile['modalities'], (False, True) if profile['include_ipca'] else (False,),
+            include_history=include_histories
+        )
+        scenario = profile['scenario']
+        goal = profile['financial_goal']
+        months = (params['end_date'].year - params['start_date'].year) * 12 + (params['end_date'].month - params['start_date'].month)
+        
+        # Objetivo pela mesma grade da interface: o plano do perfil (todas as frequências) dá o
+        # tempo até o objetivo e um plano unitário mensal dá o aporte mensal necessário no prazo
+        goal_grid = None
+        if goal is not None:
+            goal_grid = simulator.solve_goal_grid(
+                [goal], [months], [params['amount'], {'monthly': 1.0}], profile['modalities'], params['start_date'],
+                include_taxes=params['include_taxes'], selected_assets=params['selected_assets'],
+                selected_treasury=params['selected_treasury'], scenario=scenario
+            )
+    except Exception as e:
+        return [{'profile_id': profile_id, 'error': str(e)}], []
+
+    # Aporte mensal equivalente do plano (trimestrais e anuais distribuídos pelos meses do ano)
+    current_monthly = sum(
+        value * (12 if CONTRIBUTION_MONTHS[freq] is None else len(CONTRIBUTION_MONTHS[freq]))
+        for freq, value in params['amount'].items()
+    ) / 12
+    rows, histories = [], []
+    for modality, result in batch[False].items():
+        adjusted = simulator.simulate_economic_scenario(scenario, result)
+        real = batch[True][modality] if True in batch else None
+        row = {
+            'profile_id': profile_id,
+            'modality': modality,
+            'scenario': scenario,
+            'final_balance': adjusted['final_balance'],
+            'total_contributed': adjusted['total_contributed'],
+            'earnings': adjusted['earnings'],
+            'taxes': adjusted['taxes'],
+            'dividends': adjusted.get('dividends', 0.0),
+            'monthly_rate': adjusted['monthly_rate'],
+            'real_final_balance': simulator.simulate_economic_scenario(scenario, real)['final_balance'] if real else None
+        }
+        if goal_grid is not None:
+            index = goal_grid['modalities'].index(modality)
+            required_monthly = float(goal_grid['required_monthly'][index, 1, 0, 0])
+            row.update({
+                'financial_goal': goal,
+                'goal_reached': adjusted['final_balance'] >= goal,
+                'months_to_goal': float(goal_grid['time_to_goal'][index, 0, 0]),
+                'required_monthly': required_monthly,
+                'additional_monthly': max(0.0, required_monthly - current_monthly)
+            })
+        rows.append(row)
+
+        if include_histories:
+            for is_real, source in ((False, result), (True, real)):
+                if source is not None:
+                    histories.append((profile_id, modality, is_real, source['history']))
+    return rows, histories
+
+
+def history_frame(histories):
+    """Junta os históricos [(perfil, modalidade, real, DataFrame)] em um único DataFrame longo"""
+    if not histories:
+        return pd.DataFrame(columns=list(HISTORY_COLUMNS))
+    lengths = np.array([len(history) for _, _, _, history in histories])
+
+    def column(name):
+        return np.concatenate([
+            history[name].to_numpy(dtype=np.float64) if name in history else np.full(len(history), np.nan)
+            for _, _, _, history in histories
+        ])
+
+    return pd.DataFrame({
+        'profile_id': np.repeat([profile_id for profile_id, _, _, _ in histories], lengths),
+        'modality': np.repeat([modality for _, modality, _, _ in histories], lengths),
+        'real': np.repeat([is_real for _, _, is_real, _ in histories], lengths),
+        'date': np.concatenate([history['date'].to_numpy() for _, _, _, history in histories]).astype('datetime64[ns]'),
+        'balance': column('balance'),
+        'contribution': column('contribution'),
+        'dividends': column('dividends')
+    })
+
+
+def _simulate_task(task):
+    """Executa um grupo de perfis dentro de um processo do pool"""
+    records, include_histories = task
+    summary, histories = [], []
+    for record in records:
+        rows, history = simulate_profile(_simulator, record, include_histories)
+        summary.extend(rows)
+        histories.extend(history)
+    return summary, history_frame(histories) if include_histories else None
+
+
+def read_profiles(path, chunk_size):
+    """Lê o arquivo de perfis em blocos de até chunk_size linhas (listas de dicionários)"""
+    if path.lower().endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas().to_dict('records')
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunk_size, dtype={'profile_id': str}):
+            yield chunk.to_dict('records')
+
+
+class _ParquetOutput:
+    """Grava blocos de DataFrames em um único arquivo Parquet, conforme ficam prontos"""
+
+    def __init__(self, path, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self.schema = pa.schema([(name, pa.type_for_alias(alias)) for name, alias in columns.items()])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.rows = 0
+
+    def write(self, frame):
+        """Grava um DataFrame (as colunas ausentes ficam nulas)"""
+        if len(frame):
+            frame = frame.reindex(columns=self.schema.names)
+            self.writer.write_table(self._pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False))
+            self.rows += len(frame)
+
+    def close(self):
+        self.writer.close()
+
+
+def run_batch(input_path, output_path, histories_path=None, workers=None, chunk_size=5000,
+              snapshot_path=None, progress=None):
+    """Simula todos os perfis de input_path e grava os resultados
+
+    Retorna um dicionário com a quantidade de perfis, linhas gravadas, tempo e vazão.
+    """
+    workers = workers or default_workers()
+    include_histories = histories_path is not None
+    summary_output = _ParquetOutput(output_path, SUMMARY_COLUMNS)
+    history_output = _ParquetOutput(histories_path, HISTORY_COLUMNS) if include_histories else None
+
+    profiles = 0
+    started = time.perf_counter()
+
+    def write(results):
+        nonlocal profiles
+        for summary, histories in results:
+            summary_output.write(pd.DataFrame(summary))
+            if history_output is not None:
+                history_output.write(histories)
+        if progress:
+            elapsed = time.perf_counter() - started
+            progress(f"{profiles} perfis em {elapsed:.1f} s ({profiles / elapsed:,.0f} perfis/s)")
+
+    def tasks(records):
+        return [(records[start:start + TASK_SIZE], include_histories) for start in range(0, len(records), TASK_SIZE)]
+
+    pool = None
+    try:
+        if workers > 1:
+            # spawn: os processos não herdam threads nem estado do processo principal
+            pool = multiprocessing.get_context('spawn').Pool(workers, initializer=_init_worker, initargs=(snapshot_path,))
+        else:
+            _init_worker(snapshot_path)
+
+        # Mantém no máximo um bloco em processamento enquanto o anterior é gravado
+        pending = None
+        for records in read_profiles(input_path, chunk_size):
+            if pool is not None:
+                current = pool.map_async(_simulate_task, tasks(records))
+            else:
+                current = [_simulate_task(task) for task in tasks(records)]
+            if pending is not None:
+                write(pending.get() if pool is not None else pending)
+            profiles += len(records)
+            pending = current
+        if pending is not None:
+            write(pending.get() if pool is not None else pending)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        summary_output.close()
+        if history_output is not None:
+            history_output.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'profiles': profiles,
+        'summary_rows': summary_output.rows,
+        'history_rows': history_output.rows if history_output is not None else 0,
+        'seconds': elapsed,
+        'profiles_per_second': profiles / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulação em lote de perfis de clientes do SecureInvest')
+    parser.add_argument('input', help='arquivo de perfis (.csv ou .parquet)')
+    parser.add_argument('output', help='arquivo Parquet de saída com o resumo por perfil e modalidade')
+    parser.add_argument('--histories', metavar='PARQUET', help='grava também os históricos mês a mês')
+    parser.add_argument('--workers', type=int, default=None, help='processos (padrão: SECUREINVEST_WORKERS ou nº de CPUs)')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='perfis lidos por bloco (padrão: 5000)')
+    parser.add_argument('--snapshot', metavar='SISNAP', default=os.environ.get('SECUREINVEST_SNAPSHOT'),
+                        help='snapshot de dados de mercado (padrão: SECUREINVEST_SNAPSHOT)')
+    parser.add_argument('--quiet', action='store_true', help='não mostra o progresso')
+    args = parser.parse_args(argv)
+
+    def progress(message):
+        print(message, file=sys.stderr, flush=True)
+
+    stats = run_batch(
+        args.input, args.output, histories_path=args.histories, workers=args.workers,
+        chunk_size=args.chunk_size, snapshot_path=args.snapshot, progress=None if args.quiet else progress
+    )
+    print(
+        f"{stats['profiles']} perfis simulados em {stats['seconds']:.2f} s "
+        f"({stats['profiles_per_second']:,.0f} perfis/s); {stats['summary_rows']} linhas de resumo"
+        + (f", {stats['history_rows']} linhas de histórico" if args.histories else '')
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
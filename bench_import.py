@@ -0,0 +1,72 @@
+"""Benchmark do tempo de importação (cold start) dos módulos de cálculo do SecureInvest
+
+Cada medição roda em um processo Python novo, para que nenhum módulo já esteja em cache.
+
+Uso:
+    python bench_import.py [--repeat 7] [--budget-ms 800]
+
+Falha (código de saída 1) se o núcleo de cálculo carregar bibliotecas de interface ou de
+rede, ou se a mediana do tempo de importação do simulador ultrapassar o orçamento.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Módulos medidos (o primeiro é o que está sujeito ao orçamento)
+MODULES = ('simulator', 'snapshot', 'market_data', 'result_cache', 'parallel')
+
+# Bibliotecas que o núcleo de cálculo não pode importar
+HEAVY_MODULES = ('streamlit', 'plotly', 'yfinance', 'requests', 'openpyxl')
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module, repeat):
+    """Retorna (tempos em ms, bibliotecas pesadas carregadas) da importação de module"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    timings, heavy = [], set()
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=directory, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result['ms'])
+        heavy.update(result['heavy'])
+    return timings, sorted(heavy)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tempo de importação dos módulos de cálculo')
+    parser.add_argument('--repeat', type=int, default=7, help='processos por módulo (padrão: 7)')
+    parser.add_argument('--budget-ms', type=float, default=800.0,
+                        help='mediana máxima da importação do simulador, em ms (padrão: 800)')
+    args = parser.parse_args(argv)
+
+    failures = []
+    for position, module in enumerate(MODULES):
+        timings, heavy = measure(module, args.repeat)
+        median = statistics.median(timings)
+        print(f"{module:<14} mediana {median:8.1f} ms   mín {min(timings):8.1f} ms   máx {max(timings):8.1f} ms"
+              + (f"   carregou: {', '.join(heavy)}" if heavy else ''))
+        if heavy:
+            failures.append(f"{module} importa {', '.join(heavy)}")
+        if position == 0 and median > args.budget_ms:
+            failures.append(f"{module} levou {median:.1f} ms (orçamento: {args.budget_ms:.0f} ms)")
+
+    for failure in failures:
+        print(f"FALHA: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""Camada de séries dos gráficos de linha: arrays NumPy, redução por LTTB e traços WebGL
+
+Históricos de várias décadas (ou a simulação contínua) e as faixas do Monte Carlo geram
+milhares de pontos por série; enviar todos ao navegador a cada rerun deixa o gráfico pesado.
+As séries passam direto como arrays para o Plotly e, acima de MAX_POINTS, são reduzidas pelo
+LTTB (largest-triangle-three-buckets), que preserva a forma da curva; os extremos (picos e
+vales) de cada série são sempre mantidos. Séries que continuam longas usam Scattergl (WebGL).
+O Plotly só é importado quando um traço é montado.
+
+FigureFactory guarda as figuras montadas por (hash do resultado, tipo de gráfico, tema): cada
+figura é montada uma vez por resultado e a troca de tema só reestiliza uma cópia dela.
+"""
+import copy
+
+import numpy as np
+
+from result_cache import ResultCache
+
+# Pontos por série enviados ao navegador; acima disso a série é reduzida por LTTB
+MAX_POINTS = 2000
+
+# Séries com mais pontos que isso são desenhadas com Scattergl (WebGL) em vez de SVG
+WEBGL_THRESHOLD = 1000
+
+
+def _numeric(values):
+    """Valores do eixo como float64 (datas viram nanossegundos desde a época)"""
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    if values.dtype == object:
+        return _numeric(values.astype('datetime64[ns]'))
+    return values.astype(np.float64)
+
+
+def lttb_indices(x, y, max_points=MAX_POINTS):
+    """Índices dos pontos escolhidos pelo LTTB (sempre inclui o primeiro e o último)
+
+    Os pontos internos são divididos em max_points - 2 baldes; de cada balde fica o ponto que
+    forma o maior triângulo com o ponto escolhido no balde anterior e a média do seguinte.
+    """
+    count = len(y)
+    if max_points >= count or max_points < 3:
+        return np.arange(count)
+    x = _numeric(x)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = np.linspace(1, count - 1, max_points - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    sizes = ends - starts
+    # Média de cada balde e, depois do último, o ponto final da série
+    mean_x = np.append(np.add.reduceat(x[:count - 1], starts) / sizes, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:count - 1], starts) / sizes, y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, count - 1
+    previous = 0
+    for bucket, (start, end) in enumerate(zip(starts, ends)):
+        bucket_x, bucket_y = x[start:end], y[start:end]
+        area = np.abs((x[previous] - mean_x[bucket + 1]) * (bucket_y - y[previous])
+                      - (x[previous] - bucket_x) * (mean_y[bucket + 1] - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample_indices(x, series, max_points=MAX_POINTS):
+    """Índices comuns a várias séries do mesmo eixo x (união do LTTB de cada uma)
+
+    Inclui o mínimo e o máximo de cada série; com um único conjunto de índices as séries
+    continuam alinhadas (faixas preenchidas e hover unificado funcionam como antes).
+    """
+    count = len(x)
+    if count <= max_points:
+        return np.arange(count)
+    indices = [lttb_indices(x, y, max_points) for y in series]
+    indices += [np.array([np.nanargmin(y), np.nanargmax(y)]) for y in series if len(y)]
+    return np.unique(np.concatenate(indices))
+
+
+def line_traces(x, series, max_points=MAX_POINTS, webgl_threshold=WEBGL_THRESHOLD):
+    """Traços de linha para várias séries [(y, argumentos do traço)] com o mesmo eixo x
+
+    As séries são reduzidas em conjunto e usam Scattergl quando ficam com mais de
+    webgl_threshold pontos.
+    """
+    import plotly.graph_objects as go
+
+    x = np.asarray(x)
+    if x.dtype == object:
+        x = x.astype('datetime64[ns]')
+    series = [(np.asarray(y, dtype=np.float64), options) for y, options in series]
+    indices = downsample_indices(x, [y for y, _ in series], max_points)
+    if len(indices) < len(x):
+        x = x[indices]
+        series = [(y[indices], options) for y, options in series]
+
+    trace = go.Scattergl if len(x) > webgl_threshold else go.Scatter
+    return [trace(x=x, y=y, **options) for y, options in series]
+
+
+def line_trace(x, y, max_points=MAX_POINTS, webgl_threshold=WEBGL_THRESHOLD, **options):
+    """Traço de linha de uma série, reduzido e em WebGL quando necessário (ver line_traces)"""
+    return line_traces(x, [(y, options)], max_points, webgl_threshold)[0]
+
+
+# Atributos de cor trocados ao reestilizar os traços para outro tema
+_COLOR_PATHS = ('marker.color', 'marker.colors', 'line.color')
+
+
+def _swap_colors(value, colors):
+    """Troca uma cor (ou lista de cores) pelo equivalente do tema; outras cores ficam iguais"""
+    if isinstance(value, str):
+        return colors.get(value, value)
+    if isinstance(value, (list, tuple)) and all(isinstance(item, str) for item in value):
+        return [colors.get(item, item) for item in value]
+    return value
+
+
+class FigureFactory:
+    """Figuras dos resultados com cache limitado por (hash do resultado, tipo de gráfico, tema)
+
+    themes: {tema: {'layout': atributos do layout, 'colors': {cor do tema base: cor do tema}}}.
+    Cada tipo de gráfico é registrado com a função que monta a figura no tema base; as figuras
+    dos outros temas são cópias da figura base com o layout e as cores trocados, sem remontar
+    os traços a partir dos resultados. As figuras devolvidas são compartilhadas (entre reruns e
+    sessões) e não devem ser alteradas por quem as recebe.
+    """
+
+    def __init__(self, themes, base_theme='light', maxsize=64, ttl=3600):
+        self.themes = themes
+        self.base_theme = base_theme
+        self._kinds = {}
+        self._cache = ResultCache(maxsize=maxsize, ttl=ttl)
+
+    def register(self, kind, build, recolor=True, layouts=None):
+        """Declara um tipo de gráfico
+
+        build(*args) monta a figura no tema base (ou retorna None quando não há o que mostrar);
+        recolor=False mantém as cores dos traços em todos os temas; layouts ({tema: atributos})
+        complementa o layout de cada tema só para este tipo de gráfico.
+        """
+        self._kinds[kind] = (build, recolor, layouts or {})
+
+    def get(self, kind, key, theme, *args):
+        """Figura do tipo kind para o resultado identificado por key (args são passados a build)
+
+        key deve se repetir para as mesmas entradas (hash dos parâmetros, não de valores
+        sorteados a cada execução): uma chave nova a cada rerun remonta a figura e a cópia de
+        cada tema, e só ocupa o cache.
+        """
+        found, figure = self._cache.get((key, kind, theme))
+        if found:
+            return figure
+
+        build, recolor, layouts = self._kinds[kind]
+        if theme == self.base_theme:
+            figure = build(*args)
+            if figure is not None:
+                self._style(figure, theme, recolor, layouts)
+        else:
+            base = self.get(kind, key, self.base_theme, *args)
+            figure = None
+            if base is not None:
+                figure = copy.deepcopy(base)
+                self._style(figure, theme, recolor, layouts)
+        self._cache.set((key, kind, theme), figure)
+        return figure
+
+    def _style(self, figure, theme, recolor, layouts):
+        """Aplica o layout do tema e, se for o caso, troca as cores dos traços"""
+        style = self.themes[theme]
+        figure.update_layout(style.get('layout', {}))
+        figure.update_layout(layouts.get(theme, {}))
+        colors = style.get('colors') if recolor else None
+        if not colors:
+            return
+        for trace in figure.data:
+            for path in _COLOR_PATHS:
+                if path in trace and trace[path] is not None:
+                    trace[path] = _swap_colors(trace[path], colors)
+
+    def stats(self):
+        """Contadores do cache de figuras"""
+        return self._cache.stats()
@@ -0,0 +1,294 @@
+"""Grafo de dependências para recálculo incremental das simulações da interface
+
+Cada rerun do Streamlit informa as entradas atuais ao grafo; só os nós que dependem de uma
+entrada alterada são recalculados. O grafo das simulações segue a cadeia
+
+    cronograma → taxas → caminhos de saldo → saldos → impostos → cenário
+                                                    ↘ métricas de risco
+
+e a interface pendura os gráficos nos nós de resultado. Assim, ligar ou desligar os impostos
+só refaz calculate_taxes sobre os rendimentos já calculados, e estender a data final apenas
+acrescenta os novos aportes às somas acumuladas dos caminhos.
+"""
+import numpy as np
+import pandas as pd
+
+from result_cache import canonical_key
+
+
+def _same_value(old, new):
+    """Compara entradas sem falhar em tipos cuja igualdade não é um booleano"""
+    if old is new:
+        return True
+    try:
+        return bool(type(old) is type(new) and old == new)
+    except (TypeError, ValueError):
+        return False
+
+
+class ComputationGraph:
+    """Grafo de dependências com memoização por nó
+
+    Entradas são valores simples atualizados com set_inputs; nós são funções das entradas ou de
+    outros nós, avaliadas sob demanda por get. Um nó só é recalculado quando a versão de alguma
+    dependência mudou. Se o nó tiver uma função update(anterior, dependências_anteriores,
+    *dependências), ela é tentada antes do cálculo completo para aproveitar o valor anterior
+    (None indica que não é possível e o nó é recalculado do zero).
+    """
+
+    def __init__(self):
+        self._inputs = {}
+        self._nodes = {}
+        self._versions = {}
+        self._state = {}
+        self.recomputed = []
+
+    def add_input(self, name, value=None):
+        """Declara uma entrada do grafo"""
+        self._inputs[name] = value
+        self._versions[name] = 0
+
+    def add_node(self, name, function, dependencies, update=None):
+        """Declara um nó calculado a partir de entradas ou de outros nós"""
+        self._nodes[name] = (function, tuple(dependencies), update)
+        self._versions[name] = 0
+        self._state.pop(name, None)
+
+    def set_inputs(self, **values):
+        """Atualiza as entradas; só as que mudaram invalidam os nós dependentes"""
+        self.recomputed = []
+        for name, value in values.items():
+            if name not in self._inputs:
+                raise KeyError(f"Entrada desconhecida: {name}")
+            if not _same_value(self._inputs[name], value):
+                self._inputs[name] = value
+                self._versions[name] += 1
+
+    def get(self, name):
+        """Valor atual de uma entrada ou nó, recalculando só o que estiver desatualizado"""
+        if name in self._inputs:
+            return self._inputs[name]
+
+        function, dependencies, update = self._nodes[name]
+        values = [self.get(dependency) for dependency in dependencies]
+        versions = tuple(self._versions[dependency] for dependency in dependencies)
+
+        state = self._state.get(name)
+        if state is not None and state[0] == versions:
+            return state[2]
+
+        value = None
+        if state is not None and update is not None:
+            value = update(state[2], state[1], *values)
+        if value is None:
+            value = function(*values)
+
+        self._state[name] = (versions, values, value)
+        self._versions[name] += 1
+        self.recomputed.append(name)
+        return value
+
+
+def _months_between(start_date, end_date):
+    """Meses de calendário entre as datas (mesma regra das simulações)"""
+    return (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
+
+
+def _prefix_sums(steps, amounts, appreciation, start=None):
+    """Somas acumuladas dos aportes: valor, valor x passo e valor descontado (1+r)^-passo
+
+    Com start (somas anteriores), continua as somas a partir do último valor de cada uma.
+    """
+    discount = amounts * (1 + appreciation[..., np.newaxis]) ** -steps.astype(np.float64)
+    sums = {
+        'contributed': np.cumsum(amounts),
+        'weighted': np.cumsum(amounts * steps),
+        'discounted': np.cumsum(discount, axis=-1)
+    }
+    if start is not None:
+        for key, values in sums.items():
+            previous = start[key]
+            if previous.shape[-1]:
+                values += previous[..., -1:]
+            sums[key] = np.concatenate((previous, values), axis=-1)
+    return sums
+
+
+class SimulationGraph(ComputationGraph):
+    """Grafo das simulações nominais e reais de todas as modalidades escolhidas na interface
+
+    Entradas: amount, start_date, end_date, modalities, include_inflation (tupla, como em
+    simulate_batch), include_taxes, selected_assets, selected_treasury, scenario e
+    rates_version. O simulador pode ser trocado a cada rerun (atributo simulator) sem
+    invalidar os nós; mudanças nas tabelas de taxas chegam pela entrada rates_version.
+
+    Nós: months, schedule, rates, paths, balances, taxed, results (com o cenário econômico,
+    no formato de simulate_batch), risk_metrics (das modalidades nominais), history_table
+    (todos os históricos em colunas, para as exportações), results_key (hash das entradas,
+    para cachear o que é derivado dos resultados, como os relatórios) e history_key (hash só das
+    entradas de que os históricos dependem, para cachear os gráficos de evolução).
+    """
+
+    INPUTS = ('amount', 'start_date', 'end_date', 'modalities', 'include_inflation', 'include_taxes',
+              'selected_assets', 'selected_treasury', 'scenario', 'rates_version')
+
+    # Entradas que definem os históricos dos gráficos (impostos e cenário só mudam os valores finais)
+    HISTORY_INPUTS = ('amount', 'start_date', 'end_date', 'modalities', 'include_inflation',
+                      'selected_assets', 'selected_treasury', 'rates_version')
+
+    def __init__(self, simulator):
+        super().__init__()
+        self.simulator = simulator
+        for name in self.INPUTS:
+            self.add_input(name)
+
+        self.add_node('months', _months_between, ('start_date', 'end_date'))
+        self.add_node('schedule', self._schedule, ('amount', 'start_date', 'end_date'))
+        self.add_node('rates', self._rates,
+                      ('modalities', 'include_inflation', 'selected_assets', 'selected_treasury', 'rates_version'))
+        self.add_node('paths', self._paths, ('schedule', 'rates'), update=self._update_paths)
+        self.add_node('balances', self._balances, ('paths', 'schedule', 'rates', 'months'))
+        self.add_node('taxed', self._taxed, ('balances', 'rates', 'months', 'include_taxes'))
+        self.add_node('results', self._results, ('taxed', 'scenario'))
+        self.add_node('risk_metrics', self._risk_metrics, ('balances',))
+        self.add_node('history_table', self._history_table,
+                      ('balances', 'schedule', 'rates', 'months', 'include_taxes', 'scenario'))
+        self.add_node('results_key', lambda *inputs: canonical_key('results', *inputs), self.INPUTS)
+        self.add_node('history_key', lambda *inputs: canonical_key('history', *inputs), self.HISTORY_INPUTS)
+
+    def _schedule(self, amount, start_date, end_date):
+        return self.simulator._calculate_contributions(amount, 'monthly', start_date, end_date)
+
+    def _rates(self, modalities, include_inflation, selected_assets, selected_treasury, rates_version):
+        """Matriz de taxas: {inflação: {modalidade: taxas}}"""
+        selected_assets = selected_assets or {}
+        return {
+            inflation: {
+                modality: self.simulator._modality_rates(
+                    modality, inflation, selected_assets.get(modality), selected_treasury
+                )
+                for modality in modalities
+            }
+            for inflation in include_inflation
+        }
+
+    def _appreciation(self, rates):
+        return np.array([[rate['appreciation'] for rate in row.values()] for row in rates.values()],
+                        dtype=np.float64).reshape(len(rates), -1)
+
+    def _paths(self, schedule, rates):
+        """Somas acumuladas dos aportes para toda a matriz de taxas (independem da data final)"""
+        return _prefix_sums(schedule.elapsed_months, schedule.amounts, self._appreciation(rates))
+
+    def _update_paths(self, previous, previous_dependencies, schedule, rates):
+        """Estende (ou trunca) as somas quando o novo cronograma começa igual ao anterior"""
+        previous_schedule, previous_rates = previous_dependencies
+        if rates is not previous_rates:
+            return None
+
+        common = min(len(schedule), len(previous_schedule))
+        if not (np.array_equal(schedule.elapsed_months[:common], previous_schedule.elapsed_months[:common])
+                and np.array_equal(schedule.amounts[:common], previous_schedule.amounts[:common])):
+            return None
+
+        if len(schedule) <= len(previous_schedule):
+            return {key: values[..., :len(schedule)] for key, values in previous.items()}
+        return _prefix_sums(
+            schedule.elapsed_months[common:], schedule.amounts[common:], self._appreciation(rates), previous
+        )
+
+    def _balances(self, paths, schedule, rates, months):
+        """Históricos e totais antes de impostos, a partir das somas acumuladas"""
+        # Aportes sem tempo restante (passo >= meses) não rendem nem entram no saldo
+        growing = int(np.searchsorted(schedule.elapsed_months, months))
+        positions = np.minimum(np.arange(len(schedule)), growing - 1)
+        has_growth = growing > 0
+
+        contributed = paths['contributed'][positions] if has_growth else np.zeros(len(schedule))
+        weighted = paths['weighted'][positions] if has_growth else np.zeros(len(schedule))
+
+        balances = {}
+        for i, (inflation, row) in enumerate(rates.items()):
+            balances[inflation] = {}
+            for j, (modality, rate) in enumerate(row.items()):
+                if has_growth:
+                    balance = (1 + rate['appreciation']) ** months * paths['discounted'][i, j, positions]
+                    dividends = rate['dividends'] * (months * contributed - weighted)
+                else:
+                    balance = dividends = np.zeros(len(schedule))
+                balances[inflation][modality] = {
+                    'history': self.simulator._history_frame(rate, schedule, balance, dividends),
+                    'balance': float(balance[-1]) if len(balance) else 0,
+                    'dividends': float(dividends[-1]) if len(dividends) else 0,
+                    'total': schedule.total
+                }
+        return balances
+
+    def _taxed(self, balances, rates, months, include_taxes):
+        """Resultados com impostos sobre os rendimentos já calculados"""
+        return {
+            inflation: {
+                modality: self.simulator._result_from_totals(
+                    rates[inflation][modality], months, gross['total'], gross['balance'], gross['dividends'],
+                    include_taxes, gross['history']
+                )
+                for modality, gross in row.items()
+            }
+            for inflation, row in balances.items()
+        }
+
+    def _results(self, taxed, scenario):
+        return {
+            inflation: {
+                modality: self.simulator.simulate_economic_scenario(scenario, result)
+                for modality, result in row.items()
+            }
+            for inflation, row in taxed.items()
+        }
+
+    def _risk_metrics(self, balances):
+        """Métricas de risco dos históricos nominais (não dependem de impostos nem do cenário)"""
+        nominal = balances.get(False) or next(iter(balances.values()), {})
+        return {
+            modality: self.simulator.calculate_risk_metrics(gross['history'])
+            for modality, gross in nominal.items()
+        }
+
+    def _history_table(self, balances, schedule, rates, months, include_taxes, scenario):
+        """Históricos de todas as modalidades, nominais e reais, em um único DataFrame longo
+
+        Colunas: modality, real, date, contribution, total_contributed, balance (com dividendos),
+        dividends, taxes e net_balance. O imposto de cada linha aplica a alíquota do prazo total
+        ao rendimento acumulado até ali. Saldos, dividendos e impostos recebem o fator do cenário
+        econômico, como em simulate_economic_scenario: na última linha, net_balance e taxes
+        coincidem com o saldo final e os impostos do resultado.
+        """
+        scenarios = self.simulator.economic_scenarios
+        factor = scenarios[scenario]['fator'] if scenario in scenarios else 1.0
+        contributed = np.cumsum(schedule.amounts)
+        pieces = []
+        for inflation, row in balances.items():
+            for modality, gross in row.items():
+                history = gross['history']
+                balance = history['balance'].to_numpy(dtype=np.float64)
+                dividends = (history['dividends'].to_numpy(dtype=np.float64) if 'dividends' in history
+                             else np.zeros(len(history)))
+                tax_rate = (float(self.simulator._income_tax_rate(rates[inflation][modality]['tax_type'], months))
+                            if include_taxes else 0.0)
+                taxes = (balance - contributed) * tax_rate
+                pieces.append((modality, inflation, balance * factor, dividends * factor, taxes * factor))
+
+        count = len(pieces)
+        taxes = np.concatenate([piece[4] for piece in pieces]) if pieces else np.zeros(0)
+        balance = np.concatenate([piece[2] for piece in pieces]) if pieces else np.zeros(0)
+        return pd.DataFrame({
+            'modality': np.repeat([piece[0] for piece in pieces], len(schedule)).astype(object),
+            'real': np.repeat([piece[1] for piece in pieces], len(schedule)).astype(bool),
+            'date': np.tile(schedule.dates, count),
+            'contribution': np.tile(schedule.amounts, count),
+            'total_contributed': np.tile(contributed, count),
+            'balance': balance,
+            'dividends': np.concatenate([piece[3] for piece in pieces]) if pieces else np.zeros(0),
+            'taxes': taxes,
+            'net_balance': balance - taxes
+        })
@@ -0,0 +1,108 @@
+"""Planilha Excel das simulações com o histórico aporte a aporte, gravada em modo write-only
+
+O openpyxl em modo write-only grava cada linha no XML da aba assim que ela é adicionada, sem
+manter as células em memória; a memória usada não cresce com o tamanho dos históricos.
+O openpyxl só é importado quando uma planilha é gerada.
+"""
+import numpy as np
+
+# Colunas da aba de cada modalidade: (coluna da tabela de históricos, título, formato)
+HISTORY_SHEET_COLUMNS = (
+    ('date', 'Data', 'DD/MM/YYYY'),
+    ('contribution', 'Aporte', '"R$" #,##0.00'),
+    ('total_contributed', 'Total Aportado', '"R$" #,##0.00'),
+    ('balance', 'Saldo Bruto', '"R$" #,##0.00'),
+    ('dividends', 'Dividendos Acumulados', '"R$" #,##0.00'),
+    ('taxes', 'Impostos Estimados', '"R$" #,##0.00'),
+    ('net_balance', 'Saldo Líquido', '"R$" #,##0.00')
+)
+
+# Colunas da aba de resumo por modalidade: (chave do resultado, título)
+SUMMARY_COLUMNS = (
+    ('total_contributed', 'Total Aportado'),
+    ('final_balance', 'Saldo Final'),
+    ('earnings', 'Rendimento Líquido'),
+    ('taxes', 'Impostos'),
+    ('dividends', 'Dividendos')
+)
+
+# O Excel limita o nome das abas a 31 caracteres
+_SHEET_NAME_LIMIT = 31
+
+
+def _sheet_name(label, is_real):
+    return (f"{label} (real)" if is_real else label)[:_SHEET_NAME_LIMIT]
+
+
+def write_workbook(stream, summary, results, history_table, labels=None):
+    """Grava a planilha em stream (arquivo ou BytesIO)
+
+    summary: pares {rótulo: valor} da aba Resumo; results: {inflação: {modalidade: resultado}}
+    (como em simulate_batch); history_table: DataFrame longo com os históricos (colunas de
+    HISTORY_SHEET_COLUMNS mais modality e real), uma aba por modalidade e inflação.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    labels = labels or {}
+    workbook = Workbook(write_only=True)
+    bold = Font(bold=True)
+
+    def header(sheet, titles):
+        cells = []
+        for title in titles:
+            cell = WriteOnlyCell(sheet, value=title)
+            cell.font = bold
+            cells.append(cell)
+        sheet.append(cells)
+
+    def money(sheet, value):
+        cell = WriteOnlyCell(sheet, value=float(value))
+        cell.number_format = '"R$" #,##0.00'
+        return cell
+
+    # Resumo: parâmetros da simulação e uma linha por modalidade
+    sheet = workbook.create_sheet('Resumo')
+    sheet.column_dimensions['A'].width = 32
+    sheet.column_dimensions['B'].width = 45
+    header(sheet, ('Métrica', 'Valor'))
+    for key, value in summary.items():
+        sheet.append([str(key), value])
+    sheet.append([])
+    header(sheet, ['Modalidade', 'Valores'] + [title for _, title in SUMMARY_COLUMNS])
+    for inflation, row in results.items():
+        for modality, result in row.items():
+            sheet.append([labels.get(modality, modality), 'Reais (IPCA)' if inflation else 'Nominais']
+                         + [money(sheet, result.get(key, 0)) for key, _ in SUMMARY_COLUMNS])
+
+    # Uma aba por modalidade e inflação, linha a linha a partir das colunas
+    if len(history_table):
+        modalities = history_table['modality'].to_numpy()
+        real = history_table['real'].to_numpy()
+        boundaries = np.flatnonzero((modalities[1:] != modalities[:-1]) | (real[1:] != real[:-1])) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(history_table)]))
+        dates = history_table['date'].to_numpy().astype('datetime64[D]')
+        values = [history_table[name].to_numpy(dtype=np.float64) for name, _, _ in HISTORY_SHEET_COLUMNS[1:]]
+
+        for start, end in zip(starts, ends):
+            sheet = workbook.create_sheet(_sheet_name(labels.get(modalities[start], modalities[start]), bool(real[start])))
+            for letter in 'ABCDEFG':
+                sheet.column_dimensions[letter].width = 18
+            header(sheet, [title for _, title, _ in HISTORY_SHEET_COLUMNS])
+
+            # Uma célula formatada por coluna, reaproveitada em todas as linhas (cada linha é
+            # gravada no append, então só os valores mudam)
+            cells = []
+            for _, _, number_format in HISTORY_SHEET_COLUMNS:
+                cell = WriteOnlyCell(sheet)
+                cell.number_format = number_format
+                cells.append(cell)
+            for index in range(start, end):
+                cells[0].value = dates[index].astype(object)
+                for cell, column in zip(cells[1:], values):
+                    cell.value = float(column[index])
+                sheet.append(cells)
+
+    workbook.save(stream)
@@ -0,0 +1,58 @@
+"""Exportação colunar dos históricos das simulações (Parquet ou CSV em blocos)
+
+Todos os históricos (modalidades nominais e reais) vão para uma única tabela longa, montada
+direto dos arrays da tabela de históricos do grafo de simulação, sem passar por um dicionário
+por linha. O esquema é fixo e segue o dos históricos do batch.py (mais cenário, impostos e
+saldos acumulados), de modo que vários arquivos exportados podem ser lidos como um só
+conjunto de dados.
+"""
+import numpy as np
+import pandas as pd
+
+# Colunas e tipos (Arrow) do arquivo exportado, na ordem em que são gravadas
+EXPORT_COLUMNS = {
+    'modality': 'string',
+    'scenario': 'string',
+    'real': 'bool',
+    'date': 'timestamp[ns]',
+    'contribution': 'float64',
+    'total_contributed': 'float64',
+    'balance': 'float64',
+    'dividends': 'float64',
+    'taxes': 'float64',
+    'net_balance': 'float64'
+}
+
+# Linhas por bloco gravado no CSV (limita a memória do texto formatado)
+CSV_CHUNK_ROWS = 50_000
+
+
+def export_frame(history_table, scenario):
+    """Tabela de históricos com a coluna do cenário, nas colunas de EXPORT_COLUMNS
+
+    history_table é o nó de mesmo nome do grafo de simulação, calculado com este cenário (saldos,
+    dividendos e impostos já com o fator do cenário). As colunas são reaproveitadas sem cópia;
+    o cenário entra como uma coluna categórica de uma única categoria.
+    """
+    scenario_column = pd.Categorical.from_codes(np.zeros(len(history_table), dtype=np.int8), [scenario])
+    return history_table.assign(scenario=scenario_column)[list(EXPORT_COLUMNS)]
+
+
+def write_parquet(stream, frame, compression='zstd'):
+    """Grava a tabela exportada em Parquet (arquivo, caminho ou BytesIO); retorna o número de linhas"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.type_for_alias(alias)) for name, alias in EXPORT_COLUMNS.items()])
+    table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+    pq.write_table(table, stream, compression=compression)
+    return table.num_rows
+
+
+def write_csv(stream, frame, chunk_rows=CSV_CHUNK_ROWS):
+    """Grava a tabela exportada em CSV, em blocos de chunk_rows linhas; retorna o número de linhas"""
+    for start in range(0, max(len(frame), 1), chunk_rows):
+        frame.iloc[start:start + chunk_rows].to_csv(
+            stream, header=start == 0, index=False, date_format='%Y-%m-%d'
+        )
+    return len(frame)
@@ -0,0 +1,682 @@
+"""Camada de dados de mercado: cotações em tempo real, busca de ativos, cache persistente e históricos
+
+O yfinance só é importado na primeira consulta à rede, para que o núcleo de cálculo possa
+usar este módulo sem pagar o custo de importação da biblioteca.
+"""
+import asyncio
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Diretório do cache (pode ser alterado pela variável SECUREINVEST_CACHE_DIR)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'secureinvest')
+
+# Validade dos dados de um ativo antes de uma nova busca em segundo plano (24 horas)
+DEFAULT_ASSET_TTL = 24 * 3600
+
+# Janela mais longa de histórico usada nas métricas (baixada uma única vez por símbolo)
+HISTORY_PERIOD = '3y'
+
+# Fechamentos sem ajuste por proventos em todos os downloads de histórico: os dividendos entram
+# separados (dividend_yield) e, com fechamentos ajustados, seriam contados duas vezes no retorno.
+# Como os downloads em lote e individuais alimentam o mesmo PriceHistoryStore, todos precisam
+# usar a mesma configuração para que as métricas não dependam de qual deles baixou o símbolo.
+HISTORY_AUTO_ADJUST = False
+
+# Horizontes (em anos) dos retornos anualizados calculados a partir do histórico
+CAGR_HORIZONS = (1, 3)
+
+
+def _yf():
+    """Módulo yfinance (importado apenas na primeira utilização)"""
+    import yfinance
+    return yfinance
+
+
+def cache_dir():
+    """Diretório configurado para os caches em disco"""
+    return os.environ.get('SECUREINVEST_CACHE_DIR') or DEFAULT_CACHE_DIR
+
+
+def _json_default(value):
+    # Valores NumPy (float64, int64...) viram tipos nativos
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Tipo não suportado: {type(value).__name__}")
+
+
+class AssetCache:
+    """Cache persistente (SQLite) dos dados derivados de ativos pesquisados
+
+    Entradas dentro do TTL são servidas localmente; entradas vencidas também são servidas
+    na hora, enquanto uma atualização roda em segundo plano (stale-while-revalidate).
+    """
+
+    def __init__(self, directory=None, ttl=DEFAULT_ASSET_TTL):
+        self.directory = directory or cache_dir()
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, 'assets.sqlite3')
+
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS assets ("
+                " symbol TEXT NOT NULL,"
+                " asset_type TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (symbol, asset_type))"
+            )
+
+    def get(self, symbol, asset_type):
+        """Retorna (dados, ainda_válido) ou (None, False) se o ativo não estiver no cache"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data, updated_at FROM assets WHERE symbol = ? AND asset_type = ?",
+                (symbol, asset_type)
+            ).fetchone()
+        if row is None:
+            return None, False
+        return json.loads(row[0]), time.time() - row[1] < self.ttl
+
+    def put(self, symbol, asset_type, data):
+        """Grava (ou substitui) os dados de um ativo"""
+        payload = json.dumps(data, default=_json_default)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO assets (symbol, asset_type, data, updated_at) VALUES (?, ?, ?, ?)",
+                (symbol, asset_type, payload, time.time())
+            )
+
+    def get_or_fetch(self, symbol, asset_type, fetch):
+        """Retorna os dados do cache ou chama fetch() na ausência deles
+
+        fetch deve retornar o dicionário do ativo ou lançar uma exceção em caso de erro.
+        """
+        data, fresh = self.get(symbol, asset_type)
+        if data is None:
+            data = fetch()
+            self.put(symbol, asset_type, data)
+        elif not fresh:
+            self.refresh_in_background(symbol, asset_type, fetch)
+        return data
+
+    def refresh_in_background(self, symbol, asset_type, fetch):
+        """Atualiza um ativo em uma thread, sem duplicar atualizações em andamento"""
+        key = (symbol, asset_type)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.put(symbol, asset_type, fetch())
+            except Exception:
+                pass  # Mantém os dados antigos até a próxima tentativa
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f'asset-refresh-{symbol}', daemon=True).start()
+
+    def clear(self):
+        """Remove todos os ativos do cache"""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM assets")
+
+
+_default_asset_cache = None
+_default_asset_cache_lock = threading.Lock()
+
+
+def default_asset_cache():
+    """Instância única do cache de ativos por processo"""
+    global _default_asset_cache
+    with _default_asset_cache_lock:
+        if _default_asset_cache is None:
+            _default_asset_cache = AssetCache()
+        return _default_asset_cache
+
+
+def compact_history(history):
+    """Reduz o histórico do yfinance às colunas usadas (fechamento e dividendos em float32)"""
+    index = pd.DatetimeIndex(history.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    dividends = history['Dividends'] if 'Dividends' in history else np.zeros(len(history))
+    return pd.DataFrame({
+        'close': np.asarray(history['Close'], dtype=np.float32),
+        'dividends': np.nan_to_num(np.asarray(dividends, dtype=np.float32))
+    }, index=index.normalize())
+
+
+def history_metrics(frame):
+    """Calcula as métricas derivadas de um histórico compacto
+
+    Retorna preço atual, dividend yield dos últimos 12 meses, retornos anualizados
+    (cagr_1y, cagr_3y...) e volatilidade anualizada dos retornos diários.
+    """
+    close = frame['close'].to_numpy(dtype=np.float64)
+    if len(close) == 0:
+        return {'price': None, 'dividend_yield_ttm': None, 'volatility': None,
+                **{f"cagr_{years}y": None for years in CAGR_HORIZONS}}
+
+    last_date = frame.index[-1]
+    price = close[-1]
+
+    # Dividendos pagos nos últimos 12 meses sobre o preço atual
+    ttm = frame['dividends'].to_numpy()[frame.index > last_date - pd.DateOffset(years=1)].sum()
+    metrics = {
+        'price': float(price),
+        'dividend_yield_ttm': float(ttm / price) if price > 0 else None
+    }
+
+    # Retorno anualizado em cada horizonte coberto pelo histórico (com 10% de tolerância)
+    span_years = (last_date - frame.index[0]).days / 365.25
+    for years in CAGR_HORIZONS:
+        cagr = None
+        if span_years >= years * 0.9:
+            start = np.searchsorted(frame.index, last_date - pd.DateOffset(years=years))
+            elapsed = (last_date - frame.index[start]).days / 365.25
+            if elapsed > 0 and close[start] > 0:
+                cagr = float((price / close[start]) ** (1 / elapsed) - 1)
+        metrics[f"cagr_{years}y"] = cagr
+
+    log_returns = np.diff(np.log(close[close > 0]))
+    metrics['volatility'] = float(np.std(log_returns) * np.sqrt(252)) if len(log_returns) > 1 else None
+    return metrics
+
+
+def split_download(frame, symbols):
+    """Separa o resultado de um yf.download com vários símbolos em históricos compactos
+
+    Retorna {símbolo: histórico}; símbolos sem nenhum fechamento no período ficam de fora.
+    """
+    histories = {}
+    for symbol in symbols:
+        if isinstance(frame.columns, pd.MultiIndex):
+            if symbol not in frame.columns.get_level_values(0):
+                continue
+            history = frame[symbol]
+        else:
+            history = frame
+        history = history.dropna(subset=['Close'])
+        if len(history):
+            histories[symbol] = compact_history(history)
+    return histories
+
+
+def asset_info_from_metrics(ticker, info, metrics):
+    """Monta os dados de um ativo a partir dos metadados (info) e das métricas do histórico"""
+    # Dividend yield dos últimos 12 meses
+    if metrics['dividend_yield_ttm'] is not None:
+        dividend_yield = metrics['dividend_yield_ttm']
+    else:
+        dividend_yield = 0.05
+    
+    # Retorno anual médio baseado no histórico (últimos 3 anos, ou o maior horizonte disponível)
+    annual_return = next(
+        (metrics[f"cagr_{years}y"] for years in sorted(CAGR_HORIZONS, reverse=True) if metrics[f"cagr_{years}y"] is not None),
+        0.12  # Valor padrão se não houver histórico suficiente
+    )
+    
+    return {
+        'nome': info.get('longName', ticker),
+        'dividend_yield': max(0.01, min(dividend_yield, 0.2)),  # Limita entre 1% e 20%
+        'annual_return': max(0.05, min(annual_return, 0.3)),   # Limita entre 5% e 30%
+        'volatility': metrics['volatility'],
+        'returns': {f"{years}y": metrics[f"cagr_{years}y"] for years in CAGR_HORIZONS},
+        'setor': info.get('sector', 'Não especificado'),
+        'segmento': info.get('industry', 'Não especificado'),
+        'preco_atual': info.get('currentPrice', info.get('regularMarketPrice', metrics['price'] or 0)),
+        'success': True
+    }
+
+
+def asset_table_entry(asset_type, asset_info):
+    """Converte os dados de um ativo buscado no formato das tabelas do simulador"""
+    if asset_type == 'fii':
+        entry = {
+            'dividend_yield': asset_info['dividend_yield'],
+            'annual_return': asset_info['annual_return'],
+            'nome': asset_info['nome'],
+            'segmento': asset_info['segmento']
+        }
+    elif asset_type == 'stocks':
+        entry = {
+            'dividend_yield': asset_info['dividend_yield'],
+            'annual_return': asset_info['annual_return'],
+            'nome': asset_info['nome'],
+            'setor': asset_info['setor']
+        }
+    elif asset_type == 'treasury':
+        return {
+            'annual_return': asset_info['annual_return'],
+            'ipca_linked': asset_info.get('ipca_linked', True),  # Assume que é indexado ao IPCA
+            'nome': asset_info['nome']
+        }
+    else:
+        raise ValueError(f"Tipo de ativo desconhecido: {asset_type}")
+    
+    # Volatilidade histórica calibra a simulação Monte Carlo
+    if asset_info.get('volatility') is not None:
+        entry['volatility'] = asset_info['volatility']
+    return entry
+
+
+class PriceHistoryStore:
+    """Históricos compactos por símbolo em memória (LRU), baixados uma única vez"""
+
+    def __init__(self, maxsize=256, ttl=DEFAULT_ASSET_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, symbol, download):
+        """Retorna o histórico do símbolo, chamando download() apenas se não houver um válido"""
+        with self._lock:
+            entry = self._frames.get(symbol)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._frames.move_to_end(symbol)
+                return entry[1]
+
+        frame = compact_history(download())
+        self.put(symbol, frame)
+        return frame
+
+    def put(self, symbol, frame):
+        """Armazena um histórico já compactado"""
+        with self._lock:
+            self._frames[symbol] = (time.monotonic(), frame)
+            self._frames.move_to_end(symbol)
+            while len(self._frames) > self.maxsize:
+                self._frames.popitem(last=False)
+
+
+_default_history_store = None
+
+
+def default_history_store():
+    """Instância única do armazenamento de históricos por processo"""
+    global _default_history_store
+    with _default_asset_cache_lock:
+        if _default_history_store is None:
+            _default_history_store = PriceHistoryStore()
+        return _default_history_store
+
+
+# Leitura imutável das cotações: versão incremental, horário da atualização e dados
+TickerSnapshot = namedtuple('TickerSnapshot', ['version', 'timestamp', 'data'])
+
+
+class SnapshotStore:
+    """Guarda apenas a versão mais recente dos dados, sem fila nem histórico
+    
+    Leitores obtêm o snapshot atual em O(1) sem consumi-lo; quem ficou para trás
+    simplesmente passa a ver a versão mais nova.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = TickerSnapshot(0, None, None)
+    
+    def publish(self, data):
+        """Substitui o snapshot atual por uma nova versão"""
+        with self._lock:
+            self._snapshot = TickerSnapshot(self._snapshot.version + 1, time.time(), data)
+            return self._snapshot
+    
+    def latest(self):
+        """Snapshot mais recente (a troca da referência é atômica)"""
+        return self._snapshot
+    
+    def is_newer(self, version):
+        """Indica se existe uma versão mais nova que a informada"""
+        return self._snapshot.version > version
+
+
+# Provedores de cotações (interface plugável usada pelo QuoteFetcher)
+class QuoteProvider:
+    """Interface dos provedores de cotações"""
+    async def fetch_bars(self, symbol, since=None):
+        """Retorna barras diárias (DataFrame indexado por data com a coluna Close) a partir de since
+        
+        Sem since, retorna as barras mais recentes suficientes para obter o fechamento anterior.
+        """
+        raise NotImplementedError
+
+
+class YFinanceProvider(QuoteProvider):
+    """Provedor baseado no Yahoo Finance (chamadas bloqueantes executadas em threads)"""
+    async def fetch_bars(self, symbol, since=None):
+        return await asyncio.to_thread(self._download, symbol, since)
+    
+    def _download(self, symbol, since):
+        ticker = _yf().Ticker(symbol)
+        if since is None:
+            history = ticker.history(period="5d", interval="1d")
+        else:
+            # Apenas as barras a partir da última já conhecida (a do dia é atualizada)
+            history = ticker.history(start=since, interval="1d")
+        return history[['Close']]
+
+
+class FakeQuoteProvider(QuoteProvider):
+    """Provedor local determinístico, para testes e uso sem rede"""
+    def __init__(self, base_prices=None, failing_symbols=()):
+        self.base_prices = base_prices or {}
+        self.failing_symbols = set(failing_symbols)
+        self.calls = []
+    
+    async def fetch_bars(self, symbol, since=None):
+        self.calls.append((symbol, since))
+        if symbol in self.failing_symbols:
+            raise ConnectionError(f"Falha simulada para {symbol}")
+        
+        end = pd.Timestamp(datetime.date.today())
+        start = pd.Timestamp(since).normalize() if since is not None else end - pd.Timedelta(days=4)
+        dates = pd.date_range(start, end, freq='D')
+        base = self.base_prices.get(symbol, 100.0)
+        phase = sum(ord(char) for char in symbol) % 7
+        # Oscilação suave e reprodutível em torno do preço base
+        closes = base * (1 + 0.02 * np.sin(dates.dayofyear.to_numpy() / 3 + phase))
+        return pd.DataFrame({'Close': closes}, index=dates)
+
+
+class QuoteFetcher:
+    """Atualiza cotações de forma assíncrona e incremental, símbolo a símbolo
+    
+    Os símbolos são consultados em paralelo (no máximo max_concurrency por vez), cada consulta
+    pede apenas as barras a partir da última já recebida e símbolos com falha aguardam um
+    intervalo crescente (backoff exponencial) antes de uma nova tentativa.
+    """
+    def __init__(self, provider, max_concurrency=8, max_bars=5, base_backoff=60, max_backoff=3600):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.max_bars = max_bars
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._bars = {}  # símbolo -> últimas barras recebidas
+        self._failures = {}  # símbolo -> (falhas consecutivas, próxima tentativa)
+    
+    async def refresh(self, symbols):
+        """Atualiza os símbolos e retorna {símbolo: cotação} dos que têm dados"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        now = time.monotonic()
+        due = [symbol for symbol in symbols if self._failures.get(symbol, (0, 0))[1] <= now]
+        await asyncio.gather(*(self._refresh_symbol(symbol, semaphore) for symbol in due))
+        
+        quotes = {}
+        for symbol in symbols:
+            quote = self.quote(symbol)
+            if quote is not None:
+                quotes[symbol] = quote
+        return quotes
+    
+    async def _refresh_symbol(self, symbol, semaphore):
+        async with semaphore:
+            bars = self._bars.get(symbol)
+            since = bars.index[-1] if bars is not None and len(bars) else None
+            try:
+                new_bars = await self.provider.fetch_bars(symbol, since)
+                if (new_bars is None or new_bars.empty) and since is None:
+                    raise ValueError(f"Sem dados para {symbol}")
+            except Exception:
+                failures = self._failures.get(symbol, (0, 0))[0] + 1
+                delay = min(self.base_backoff * 2 ** (failures - 1), self.max_backoff)
+                self._failures[symbol] = (failures, time.monotonic() + delay)
+                return
+            
+            self._failures.pop(symbol, None)
+            if new_bars is None or new_bars.empty:
+                return
+            if bars is not None:
+                # Barras novas substituem as existentes a partir da primeira data recebida
+                new_bars = pd.concat([bars[bars.index < new_bars.index[0]], new_bars])
+            self._bars[symbol] = new_bars.iloc[-self.max_bars:]
+    
+    def quote(self, symbol):
+        """Último preço e variação em relação ao fechamento anterior"""
+        bars = self._bars.get(symbol)
+        if bars is None or bars.empty:
+            return None
+        
+        last_price = float(bars['Close'].iloc[-1])
+        prev_close = float(bars['Close'].iloc[-2]) if len(bars) > 1 else last_price
+        change = last_price - prev_close
+        return {
+            'price': last_price,
+            'change': change,
+            'change_percent': (change / prev_close) * 100 if prev_close != 0 else 0
+        }
+
+
+class RealTimeTicker:
+    """Serviço de cotações compartilhado por todas as sessões do processo
+    
+    Uma única thread busca os dados e guarda a última leitura; as sessões se registram com
+    subscribe() a cada rerun e a thread para sozinha quando nenhuma sessão renova o registro
+    dentro de lease_seconds.
+    """
+    def __init__(self, provider=None, interval=60, lease_seconds=600):
+        self.fetcher = QuoteFetcher(provider or YFinanceProvider())
+        self.interval = interval  # Atualiza a cada 60 segundos
+        self.lease_seconds = lease_seconds
+        self.running = False
+        self.thread = None
+        
+        self.ticker_data = SnapshotStore()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._subscribers = {}  # id da sessão -> último acesso
+        
+        self.assets = {
+            '^BVSP': 'IBOV', '^GSPC': 'S&P 500', '^DJI': 'DOW JONES', '^IXIC': 'NASDAQ',
+            'BRL=X': 'USD/BRL', 'EURBRL=X': 'EUR/BRL', 
+            'BTC-USD': 'BTC', 'ETH-USD': 'ETH',
+            'PETR4.SA': 'PETR4', 'VALE3.SA': 'VALE3', 'ITUB4.SA': 'ITUB4', 'BBDC4.SA': 'BBDC4',
+            'B3SA3.SA': 'B3SA3', 'WEGE3.SA': 'WEGE3', 'ABEV3.SA': 'ABEV3'
+        }
+    
+    def fetch_real_time_data(self):
+        """Busca dados em tempo real"""
+        try:
+            quotes = asyncio.run(self.fetcher.refresh(list(self.assets.keys())))
+        except Exception:
+            return None
+        
+        return {
+            ticker: {'symbol': self.assets[ticker], **quote}
+            for ticker, quote in quotes.items()
+        }
+    
+    def subscribe(self, session_id):
+        """Registra (ou renova) uma sessão e garante que a thread esteja rodando"""
+        with self._lock:
+            self._subscribers[session_id] = time.monotonic()
+            if not self.running:
+                self._start_locked()
+    
+    def unsubscribe(self, session_id):
+        """Remove uma sessão; a thread para quando não houver mais sessões"""
+        with self._lock:
+            self._subscribers.pop(session_id, None)
+    
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+    
+    def start(self):
+        """Inicia a thread de atualização"""
+        with self._lock:
+            if not self.running:
+                self._start_locked()
+    
+    def _start_locked(self):
+        # Cada thread tem seu próprio evento de parada, para não ser reativada por um novo start
+        self._stop_event = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self._update_loop, args=(self._stop_event,),
+                                       name='secureinvest-ticker', daemon=True)
+        self.thread.start()
+    
+    def stop(self, timeout=5):
+        """Encerra a thread de atualização"""
+        with self._lock:
+            self.running = False
+            self._stop_event.set()
+            thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+    
+    def _has_subscribers(self):
+        """Descarta sessões inativas e indica se a thread deve continuar"""
+        with self._lock:
+            now = time.monotonic()
+            self._subscribers = {
+                session_id: last_seen for session_id, last_seen in self._subscribers.items()
+                if now - last_seen < self.lease_seconds
+            }
+            if not self._subscribers:
+                self.running = False
+            return bool(self._subscribers)
+    
+    def _update_loop(self, stop_event):
+        """Loop de atualização contínua"""
+        while not stop_event.is_set() and self._has_subscribers():
+            try:
+                data = self.fetch_real_time_data()
+                if data:
+                    self.ticker_data.publish(data)
+            except Exception:
+                pass
+            stop_event.wait(self.interval)
+    
+    def get_snapshot(self):
+        """Snapshot mais recente (versão, horário e dados)"""
+        return self.ticker_data.latest()
+    
+    def get_latest_data(self):
+        """Obtém os dados mais recentes (sem consumi-los)"""
+        return self.ticker_data.latest().data
+
+
+# Máximo de buscas de metadados simultâneas na busca em lote
+ASSET_LOOKUP_WORKERS = 8
+
+
+class AssetLookupError(Exception):
+    """Falha ao buscar os dados de um ativo"""
+
+
+# Funções para buscar dados de ativos
+def search_asset(ticker, asset_type, asset_cache=None, strict=False):
+    """Busca informações do ativo usando Yahoo Finance (com cache persistente em disco)
+    
+    Em caso de erro retorna valores padrão com success False e a mensagem em 'error',
+    ou lança AssetLookupError se strict for verdadeiro.
+    """
+    asset_cache = asset_cache or default_asset_cache()
+    try:
+        return asset_cache.get_or_fetch(ticker, asset_type, lambda: _fetch_asset_info(ticker, asset_type))
+    except Exception as e:
+        if strict:
+            raise AssetLookupError(f"Erro ao buscar informações para {ticker}: {e}") from e
+        return {**_fallback_asset_info(ticker, asset_type), 'error': str(e)}
+
+
+def search_assets(tickers, asset_type, asset_cache=None, max_workers=ASSET_LOOKUP_WORKERS):
+    """Busca vários ativos de uma vez
+    
+    Os históricos de todos os símbolos fora do cache (ou vencidos) vêm de um único
+    yf.download; os metadados são buscados em paralelo por um pool limitado de threads.
+    Retorna {ticker: dados do ativo}; falhas vêm com success False e a mensagem em 'error'.
+    """
+    asset_cache = asset_cache or default_asset_cache()
+    tickers = list(dict.fromkeys(tickers))
+    
+    # Um único download para todos os ativos que precisarão ser buscados
+    pending = [ticker for ticker in tickers if not asset_cache.get(ticker, asset_type)[1]]
+    if pending:
+        _prefetch_histories([_asset_symbol(ticker, asset_type) for ticker in pending])
+    
+    def lookup(ticker):
+        try:
+            return asset_cache.get_or_fetch(ticker, asset_type, lambda: _fetch_asset_info(ticker, asset_type))
+        except Exception as e:
+            return {**_fallback_asset_info(ticker, asset_type), 'error': str(e)}
+    
+    if not tickers:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tickers)))) as pool:
+        return dict(zip(tickers, pool.map(lookup, tickers)))
+
+
+def _prefetch_histories(symbols):
+    """Baixa os históricos de vários símbolos em uma única requisição e guarda no armazenamento"""
+    store = default_history_store()
+    try:
+        frame = _yf().download(
+            symbols, period=HISTORY_PERIOD, actions=True, group_by='ticker',
+            auto_adjust=HISTORY_AUTO_ADJUST, progress=False, threads=True
+        )
+    except Exception:
+        return  # Cada ativo faz o próprio download em _fetch_asset_info
+    for symbol, history in split_download(frame, symbols).items():
+        store.put(symbol, history)
+
+
+def _fallback_asset_info(ticker, asset_type):
+    """Valores padrão usados quando a busca de um ativo falha"""
+    return {
+        'nome': ticker,
+        'dividend_yield': 0.065 if asset_type == 'stocks' else 0.075,
+        'annual_return': 0.12 if asset_type == 'stocks' else 0.10,
+        'setor': 'Não especificado',
+        'segmento': 'Não especificado',
+        'preco_atual': 0,
+        'success': False
+    }
+
+
+def _asset_symbol(ticker, asset_type):
+    """Símbolo do ativo no Yahoo Finance"""
+    # Adiciona sufixo .SA para ativos brasileiros
+    if asset_type == 'fii':
+        return f"{ticker}.SA"
+    elif asset_type == 'stocks':
+        return f"{ticker}.SA"
+    elif asset_type == 'treasury':
+        return f"{ticker}.SA"
+    else:
+        return f"{ticker}.SA"
+
+
+def _fetch_asset_info(ticker, asset_type):
+    """Busca os dados do ativo no Yahoo Finance (lança exceção em caso de erro)"""
+    ticker_symbol = _asset_symbol(ticker, asset_type)
+    
+    # Busca informações do ativo
+    asset = _yf().Ticker(ticker_symbol)
+    info = asset.info
+    
+    # Um único download da janela mais longa (fechamentos e dividendos) alimenta todas as métricas
+    history = default_history_store().get(
+        ticker_symbol, lambda: asset.history(period=HISTORY_PERIOD, auto_adjust=HISTORY_AUTO_ADJUST)
+    )
+    if history.empty:
+        raise AssetLookupError(f"Nenhum histórico de preços encontrado para {ticker_symbol}")
+    return asset_info_from_metrics(ticker, info, history_metrics(history))
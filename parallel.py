@@ -0,0 +1,139 @@
+"""Execução paralela das simulações pesadas (Monte Carlo e varreduras de cenários)
+
+Os lotes de itens (caminhos ou pontos de uma grade de cenários) são distribuídos entre
+processos de um ProcessPoolExecutor. Cada lote recebe uma semente derivada de forma
+determinística da semente principal, e os resultados voltam por um buffer NumPy em
+memória compartilhada em vez de listas serializadas.
+"""
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Quantidade de itens por lote (fixa, para que o resultado não dependa do número de processos)
+DEFAULT_SHARD_SIZE = 10000
+
+
+def default_workers():
+    """Número de processos padrão (variável SECUREINVEST_WORKERS ou número de CPUs)"""
+    try:
+        return max(1, int(os.environ.get('SECUREINVEST_WORKERS', '')))
+    except ValueError:
+        return os.cpu_count() or 1
+
+
+def monte_carlo_block(rng, balances, contributions, drift, volatility):
+    """Avança os caminhos por um bloco de meses e retorna os saldos (meses × caminhos)
+
+    balances é atualizado no próprio array com o saldo ao final do bloco.
+    """
+    paths = rng.standard_normal((len(contributions), len(balances)), dtype=np.float32)
+    paths *= volatility
+    paths += drift
+    np.exp(paths, out=paths)
+    for month, contribution in enumerate(contributions):
+        balances += contribution
+        balances *= paths[month]
+        paths[month] = balances
+    return paths
+
+
+def monte_carlo_kernel(out, path_slice, rng, contributions, band_months, drift, volatility, chunk_months):
+    """Simula um lote de caminhos e grava os saldos dos meses de band_months em out[:, path_slice]"""
+    balances = np.zeros(path_slice.stop - path_slice.start, dtype=np.float32)
+    for block_start in range(0, len(contributions), chunk_months):
+        block_end = min(block_start + chunk_months, len(contributions))
+        block = monte_carlo_block(rng, balances, contributions[block_start:block_end], drift, volatility)
+        selected = (band_months >= block_start) & (band_months < block_end)
+        out[selected, path_slice] = block[band_months[selected] - block_start]
+
+
+def _attach_shared_memory(name):
+    """Abre um bloco de memória compartilhada criado pelo processo principal"""
+    if sys.version_info >= (3, 13):
+        # Quem cria o bloco é responsável por removê-lo
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _run_shard(kernel, shm_name, shape, dtype, item_slice, seed_sequence, args):
+    """Executa um lote dentro do processo filho, escrevendo direto no buffer compartilhado"""
+    shm = _attach_shared_memory(shm_name)
+    try:
+        out = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        try:
+            kernel(out, item_slice, np.random.default_rng(seed_sequence), *args)
+        finally:
+            # A visão precisa ser liberada antes de fechar o bloco
+            del out
+    finally:
+        shm.close()
+
+
+class SimulationExecutor:
+    """Distribui lotes de simulação entre processos com sementes determinísticas por lote"""
+
+    def __init__(self, max_workers=None, shard_size=DEFAULT_SHARD_SIZE):
+        self.max_workers = max_workers or default_workers()
+        self.shard_size = shard_size
+        self._pool = None
+
+    def _get_pool(self):
+        """Cria o pool de processos na primeira utilização e o reaproveita depois"""
+        if self._pool is None:
+            # spawn evita herdar threads (servidor do Streamlit, ticker) em um fork
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+
+    def shards(self, n_items):
+        """Divide n_items em fatias de até shard_size itens"""
+        return [slice(start, min(start + self.shard_size, n_items)) for start in range(0, n_items, self.shard_size)]
+
+    def run_sharded(self, kernel, n_items, shape, args=(), seed=None, dtype=np.float32):
+        """Executa kernel(out, fatia, rng, *args) para cada lote e devolve o array out preenchido
+
+        A última dimensão de shape deve ter n_items posições. kernel precisa ser uma função
+        de módulo (importável pelos processos filhos).
+        """
+        dtype = np.dtype(dtype)
+        item_slices = self.shards(n_items)
+        seeds = np.random.SeedSequence(seed).spawn(len(item_slices))
+
+        if self.max_workers <= 1 or len(item_slices) <= 1:
+            out = np.empty(shape, dtype=dtype)
+            for item_slice, seed_sequence in zip(item_slices, seeds):
+                kernel(out, item_slice, np.random.default_rng(seed_sequence), *args)
+            return out
+
+        nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        try:
+            pool = self._get_pool()
+            futures = [
+                pool.submit(_run_shard, kernel, shm.name, shape, dtype.str, item_slice, seed_sequence, args)
+                for item_slice, seed_sequence in zip(item_slices, seeds)
+            ]
+            for future in futures:
+                future.result()
+            return np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        """Encerra os processos do pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
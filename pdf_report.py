@@ -0,0 +1,391 @@
+"""Relatório PDF das simulações, gravado de forma incremental (sem dependências extras)
+
+O arquivo é escrito em sequência em qualquer stream binário (arquivo ou BytesIO): cada página
+é montada, comprimida e gravada antes de a próxima começar, e as tabelas de histórico são
+percorridas linha a linha a partir dos arrays. A memória usada não cresce com o tamanho dos
+históricos, apenas a tabela de posições dos objetos (xref) exigida pelo formato.
+
+O relatório tem uma tabela-resumo, o gráfico de evolução de todas as modalidades e uma seção
+por modalidade (métricas, gráfico e histórico aporte a aporte). Os gráficos são vetoriais,
+desenhados direto dos arrays com no máximo CHART_POINTS pontos por série.
+"""
+import math
+import zlib
+
+import numpy as np
+
+# Página A4 em pontos
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+MARGIN = 50
+
+# Pontos máximos por série nos gráficos
+CHART_POINTS = 400
+
+# Cores das séries ('#RRGGBB'), na ordem das modalidades
+DEFAULT_COLORS = ('#1E3A8A', '#3B82F6', '#10B981', '#EF4444', '#8B5CF6')
+
+# Larguras da Helvetica (milésimos de em) para os caracteres ASCII 32-126; demais usam 556
+_HELVETICA_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584
+)
+
+
+def text_width(text, size):
+    """Largura aproximada de um texto em Helvetica, em pontos"""
+    return sum(_HELVETICA_WIDTHS[ord(char) - 32] if 32 <= ord(char) <= 126 else 556 for char in text) * size / 1000
+
+
+def _pdf_string(text):
+    """Texto como string literal do PDF (WinAnsiEncoding)"""
+    data = str(text).encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _rgb(color):
+    """'#RRGGBB' -> componentes 0-1 para os operadores de cor do PDF"""
+    color = color.lstrip('#')
+    return tuple(int(color[i:i + 2], 16) / 255 for i in (0, 2, 4))
+
+
+def _nice_ticks(low, high, count=5):
+    """Marcas 'redondas' (1, 2 ou 5 x 10^n) cobrindo o intervalo"""
+    if high <= low:
+        high = low + 1
+    raw_step = (high - low) / count
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(factor * magnitude for factor in (1, 2, 5, 10) if factor * magnitude >= raw_step)
+    first = math.floor(low / step) * step
+    return [first + i * step for i in range(int(math.ceil((high - first) / step)) + 1)]
+
+
+def _sample_indices(length, points=CHART_POINTS):
+    """Índices espaçados uniformemente (sempre com o primeiro e o último)"""
+    if length <= points:
+        return np.arange(length)
+    return np.unique(np.linspace(0, length - 1, points).round().astype(np.int64))
+
+
+def _format_money(value):
+    return f"R$ {value:,.2f}"
+
+
+class PDFWriter:
+    """Escritor PDF 1.4 mínimo: objetos gravados em sequência e tabela xref no final"""
+
+    def __init__(self, stream, title=''):
+        self.stream = stream
+        self.position = 0
+        self.offsets = {}
+        self.page_ids = []
+        self._next_id = 1
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+        self.catalog_id = self._reserve()
+        self.pages_id = self._reserve()
+        self.fonts = {}
+        for name, base_font in (('F1', 'Helvetica'), ('F2', 'Helvetica-Bold')):
+            self.fonts[name] = self._reserve()
+            self._object(self.fonts[name], (
+                f'<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} /Encoding /WinAnsiEncoding >>'
+            ).encode('ascii'))
+        self.info_id = self._reserve()
+        self._object(self.info_id, b'<< /Title ' + _pdf_string(title) + b' /Producer (SecureInvest) >>')
+
+    def _reserve(self):
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.position += len(data)
+
+    def _object(self, object_id, body):
+        self.offsets[object_id] = self.position
+        self._write(f'{object_id} 0 obj\n'.encode('ascii') + body + b'\nendobj\n')
+
+    def add_page(self, content):
+        """Comprime e grava o conteúdo de uma página"""
+        data = zlib.compress(content)
+        content_id = self._reserve()
+        self._object(content_id, (
+            f'<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n'
+        ).encode('ascii') + data + b'\nendstream')
+
+        page_id = self._reserve()
+        fonts = ' '.join(f'/{name} {object_id} 0 R' for name, object_id in self.fonts.items())
+        self._object(page_id, (
+            f'<< /Type /Page /Parent {self.pages_id} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << {fonts} >> >> /Contents {content_id} 0 R >>'
+        ).encode('ascii'))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        """Grava a árvore de páginas, o catálogo e a tabela xref"""
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        self._object(self.pages_id, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>'.encode('ascii'))
+        self._object(self.catalog_id, f'<< /Type /Catalog /Pages {self.pages_id} 0 R >>'.encode('ascii'))
+
+        xref_position = self.position
+        lines = [f'xref\n0 {self._next_id}\n', '0000000000 65535 f \n']
+        lines.extend(f'{self.offsets[object_id]:010d} 00000 n \n' for object_id in range(1, self._next_id))
+        lines.append(f'trailer\n<< /Size {self._next_id} /Root {self.catalog_id} 0 R /Info {self.info_id} 0 R >>\n')
+        lines.append(f'startxref\n{xref_position}\n%%EOF\n')
+        self._write(''.join(lines).encode('ascii'))
+
+
+class ReportCanvas:
+    """Desenha o relatório de cima para baixo, gravando cada página assim que ela enche"""
+
+    def __init__(self, writer, footer=''):
+        self.writer = writer
+        self.footer = footer
+        self.operations = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def text(self, x, y, text, size=10, bold=False, color='#111827', align='left'):
+        if align == 'right':
+            x -= text_width(text, size)
+        red, green, blue = _rgb(color)
+        self.operations.append(
+            f'BT /{"F2" if bold else "F1"} {size} Tf {red:.3f} {green:.3f} {blue:.3f} rg {x:.2f} {y:.2f} Td '.encode('ascii')
+            + _pdf_string(text) + b' Tj ET'
+        )
+
+    def line(self, x1, y1, x2, y2, color='#D1D5DB', width=0.5):
+        red, green, blue = _rgb(color)
+        self.operations.append(
+            f'{red:.3f} {green:.3f} {blue:.3f} RG {width} w {x1:.2f} {y1:.2f} m {x2:.2f} {y2:.2f} l S'.encode('ascii')
+        )
+
+    def polyline(self, xs, ys, color, width=1.5):
+        red, green, blue = _rgb(color)
+        path = ' '.join(f'{x:.2f} {y:.2f} {"m" if i == 0 else "l"}' for i, (x, y) in enumerate(zip(xs, ys)))
+        self.operations.append(f'{red:.3f} {green:.3f} {blue:.3f} RG {width} w 1 j {path} S'.encode('ascii'))
+
+    def rect(self, x, y, width, height, color):
+        red, green, blue = _rgb(color)
+        self.operations.append(f'{red:.3f} {green:.3f} {blue:.3f} rg {x:.2f} {y:.2f} {width:.2f} {height:.2f} re f'.encode('ascii'))
+
+    def ensure(self, height):
+        """Começa uma nova página se não couberem mais height pontos na atual"""
+        if self.y - height < MARGIN:
+            self.flush()
+
+    def flush(self):
+        """Grava a página atual (com rodapé) e recomeça no topo"""
+        if not self.operations:
+            return
+        page_number = len(self.writer.page_ids) + 1
+        self.text(MARGIN, MARGIN / 2, self.footer, size=8, color='#6B7280')
+        self.text(PAGE_WIDTH - MARGIN, MARGIN / 2, f'Página {page_number}', size=8, color='#6B7280', align='right')
+        self.writer.add_page(b'\n'.join(self.operations))
+        self.operations = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def heading(self, text, size=14):
+        # Reserva espaço para o título e o começo do conteúdo, para não deixá-lo sozinho no fim da página
+        self.ensure(size * 2.5 + 40)
+        self.y -= size * 1.2
+        self.text(MARGIN, self.y, text, size=size, bold=True, color='#1E3A8A')
+        self.y -= size * 0.8
+
+    def table(self, columns, rows, widths, size=9):
+        """Tabela com cabeçalho repetido a cada página; rows pode ser um iterador"""
+        row_height = size * 1.7
+        numeric = None
+
+        def header():
+            self.rect(MARGIN, self.y - row_height + size * 0.45, sum(widths), row_height, '#E5E7EB')
+            self._row(columns, widths, size, bold=True, numeric=numeric)
+            self.y -= row_height
+
+        started = False
+        for row in rows:
+            if numeric is None:
+                numeric = [index > 0 for index in range(len(row))]
+            if not started or self.y - row_height < MARGIN:
+                if started:
+                    self.flush()
+                self.ensure(row_height * 2)
+                header()
+                started = True
+            self._row(row, widths, size, numeric=numeric)
+            self.y -= row_height
+            self.line(MARGIN, self.y + size * 0.45, MARGIN + sum(widths), self.y + size * 0.45, color='#F3F4F6')
+        self.y -= size
+
+    def _row(self, values, widths, size, bold=False, numeric=None):
+        x = MARGIN
+        for index, (value, width) in enumerate(zip(values, widths)):
+            if numeric and numeric[index]:
+                self.text(x + width - 4, self.y - size, str(value), size=size, bold=bold, align='right')
+            else:
+                self.text(x + 4, self.y - size, str(value), size=size, bold=bold)
+            x += width
+
+    def chart(self, series, title, height=220):
+        """Gráfico de linhas vetorial; series: [(rótulo, datas, valores, cor)]"""
+        self.ensure(height + 40)
+        self.y -= 14
+        self.text(MARGIN, self.y, title, size=11, bold=True)
+        self.y -= 10
+
+        left, right = MARGIN + 60, PAGE_WIDTH - MARGIN
+        top, bottom = self.y, self.y - height
+        sampled = []
+        for label, dates, values, color in series:
+            indices = _sample_indices(len(values))
+            sampled.append((label, np.asarray(dates)[indices].astype('datetime64[D]'),
+                            np.asarray(values, dtype=np.float64)[indices], color))
+        non_empty = [item for item in sampled if len(item[2])]
+
+        if non_empty:
+            low = min(0.0, min(float(values.min()) for _, _, values, _ in non_empty))
+            high = max(float(values.max()) for _, _, values, _ in non_empty)
+            ticks = _nice_ticks(low, high)
+            low, high = ticks[0], ticks[-1]
+            first = min(dates[0] for _, dates, _, _ in non_empty).astype(np.int64)
+            last = max(dates[-1] for _, dates, _, _ in non_empty).astype(np.int64)
+            span = max(int(last - first), 1)
+
+            for tick in ticks:
+                y = bottom + (tick - low) / (high - low) * height
+                self.line(left, y, right, y)
+                self.text(left - 6, y - 3, f'{tick:,.0f}', size=7, color='#6B7280', align='right')
+            for position in (0, 0.5, 1):
+                day = np.datetime64(int(first + position * span), 'D')
+                label = str(day.astype(object).strftime('%m/%Y'))
+                x = left + position * (right - left)
+                self.text(x - text_width(label, 7) / 2, bottom - 12, label, size=7, color='#6B7280')
+
+            for label, dates, values, color in non_empty:
+                xs = left + (dates.astype(np.int64) - first) / span * (right - left)
+                ys = bottom + (values - low) / (high - low) * height
+                self.polyline(xs, ys, color)
+
+        self.line(left, bottom, right, bottom, color='#6B7280')
+        self.line(left, bottom, left, top, color='#6B7280')
+
+        # Legenda
+        x = left
+        self.y = bottom - 28
+        for label, _, _, color in sampled:
+            self.rect(x, self.y, 10, 4, color)
+            self.text(x + 14, self.y - 1, label, size=8)
+            x += 24 + text_width(label, 8)
+        self.y -= 16
+
+
+def _modality_histories(results, history_table=None):
+    """Históricos nominais de cada modalidade: {modalidade: (datas, saldos, coluna extra, título)}
+
+    Com history_table (a tabela de históricos do grafo de simulação) os saldos são os líquidos,
+    com impostos e cenário, e terminam no saldo final de cada resultado; sem ela, usa o
+    'history' de cada resultado como está.
+    """
+    histories = {}
+    if history_table is not None:
+        modalities = history_table['modality'].to_numpy()
+        nominal = ~history_table['real'].to_numpy(dtype=bool)
+        for key, result in results.items():
+            rows = np.flatnonzero((modalities == key) & nominal)
+            if not len(rows):
+                continue
+            extra = 'dividends' if 'dividends' in result else 'contribution'
+            histories[key] = (history_table['date'].to_numpy()[rows], history_table['net_balance'].to_numpy()[rows],
+                              history_table[extra].to_numpy()[rows], 'Dividendos' if extra == 'dividends' else 'Aporte')
+        return histories
+    for key, result in results.items():
+        history = result.get('history')
+        if history is None or not len(history):
+            continue
+        extra = 'dividends' if 'dividends' in history else 'contribution'
+        histories[key] = (history['date'].to_numpy(), history['balance'].to_numpy(), history[extra].to_numpy(),
+                          'Dividendos' if extra == 'dividends' else 'Aporte')
+    return histories
+
+
+def _history_rows(dates, balances, extra):
+    """Linhas da tabela de histórico, geradas sob demanda a partir das colunas"""
+    dates = dates.astype('datetime64[D]')
+    for index in range(len(dates)):
+        yield (str(dates[index].astype(object).strftime('%d/%m/%Y')), _format_money(balances[index]),
+               _format_money(extra[index]))
+
+
+def write_report(stream, title, summary, results, results_real=None, labels=None, colors=None,
+                 history_table=None):
+    """Grava o relatório PDF em stream e retorna o número de páginas
+
+    summary: pares {rótulo: valor} exibidos no início; results: {modalidade: resultado} no
+    formato das simulações (com 'history'); results_real: resultados reais, se houver;
+    history_table: tabela de históricos do grafo de simulação, da qual saem os gráficos e as
+    tabelas aporte a aporte (saldos líquidos, coerentes com o saldo final de cada modalidade).
+    """
+    labels = labels or {}
+    colors = colors or {}
+    palette = {key: colors.get(key, DEFAULT_COLORS[index % len(DEFAULT_COLORS)])
+               for index, key in enumerate(results)}
+    results_real = results_real or {}
+
+    writer = PDFWriter(stream, title)
+    canvas = ReportCanvas(writer, footer=title)
+
+    canvas.y -= 10
+    canvas.text(MARGIN, canvas.y, title, size=18, bold=True, color='#1E3A8A')
+    canvas.y -= 16
+
+    canvas.heading('Resumo')
+    canvas.table(('Item', 'Valor'), ((str(key), str(value)) for key, value in summary.items()), (230, 265))
+
+    columns = ('Modalidade', 'Total Aportado', 'Saldo Final', 'Rendimento', 'Impostos', 'Rentab. %')
+    rows = []
+    for key, result in results.items():
+        contributed = result['total_contributed']
+        earnings = result['final_balance'] - contributed
+        rows.append((labels.get(key, key), _format_money(contributed), _format_money(result['final_balance']),
+                     _format_money(earnings), _format_money(result.get('taxes', 0)),
+                     f"{earnings / contributed * 100:.2f}%" if contributed > 0 else '-'))
+    canvas.heading('Comparativo entre modalidades')
+    canvas.table(columns, rows, (85, 85, 90, 85, 75, 75))
+
+    histories = _modality_histories(results, history_table)
+    if histories:
+        canvas.chart([(labels.get(key, key), dates, balances, palette[key])
+                      for key, (dates, balances, _, _) in histories.items()], 'Evolução do Patrimônio (R$)')
+
+    for key, result in results.items():
+        canvas.flush()
+        canvas.heading(labels.get(key, key), size=16)
+
+        metrics = [
+            ('Saldo final', _format_money(result['final_balance'])),
+            ('Total aportado', _format_money(result['total_contributed'])),
+            ('Rendimento líquido', _format_money(result['earnings'])),
+            ('Impostos', _format_money(result.get('taxes', 0))),
+            ('Taxa mensal', f"{result['monthly_rate'] * 100:.3f}%")
+        ]
+        if 'dividends' in result:
+            metrics.append(('Dividendos acumulados', _format_money(result['dividends'])))
+        if key in results_real:
+            metrics.append(('Saldo final real (IPCA)', _format_money(results_real[key]['final_balance'])))
+        canvas.table(('Métrica', 'Valor'), metrics, (230, 265))
+
+        if key not in histories:
+            continue
+        dates, balances, extra, extra_column = histories[key]
+        canvas.chart([(labels.get(key, key), dates, balances, palette[key])],
+                     f'Evolução - {labels.get(key, key)}', height=180)
+        canvas.heading('Histórico aporte a aporte', size=12)
+        canvas.table(('Data', 'Saldo', extra_column), _history_rows(dates, balances, extra), (120, 190, 185))
+
+    canvas.flush()
+    writer.close()
+    return len(writer.page_ids)
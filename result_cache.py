@@ -0,0 +1,128 @@
+"""Cache de resultados de simulação compartilhado pelo processo (LRU com expiração)"""
+import datetime
+import functools
+import hashlib
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _json_default(value):
+    """Converte tipos não suportados pelo json em representações estáveis"""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Tipo não suportado na chave de cache: {type(value).__name__}")
+
+
+def canonical_key(*parts):
+    """Gera um hash canônico (independente da ordem das chaves) para os parâmetros informados"""
+    payload = json.dumps(parts, sort_keys=True, default=_json_default, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _copy_result(value):
+    """Copia o resultado para que quem chama possa alterá-lo sem afetar o cache
+
+    Dicionários e listas são copiados item a item, e DataFrames/Series do pandas (que têm
+    to_numpy) e arrays NumPy graváveis viram cópias próprias. Arrays somente leitura (como os de
+    solve_goal_grid) e valores imutáveis são compartilhados com o cache.
+    """
+    if isinstance(value, dict):
+        return {key: _copy_result(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_result(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.copy() if value.flags.writeable else value
+    if hasattr(value, 'to_numpy'):
+        return value.copy()
+    return value
+
+
+class ResultCache:
+    """Cache LRU limitado com TTL, seguro para uso por várias sessões (threads)"""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Retorna (encontrado, valor) e marca a entrada como usada recentemente"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        """Armazena um valor, descartando a entrada menos usada se o limite for atingido"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove todas as entradas e zera os contadores"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Contadores de acertos e falhas do cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+
+def cached_simulation(method):
+    """Decorador que consulta self.result_cache antes de executar um método de simulação
+
+    A chave combina o nome do método, todos os argumentos (posicionais ou nomeados, já com
+    os valores padrão) e a versão das tabelas de taxas do simulador.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = getattr(self, 'result_cache', None)
+        if cache is None:
+            return method(self, *args, **kwargs)
+
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(list(bound.arguments.items())[1:])
+        key = canonical_key(method.__name__, arguments, self.rates_version())
+
+        found, result = cache.get(key)
+        if not found:
+            result = method(self, *args, **kwargs)
+            cache.set(key, result)
+        return _copy_result(result)
+
+    return wrapper
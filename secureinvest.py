@@ -1,100 +1,36 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import datetime
 from datetime import timedelta
 import warnings
-import requests
-import yfinance as yf
-import time
 import io
-import base64
 from streamlit.components.v1 import html
-import json
-import threading
-import queue
+import atexit
+import uuid
+from charts import FigureFactory, line_trace, line_traces
+from compute_graph import SimulationGraph
+from excel_report import write_workbook
+from history_export import export_frame, write_csv, write_parquet
+from market_data import RealTimeTicker
+from parallel import SimulationExecutor
+from pdf_report import write_report
+from result_cache import ResultCache, canonical_key
+from simulator import SecureInvestSimulator
 
 warnings.filterwarnings('ignore')
 
 
-# Adicione esta classe APÓS as importações e ANTES da configuração da página
-class RealTimeTicker:
-    def __init__(self):
-        self.ticker_data = queue.Queue()
-        self.running = False
-        self.thread = None
-        
-        self.assets = {
-            '^BVSP': 'IBOV', '^GSPC': 'S&P 500', '^DJI': 'DOW JONES', '^IXIC': 'NASDAQ',
-            'BRL=X': 'USD/BRL', 'EURBRL=X': 'EUR/BRL', 
-            'BTC-USD': 'BTC', 'ETH-USD': 'ETH',
-            'PETR4.SA': 'PETR4', 'VALE3.SA': 'VALE3', 'ITUB4.SA': 'ITUB4', 'BBDC4.SA': 'BBDC4',
-            'B3SA3.SA': 'B3SA3', 'WEGE3.SA': 'WEGE3', 'ABEV3.SA': 'ABEV3'
-        }
-    
-    def fetch_real_time_data(self):
-        """Busca dados em tempo real"""
-        try:
-            data = yf.download(list(self.assets.keys()), period="1d", progress=False, group_by='ticker')
-            results = {}
-            
-            for ticker in self.assets.keys():
-                try:
-                    if ticker in data:
-                        if isinstance(data, pd.DataFrame):
-                            last_price = data['Close'].iloc[-1]
-                            prev_close = data['Close'].iloc[-2] if len(data) > 1 else last_price
-                        else:
-                            ticker_data = data[ticker]
-                            last_price = ticker_data['Close'].iloc[-1]
-                            prev_close = ticker_data['Close'].iloc[-2] if len(ticker_data) > 1 else last_price
-                        
-                        change = last_price - prev_close
-                        change_percent = (change / prev_close) * 100 if prev_close != 0 else 0
-                        
-                        results[ticker] = {
-                            'symbol': self.assets[ticker],
-                            'price': last_price,
-                            'change': change,
-                            'change_percent': change_percent
-                        }
-                except:
-                    continue
-            return results
-        except:
-            return None
-    
-    def start(self):
-        """Inicia a thread de atualização"""
-        self.running = True
-        self.thread = threading.Thread(target=self._update_loop)
-        self.thread.daemon = True
-        self.thread.start()
-    
-    def _update_loop(self):
-        """Loop de atualização contínua"""
-        while self.running:
-            try:
-                data = self.fetch_real_time_data()
-                if data:
-                    self.ticker_data.put(data)
-                time.sleep(60)  # Atualiza a cada 60 segundos
-            except:
-                time.sleep(60)
-    
-    def get_latest_data(self):
-        """Obtém os dados mais recentes"""
-        try:
-            return self.ticker_data.get_nowait()
-        except:
-            return None
+# Serviço de cotações único por processo, compartilhado por todas as sessões
+@st.cache_resource(show_spinner=False)
+def get_ticker_service():
+    service = RealTimeTicker()
+    atexit.register(service.stop)
+    return service
 
-# Inicialize o ticker global
-if 'ticker' not in st.session_state:
-    st.session_state.ticker = RealTimeTicker()
-    st.session_state.ticker.start()
+if 'ticker_session_id' not in st.session_state:
+    st.session_state.ticker_session_id = uuid.uuid4().hex
+get_ticker_service().subscribe(st.session_state.ticker_session_id)
 # Configuração da página
 st.set_page_config(
     page_title="SecureInvest - Simulador de Investimentos",
@@ -134,11 +70,26 @@ def reset_parameters():
     st.session_state.end_date = datetime.date.today() + timedelta(days=365*5)
     st.session_state.economic_scenario = 'neutro'
     st.session_state.continuous_simulation = False
+    st.session_state.monte_carlo = False
+    st.session_state.monte_carlo_paths = 10000
+    st.session_state.show_results = False
     st.rerun()
 
+# Pool de processos compartilhado entre sessões e reruns (SECUREINVEST_WORKERS define o tamanho)
+@st.cache_resource
+def get_simulation_executor():
+    return SimulationExecutor()
+
+# Cache de resultados compartilhado entre sessões
+@st.cache_resource
+def get_result_cache():
+    return ResultCache(maxsize=1024, ttl=3600)
+
 # Componente de Ticker para mostrar cotações em tempo real
 def ticker_component():
-    latest_data = st.session_state.ticker.get_latest_data()
+    snapshot = get_ticker_service().get_snapshot()
+    latest_data = snapshot.data
+    updated_at = datetime.datetime.fromtimestamp(snapshot.timestamp).strftime('%H:%M') if snapshot.timestamp else None
     
     if not latest_data:
         ticker_items = [
@@ -184,7 +135,7 @@ def ticker_component():
         <div style="position: absolute; right: 10px; top: 50%; transform: translateY(-50%); 
                    background: rgba(255,255,255,0.2); padding: 4px 8px; border-radius: 3px;
                    font-size: 10px; font-weight: bold;">
-            🔄 TEMPO REAL
+            🔄 {f"ATUALIZADO ÀS {updated_at}" if updated_at else "TEMPO REAL"}
         </div>
     </div>
     <style>
@@ -861,593 +812,334 @@ else:
     </style>
     """, unsafe_allow_html=True)
 
-# Funções para buscar dados de ativos
-def search_asset(ticker, asset_type):
-    """Busca informações do ativo usando Yahoo Finance"""
-    try:
-        # Adiciona sufixo .SA para ativos brasileiros
-        if asset_type == 'fii':
-            ticker_symbol = f"{ticker}.SA"
-        elif asset_type == 'stocks':
-            ticker_symbol = f"{ticker}.SA"
-        elif asset_type == 'treasury':
-            ticker_symbol = f"{ticker}.SA"
-        else:
-            ticker_symbol = f"{ticker}.SA"
-        
-        # Busca informações do ativo
-        asset = yf.Ticker(ticker_symbol)
-        info = asset.info
-        
-        # Obtém dados históricos para calcular dividend yield
-        hist = asset.history(period="1y")
-        
-        # Calcula dividend yield baseado nos últimos 12 meses
-        if 'dividendYield' in info and info['dividendYield'] is not None:
-            dividend_yield = info['dividendYield']
-        else:
-            # Tenta calcular manualmente se não estiver disponível
-            dividends = asset.dividends.last('1Y').sum()
-            current_price = info.get('currentPrice', info.get('regularMarketPrice', 1))
-            dividend_yield = dividends / current_price if current_price > 0 else 0.05
-        
-        # Retorno anual médio baseado no histórico (últimos 3 anos)
-        hist_3y = asset.history(period="3y")
-        if len(hist_3y) > 1:
-            annual_return = (hist_3y['Close'][-1] / hist_3y['Close'][0]) ** (1/3) - 1
-        else:
-            annual_return = 0.12  # Valor padrão se não houver histórico suficiente
-        
-        return {
-            'nome': info.get('longName', ticker),
-            'dividend_yield': max(0.01, min(dividend_yield, 0.2)),  # Limita entre 1% e 20%
-            'annual_return': max(0.05, min(annual_return, 0.3)),   # Limita entre 5% e 30%
-            'setor': info.get('sector', 'Não especificado'),
-            'segmento': info.get('industry', 'Não especificado'),
-            'preco_atual': info.get('currentPrice', info.get('regularMarketPrice', 0)),
-            'success': True
-        }
-    
-    except Exception as e:
-        st.error(f"Erro ao buscar informações para {ticker}: {str(e)}")
-        # Valores padrão para fallback
-        return {
-            'nome': ticker,
-            'dividend_yield': 0.065 if asset_type == 'stocks' else 0.075,
-            'annual_return': 0.12 if asset_type == 'stocks' else 0.10,
-            'setor': 'Não especificado',
-            'segmento': 'Não especificado',
-            'preco_atual': 0,
-            'success': False
-        }
+# Função para criar Excel
+def create_excel(data, results, history_table):
+    """Gera a planilha (resumo e histórico mês a mês de cada modalidade) e retorna os bytes"""
+    buffer = io.BytesIO()
+    write_workbook(buffer, data, results, history_table, labels=MODALITY_LABELS)
+    return buffer.getvalue()
 
-# Classe principal do simulador
-class SecureInvestSimulator:
-    def __init__(self):
-        # Taxas de referência (podem ser atualizadas)
-        self.selic_annual = 0.1175  # 11.75% ao ano
-        self.cdb_monthly = 0.01     # 1% ao mês
-        self.inflation_annual = 0.045  # 4.5% ao ano (IPCA)
-        
-        # Novos parâmetros para impostos e taxas
-        self.income_tax_rates = {
-            'LCI_LCA': 0.00,  # Isentos
-            'tesouro_direto': 0.15,  # 15% fixo
-            'fundos_imobiliarios': 0.20,  # 20% sobre dividendos
-            'acoes': 0.15,  # 15% sobre ganhos de capital
-            'cdb': 0.175,  # 17.5% (varia com tempo)
-        }
-        
-        self.brokerage_fee = 0.005  # 0.5% por operação
-        self.administration_fee = 0.01  # 1% ao ano
-        
-        # Dados históricos de FIIs e ações (valores ilustrativos)
-        self.fii_data = {
-            'KNRI11': {'dividend_yield': 0.085, 'annual_return': 0.12, 'nome': 'Kinea Renda Imobiliária', 'segmento': 'Títulos e Val. Mob.'},
-            'HGLG11': {'dividend_yield': 0.068, 'annual_return': 0.10, 'nome': 'CSHG Logística', 'segmento': 'Logística'},
-            'XPLG11': {'dividend_yield': 0.072, 'annual_return': 0.11, 'nome': 'XP Log', 'segmento': 'Logística'},
-            'VRTA11': {'dividend_yield': 0.078, 'annual_return': 0.13, 'nome': 'Vectis Renda Residencial', 'segmento': 'Residencial'},
-            'BCFF11': {'dividend_yield': 0.082, 'annual_return': 0.14, 'nome': 'BTG Pactual Fundo de Fundos', 'segmento': 'Fundo de Fundos'}
-        }
-        
-        self.stock_data = {
-            'ITSA4': {'dividend_yield': 0.065, 'annual_return': 0.09, 'nome': 'Itaúsa', 'setor': 'Holdings'},
-            'BBAS3': {'dividend_yield': 0.058, 'annual_return': 0.11, 'nome': 'Banco do Brasil', 'setor': 'Bancos'},
-            'PETR4': {'dividend_yield': 0.072, 'annual_return': 0.15, 'nome': 'Petrobras', 'setor': 'Petróleo e Gás'},
-            'VALE3': {'dividend_yield': 0.084, 'annual_return': 0.13, 'nome': 'Vale', 'setor': 'Mineração'},
-            'WEGE3': {'dividend_yield': 0.032, 'annual_return': 0.18, 'nome': 'WEG', 'setor': 'Equipamentos Elétricos'}
-        }
-        
-        # Dados para Tesouro Direto (valores ilustrativos)
-        self.treasury_data = {
-            'Tesouro Selic': {'annual_return': 0.1175, 'ipca_linked': False, 'nome': 'Tesouro Selic'},
-            'Tesouro IPCA+ 2026': {'annual_return': 0.065, 'ipca_linked': True, 'nome': 'Tesouro IPCA+ 2026'},
-            'Tesouro IPCA+ 2035': {'annual_return': 0.06, 'ipca_linked': True, 'nome': 'Tesouro IPCA+ 2035'},
-            'Tesouro Prefixado 2026': {'annual_return': 0.12, 'ipca_linked': False, 'nome': 'Tesouro Prefixado 2026'},
-            'Tesouro Prefixado 2029': {'annual_return': 0.125, 'ipca_linked': False, 'nome': 'Tesouro Prefixado 2029'}
-        }
-        
-        # Dicionário para ativos pesquisados
-        self.searched_assets = {'fii': {}, 'stocks': {}, 'treasury': {}}
-        
-        # Sistema de portfólios
-        self.portfolios = {}
-        
-        # Cenários econômicos
-        self.economic_scenarios = {
-            'otimista': {'fator': 1.2, 'descricao': 'Crescimento econômico acelerado'},
-            'neutro': {'fator': 1.0, 'descricao': 'Cenário base de projeção'},
-            'pessimista': {'fator': 0.8, 'descricao': 'Retração econômica moderada'},
-            'crise': {'fator': 0.6, 'descricao': 'Cenário de crise econômica'}
-        }
-    
-    def search_and_add_asset(self, ticker, asset_type):
-        """Busca e adiciona um ativo usando a API"""
-        if ticker in self.searched_assets[asset_type]:
-            return self.searched_assets[asset_type][ticker]
-        
-        asset_info = search_asset(ticker, asset_type)
-        
-        if asset_info['success']:
-            if asset_type == 'fii':
-                self.searched_assets['fii'][ticker] = {
-                    'dividend_yield': asset_info['dividend_yield'],
-                    'annual_return': asset_info['annual_return'],
-                    'nome': asset_info['nome'],
-                    'segmento': asset_info['segmento']
-                }
-            elif asset_type == 'stocks':
-                self.searched_assets['stocks'][ticker] = {
-                    'dividend_yield': asset_info['dividend_yield'],
-                    'annual_return': asset_info['annual_return'],
-                    'nome': asset_info['nome'],
-                    'setor': asset_info['setor']
-                }
-            elif asset_type == 'treasury':
-                self.searched_assets['treasury'][ticker] = {
-                    'annual_return': asset_info['annual_return'],
-                    'ipca_linked': True,  # Assume que é indexado ao IPCA
-                    'nome': asset_info['nome']
-                }
-        
-        return asset_info
-    
-    def get_asset_data(self, asset_type):
-        """Retorna dados de ativos incluindo os pesquisados"""
-        if asset_type == 'fii':
-            return {**self.fii_data, **self.searched_assets['fii']}
-        elif asset_type == 'stocks':
-            return {**self.stock_data, **self.searched_assets['stocks']}
-        elif asset_type == 'treasury':
-            return {**self.treasury_data, **self.searched_assets['treasury']}
-        else:
-            return {}
-    
-    def calculate_fixed_income(self, amount, frequency, start_date, end_date, investment_type, include_inflation=False, include_taxes=False):
-        """Calcula rendimentos da renda fixa"""
-        months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
-        
-        if investment_type == 'selic':
-            monthly_rate = (1 + self.selic_annual) ** (1/12) - 1
-        elif investment_type == 'cdb':
-            monthly_rate = self.cdb_monthly
-        else:
-            monthly_rate = 0
-        
-        # Ajustar pela inflação se solicitado
-        if include_inflation:
-            monthly_inflation = (1 + self.inflation_annual) ** (1/12) - 1
-            monthly_rate = ((1 + monthly_rate) / (1 + monthly_inflation)) - 1
-        
-        contributions = self._calculate_contributions(amount, frequency, start_date, end_date)
-        total_contributed = sum(contribution['amount'] for contribution in contributions)
-        
-        balance = 0
-        history = []
-        
-        for contribution in contributions:
-            remaining_months = months - contribution['elapsed_months']
-            if remaining_months > 0:
-                balance += contribution['amount'] * (1 + monthly_rate) ** remaining_months
-            history.append({
-                'date': contribution['date'],
-                'balance': balance,
-                'contribution': contribution['amount']
-            })
-        
-        earnings = balance - total_contributed
-        
-        # Calcular impostos se solicitado
-        taxes = 0
-        if include_taxes:
-            taxes = self.calculate_taxes(investment_type, earnings, months)
-            earnings -= taxes
-        
-        earnings_percentage = (earnings / total_contributed) * 100 if total_contributed > 0 else 0
-        
-        return {
-            'final_balance': balance - taxes,
-            'total_contributed': total_contributed,
-            'earnings': earnings,
-            'taxes': taxes,
-            'earnings_percentage': earnings_percentage,
-            'history': history,
-            'monthly_rate': monthly_rate
-        }
-    
-    def calculate_treasury(self, amount, frequency, start_date, end_date, selected_treasury, include_inflation=False, include_taxes=False):
-        """Calcula rendimentos do Tesouro Direto"""
-        months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
-        
-        # Obter dados do tesouro selecionado
-        treasury_data = self.get_asset_data('treasury')
-        if selected_treasury and selected_treasury in treasury_data:
-            annual_return = treasury_data[selected_treasury]['annual_return']
-            is_ipca_linked = treasury_data[selected_treasury]['ipca_linked']
-        else:
-            # Valores padrão se nenhum tesouro for selecionado
-            annual_return = 0.10
-            is_ipca_linked = False
-        
-        monthly_rate = (1 + annual_return) ** (1/12) - 1
-        
-        # Se for título indexado ao IPCA, o retorno já inclui a inflação
-        # Se não for indexado e queremos considerar a inflação, ajustamos
-        if include_inflation and not is_ipca_linked:
-            monthly_inflation = (1 + self.inflation_annual) ** (1/12) - 1
-            monthly_rate = ((1 + monthly_rate) / (1 + monthly_inflation)) - 1
-        
-        contributions = self._calculate_contributions(amount, frequency, start_date, end_date)
-        total_contributed = sum(contribution['amount'] for contribution in contributions)
-        
-        balance = 0
-        history = []
-        
-        for contribution in contributions:
-            remaining_months = months - contribution['elapsed_months']
-            if remaining_months > 0:
-                balance += contribution['amount'] * (1 + monthly_rate) ** remaining_months
-            history.append({
-                'date': contribution['date'],
-                'balance': balance,
-                'contribution': contribution['amount']
-            })
-        
-        earnings = balance - total_contributed
-        
-        # Calcular impostos se solicitado
-        taxes = 0
-        if include_taxes:
-            taxes = self.calculate_taxes('tesouro_direto', earnings, months)
-            earnings -= taxes
-        
-        earnings_percentage = (earnings / total_contributed) * 100 if total_contributed > 0 else 0
-        
-        return {
-            'final_balance': balance - taxes,
-            'total_contributed': total_contributed,
-            'earnings': earnings,
-            'taxes': taxes,
-            'earnings_percentage': earnings_percentage,
-            'history': history,
-            'monthly_rate': monthly_rate,
-            'is_ipca_linked': is_ipca_linked
-        }
-    
-    def calculate_variable_income(self, amount, frequency, start_date, end_date, asset_type, selected_assets=None, include_inflation=False, include_taxes=False):
-        """Calcula rendimentos da renda variável"""
-        months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
-        
-        if asset_type == 'fii':
-            data = self.get_asset_data('fii')
-            avg_dividend_yield = 0.075
-            avg_annual_return = 0.12
-            tax_type = 'fundos_imobiliarios'
-        else:  # stocks
-            data = self.get_asset_data('stocks')
-            avg_dividend_yield = 0.062
-            avg_annual_return = 0.13
-            tax_type = 'acoes'
-        
-        # Se ativos específicos foram selecionados, calcular média ponderada
-        if selected_assets:
-            valid_assets = [asset for asset in selected_assets if asset in data]
-            if valid_assets:
-                dividend_yield = np.mean([data[asset]['dividend_yield'] for asset in valid_assets])
-                annual_return = np.mean([data[asset]['annual_return'] for asset in valid_assets])
-            else:
-                dividend_yield = avg_dividend_yield
-                annual_return = avg_annual_return
-        else:
-            dividend_yield = avg_dividend_yield
-            annual_return = avg_annual_return
-        
-        monthly_appreciation = (1 + annual_return) ** (1/12) - 1
-        monthly_dividends = dividend_yield / 12
-        
-        # Ajustar pela inflação se solicitado
-        if include_inflation:
-            monthly_inflation = (1 + self.inflation_annual) ** (1/12) - 1
-            monthly_appreciation = ((1 + monthly_appreciation) / (1 + monthly_inflation)) - 1
-            monthly_dividends = monthly_dividends / (1 + monthly_inflation)
-        
-        monthly_rate = monthly_appreciation + monthly_dividends
-        
-        contributions = self._calculate_contributions(amount, frequency, start_date, end_date)
-        total_contributed = sum(contribution['amount'] for contribution in contributions)
-        
-        balance = 0
-        dividends_accumulated = 0
-        history = []
-        
-        for contribution in contributions:
-            remaining_months = months - contribution['elapsed_months']
-            if remaining_months > 0:
-                # Apreciação do capital
-                future_value = contribution['amount'] * (1 + monthly_appreciation) ** remaining_months
-                # Dividendos
-                dividends = contribution['amount'] * monthly_dividends * remaining_months
-                
-                balance += future_value
-                dividends_accumulated += dividends
-            
-            history.append({
-                'date': contribution['date'],
-                'balance': balance + dividends_accumulated,
-                'dividends': dividends_accumulated
-            })
-        
-        final_balance = balance + dividends_accumulated
-        earnings = final_balance - total_contributed
-        
-        # Calcular impostos se solicitado
-        taxes = 0
-        if include_taxes:
-            taxes = self.calculate_taxes(tax_type, earnings, months)
-            earnings -= taxes
-        
-        return {
-            'final_balance': final_balance - taxes,
-            'total_contributed': total_contributed,
-            'earnings': earnings,
-            'taxes': taxes,
-            'dividends': dividends_accumulated,
-            'history': history,
-            'monthly_rate': monthly_rate
-        }
-    
-    def _calculate_contributions(self, amount, frequency, start_date, end_date):
-        """Calcula todas as contribuições no período"""
-        contributions = []
-        current_date = start_date
-        elapsed_months = 0
-        
-        while current_date <= end_date:
-            if frequency == 'monthly':
-                contributions.append({
-                    'date': current_date,
-                    'amount': amount,
-                    'elapsed_months': elapsed_months
-                })
-                current_date += timedelta(days=30)
-                elapsed_months += 1
-            elif frequency == 'quarterly':
-                if current_date.month in [1, 4, 7, 10]:
-                    contributions.append({
-                        'date': current_date,
-                        'amount': amount,
-                        'elapsed_months': elapsed_months
-                    })
-                current_date += timedelta(days=30)
-                elapsed_months += 1
-            elif frequency == 'annually':
-                if current_date.month == 1:
-                    contributions.append({
-                        'date': current_date,
-                        'amount': amount,
-                        'elapsed_months': elapsed_months
-                    })
-                current_date += timedelta(days=30)
-                elapsed_months += 1
-        
-        return contributions
-    
-    def calculate_taxes(self, investment_type, earnings, months):
-        """Calcula impostos sobre os rendimentos"""
-        if investment_type in self.income_tax_rates:
-            rate = self.income_tax_rates[investment_type]
-            
-            # Ajustar taxa para CDB baseado no tempo (regressivo)
-            if investment_type == 'cdb':
-                if months <= 6:
-                    rate = 0.225
-                elif months <= 12:
-                    rate = 0.20
-                elif months <= 24:
-                    rate = 0.175
-                else:
-                    rate = 0.15
-            
-            return earnings * rate
-        return 0
-    
-    def calculate_fees(self, total_contributed, months):
-        """Calcula taxas de administração"""
-        monthly_fee = self.administration_fee / 12
-        return total_contributed * monthly_fee * months
-    
-    def calculate_time_to_goal(self, monthly_investment, monthly_rate, goal_amount):
-        """Calcula o tempo necessário para atingir um objetivo"""
-        if monthly_rate <= 0 or monthly_investment <= 0:
-            return float('inf')
-        
-        try:
-            months_needed = np.log(1 + (goal_amount * monthly_rate) / monthly_investment) / np.log(1 + monthly_rate)
-            return max(0, months_needed)
-        except:
-            return float('inf')
-    
-    def calculate_required_contribution(self, monthly_rate, goal_amount, months_available):
-        """Calcula o aporte necessário para atingir o objetivo no tempo especificado"""
-        if monthly_rate <= 0 or months_available <= 0:
-            return goal_amount / months_available
-        
-        try:
-            required_monthly = (goal_amount * monthly_rate) / ((1 + monthly_rate) ** months_available - 1)
-            return max(0, required_monthly)
-        except:
-            return float('inf')
-    
-    def calculate_goal_scenario(self, monthly_rate, goal_amount, current_monthly_investment, total_months):
-        """Calcula cenário completo para atingir o objetivo"""
-        # Tempo necessário com aportes atuais
-        time_with_current = self.calculate_time_to_goal(
-            current_monthly_investment, monthly_rate, goal_amount
-        )
-        
-        # Aporte necessário para atingir no período definido
-        required_monthly = self.calculate_required_contribution(
-            monthly_rate, goal_amount, total_months
-        )
-        
-        # Aporte adicional necessário
-        additional_monthly = max(0, required_monthly - current_monthly_investment)
-        
-        return {
-            'time_with_current': time_with_current,
-            'required_monthly': required_monthly,
-            'additional_monthly': additional_monthly,
-            'additional_quarterly': additional_monthly * 3,
-            'additional_semiannual': additional_monthly * 6,
-            'additional_annual': additional_monthly * 12
-        }
-    
-    def simulate_partial_withdrawal(self, amount, frequency, start_date, end_date, 
-                                  withdrawal_amount, withdrawal_date, investment_type, 
-                                  selected_assets=None, include_inflation=False, include_taxes=False):
-        """Simula resgates parciais durante o período de investimento"""
-        # Implementação simplificada para resgates parciais
-        months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
-        withdrawal_months = (withdrawal_date.year - start_date.year) * 12 + (withdrawal_date.month - start_date.month)
-        
-        # Calcular até o resgate
-        if investment_type in ['selic', 'cdb']:
-            result_until_withdrawal = self.calculate_fixed_income(
-                amount, frequency, start_date, withdrawal_date, investment_type, include_inflation, include_taxes
-            )
-        elif investment_type == 'treasury':
-            result_until_withdrawal = self.calculate_treasury(
-                amount, frequency, start_date, withdrawal_date, selected_assets, include_inflation, include_taxes
-            )
-        else:
-            result_until_withdrawal = self.calculate_variable_income(
-                amount, frequency, start_date, withdrawal_date, investment_type, selected_assets, include_inflation, include_taxes
-            )
-        
-        # Aplicar resgate
-        balance_after_withdrawal = max(0, result_until_withdrawal['final_balance'] - withdrawal_amount)
-        
-        # Calcular do resgate até o final
-        remaining_months = months - withdrawal_months
-        if remaining_months > 0:
-            if investment_type in ['selic', 'cdb']:
-                monthly_rate = result_until_withdrawal['monthly_rate']
-                final_balance = balance_after_withdrawal * (1 + monthly_rate) ** remaining_months
-            elif investment_type == 'treasury':
-                monthly_rate = result_until_withdrawal['monthly_rate']
-                final_balance = balance_after_withdrawal * (1 + monthly_rate) ** remaining_months
-            else:
-                monthly_rate = result_until_withdrawal['monthly_rate']
-                final_balance = balance_after_withdrawal * (1 + monthly_rate) ** remaining_months
-        else:
-            final_balance = balance_after_withdrawal
-        
-        # Ajustar resultados
-        result_until_withdrawal['final_balance'] = final_balance
-        result_until_withdrawal['withdrawal_amount'] = withdrawal_amount
-        result_until_withdrawal['balance_after_withdrawal'] = balance_after_withdrawal
-        
-        return result_until_withdrawal
-    
-    def calculate_risk_metrics(self, historical_data):
-        """Calcula métricas de risco (volatilidade, drawdown)"""
-        if not historical_data or len(historical_data) < 2:
-            return {
-                'volatility': 0,
-                'max_drawdown': 0,
-                'sharpe_ratio': 0
-            }
-        
-        # Extrair valores de balance
-        balances = [point['balance'] for point in historical_data]
-        
-        # Calcular retornos
-        returns = []
-        for i in range(1, len(balances)):
-            if balances[i-1] > 0:
-                returns.append((balances[i] - balances[i-1]) / balances[i-1])
-            else:
-                returns.append(0)
-        
-        # Volatilidade (anualizada)
-        volatility = np.std(returns) * np.sqrt(12) * 100 if returns else 0
-        
-        # Drawdown máximo
-        peak = balances[0]
-        max_drawdown = 0
-        for balance in balances:
-            if balance > peak:
-                peak = balance
-            drawdown = (peak - balance) / peak * 100
-            if drawdown > max_drawdown:
-                max_drawdown = drawdown
-        
-        # Ratio de Sharpe (simplificado)
-        sharpe_ratio = (np.mean(returns) * 12 - self.inflation_annual) / (np.std(returns) * np.sqrt(12)) if returns and np.std(returns) > 0 else 0
-        
-        return {
-            'volatility': volatility,
-            'max_drawdown': max_drawdown,
-            'sharpe_ratio': sharpe_ratio
-        }
-    
-    def simulate_economic_scenario(self, scenario, base_result):
-        """Aplica um cenário econômico aos resultados"""
-        if scenario in self.economic_scenarios:
-            factor = self.economic_scenarios[scenario]['fator']
-            adjusted_result = base_result.copy()
-            adjusted_result['final_balance'] *= factor
-            adjusted_result['earnings'] *= factor
-            if 'dividends' in adjusted_result:
-                adjusted_result['dividends'] *= factor
-            return adjusted_result
-        return base_result
+# Função para exportar os históricos (Parquet ou CSV)
+def create_history_export(history_table, scenario, file_format):
+    """Grava a tabela longa de históricos no formato escolhido e retorna os bytes"""
+    buffer = io.BytesIO()
+    frame = export_frame(history_table, scenario)
+    if file_format == 'Parquet':
+        write_parquet(buffer, frame)
+    else:
+        write_csv(buffer, frame)
+    return buffer.getvalue()
 
-# Função para criar Excel
-def create_excel(data):
-    """Cria uma planilha Excel com os resultados da simulação"""
+# Relatórios já gerados, por hash do resultado (os bytes são reaproveitados entre reruns e sessões)
+@st.cache_resource
+def get_report_cache():
+    return ResultCache(maxsize=32, ttl=3600)
+
+def stamped_summary(summary):
+    """Resumo do relatório com a data e hora da exportação no início
+
+    A data (com minutos) entra na chave do cache dos relatórios: o mesmo resultado exportado em
+    outro minuto gera um novo arquivo em vez de repetir uma data antiga.
+    """
+    return {'Data da Simulação': datetime.datetime.now().strftime('%d/%m/%Y %H:%M'), **summary}
+
+# Função para criar PDF
+def create_pdf(data, title, results=None, results_real=None, history_table=None):
+    """Gera o relatório PDF (resumo, seções por modalidade e gráficos vetoriais) e retorna os bytes"""
     buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-        # Dados resumidos
-        summary_data = []
-        for key, value in data.items():
-            if isinstance(value, (int, float)):
-                summary_data.append([key, value])
-        
-        summary_df = pd.DataFrame(summary_data, columns=['Métrica', 'Valor'])
-        summary_df.to_excel(writer, sheet_name='Resumo', index=False)
-        
-        # Dados detalhados (exemplo)
-        details_data = {
-            'Mês': list(range(1, 13)),
-            'Retorno': [i * 0.01 for i in range(12)],
-            'Acumulado': [1000 * (1 + i * 0.01) for i in range(12)]
-        }
-        details_df = pd.DataFrame(details_data)
-        details_df.to_excel(writer, sheet_name='Detalhes', index=False)
-    
-    buffer.seek(0)
-    return buffer
+    write_report(buffer, title, data, results or {}, results_real,
+                 labels=MODALITY_LABELS, colors=modality_colors('light'), history_table=history_table)
+    return buffer.getvalue()
+
+# Gráficos dos resultados (montados uma vez por resultado pela fábrica de figuras; o tema só
+# reestiliza o layout e as cores da figura já montada)
+MODALITY_LABELS = {'selic': 'Tesouro Selic', 'cdb': 'CDB', 'fii': 'FIIs', 'stocks': 'Ações', 'treasury': 'Tesouro'}
+
+# Cores das modalidades (na ordem dos gráficos de barras) em cada tema
+THEME_PALETTES = {
+    'light': ['#1E3A8A', '#3B82F6', '#10B981', '#EF4444', '#8B5CF6'],
+    'dark': ['#3B82F6', '#60A5FA', '#10B981', '#EF4444', '#A78BFA']
+}
+
+# Layout e troca de cores de cada tema (as figuras são montadas no tema claro)
+FIGURE_THEMES = {
+    'light': {'layout': {'template': 'plotly_white'}},
+    'dark': {
+        'layout': {'template': 'plotly_dark'},
+        'colors': dict(zip(THEME_PALETTES['light'], THEME_PALETTES['dark']))
+    }
+}
+
+# Fundo transparente no tema escuro (gráficos que acompanham o fundo da página)
+TRANSPARENT_LAYOUTS = {'dark': {'plot_bgcolor': 'rgba(0,0,0,0)', 'paper_bgcolor': 'rgba(0,0,0,0)'}}
+
+def modality_colors(theme):
+    """Cores de cada modalidade nos gráficos de evolução e composição"""
+    return dict(zip(MODALITY_LABELS, THEME_PALETTES['dark' if theme == 'dark' else 'light']))
+
+def build_comparison_figure(results):
+    """Rentabilidade absoluta e percentual por modalidade"""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    results = results[False]
+    fig_comparison = make_subplots(rows=1, cols=2, subplot_titles=('Rentabilidade Absoluta', 'Rentabilidade Percentual'))
+
+    modalities = [MODALITY_LABELS[key] for key in results.keys()]
+    earnings = [results[key]['final_balance'] - results[key]['total_contributed'] for key in results.keys()]
+    earnings_percentages = [
+        ((results[key]['final_balance'] - results[key]['total_contributed']) /
+         results[key]['total_contributed'] * 100) if results[key]['total_contributed'] > 0 else 0
+        for key in results.keys()
+    ]
+
+    colors = THEME_PALETTES['light']
+
+    fig_comparison.add_trace(
+        go.Bar(x=modalities, y=earnings, name='Ganho Absoluto', marker_color=colors[:len(modalities)]),
+        row=1, col=1
+    )
+
+    fig_comparison.add_trace(
+        go.Bar(x=modalities, y=earnings_percentages, name='Ganho Percentual', marker_color=colors[:len(modalities)]),
+        row=1, col=2
+    )
+
+    fig_comparison.update_layout(
+        height=400,
+        showlegend=False
+    )
+
+    fig_comparison.update_yaxes(title_text="Rentabilidade (R$)", row=1, col=1)
+    fig_comparison.update_yaxes(title_text="Rentabilidade (%)", row=1, col=2)
+    return fig_comparison
+
+def build_real_vs_nominal_figure(results):
+    """Patrimônio final nominal x real (None se a simulação não considera inflação)"""
+    import plotly.graph_objects as go
+
+    results_real = results.get(True)
+    if not results_real:
+        return None
+    results = results[False]
+
+    modalities = [MODALITY_LABELS[key] for key in results.keys()]
+    colors = THEME_PALETTES['light']
+
+    fig_real_vs_nominal = go.Figure()
+
+    # Dados nominais
+    nominal_balances = [results[key]['final_balance'] for key in results.keys()]
+    real_balances = [results_real[key]['final_balance'] for key in results_real.keys()]
+
+    fig_real_vs_nominal.add_trace(go.Bar(
+        name='Nominal',
+        x=modalities,
+        y=nominal_balances,
+        marker_color=colors[:len(modalities)]
+    ))
+
+    fig_real_vs_nominal.add_trace(go.Bar(
+        name='Real (ajustado pela inflação)',
+        x=modalities,
+        y=real_balances,
+        marker_color=['#9CA3AF'] * len(modalities)
+    ))
+
+    fig_real_vs_nominal.update_layout(
+        barmode='group',
+        title="Comparação entre Valores Nominais e Reais",
+        xaxis_title="Modalidade",
+        yaxis_title="Valor (R$)",
+        height=400
+    )
+    return fig_real_vs_nominal
+
+def build_evolution_figure(balances, financial_goal, monthly_investment, start_date, end_date, inflation_annual):
+    """Evolução do patrimônio por modalidade, com o objetivo e a referência do IPCA"""
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    colors = modality_colors('light')
+
+    for key, gross in balances[False].items():
+        history = gross['history']
+        fig.add_trace(line_trace(
+            history['date'].to_numpy(),
+            history['balance'].to_numpy(),
+            name=MODALITY_LABELS[key],
+            line=dict(color=colors[key], width=3),
+            mode='lines'
+        ))
+
+    # Adicionar linha do objetivo
+    fig.add_hline(y=financial_goal, line_dash="dash", line_color="orange",
+                 annotation_text=f"Objetivo: R$ {financial_goal:,.2f}",
+                 annotation_position="bottom right")
+
+    # Adicionar linha de referência do IPCA se aplicável
+    if True in balances:
+        # Evolução da inflação, um ponto a cada 30 dias (como os aportes)
+        months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
+        monthly_inflation = (1 + inflation_annual) ** (1/12) - 1
+        steps = np.arange(max(months, 0))
+
+        fig.add_trace(line_trace(
+            np.datetime64(start_date, 'D') + 30 * steps,
+            monthly_investment * (1 + monthly_inflation) ** steps,
+            name="IPCA (Inflação)",
+            line=dict(color="#9CA3AF", width=2, dash="dot"),
+            mode='lines'
+        ))
+
+    fig.update_layout(
+        title="Evolução do Patrimônio",
+        xaxis_title="Data",
+        yaxis_title="Valor (R$)",
+        hovermode='x unified',
+        height=500,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig
+
+def build_composition_figure(results):
+    """Composição do patrimônio final entre as modalidades"""
+    import plotly.graph_objects as go
+
+    results = results[False]
+    colors = modality_colors('light')
+    fig_pie = go.Figure(data=[go.Pie(
+        labels=[MODALITY_LABELS[key] for key in results.keys()],
+        values=[results[key]['final_balance'] for key in results.keys()],
+        hole=.4,
+        marker_colors=[colors[key] for key in results.keys()]
+    )])
+    return fig_pie
+
+def build_drawdown_figure(risk_data):
+    """Drawdown máximo por modalidade"""
+    import plotly.graph_objects as go
+
+    colors = THEME_PALETTES['dark']
+    modalities = [MODALITY_LABELS[key] for key in risk_data.keys()]
+    drawdowns = [risk_data[key]['max_drawdown'] for key in risk_data.keys()]
+
+    fig_drawdown = go.Figure()
+    fig_drawdown.add_trace(go.Bar(
+        x=modalities,
+        y=drawdowns,
+        marker_color=colors[:len(modalities)]
+    ))
+    fig_drawdown.update_layout(
+        title="Drawdown Máximo por Modalidade",
+        xaxis_title="Modalidade",
+        yaxis_title="Drawdown Máximo (%)",
+        height=400
+    )
+    return fig_drawdown
+
+def build_scenario_figure(results, economic_scenarios):
+    """Patrimônio final da primeira modalidade em cada cenário econômico (None sem resultados)"""
+    import plotly.graph_objects as go
+
+    results = results[False]
+    if not results:
+        return None
+    base_result = next(iter(results.values()))
+
+    scenarios = list(economic_scenarios.keys())
+    scenario_names = [f"{s.capitalize()}\n({economic_scenarios[s]['descricao']})" for s in scenarios]
+    final_balances = [base_result['final_balance'] * economic_scenarios[s]['fator'] for s in scenarios]
+
+    scenario_fig = go.Figure()
+    scenario_fig.add_trace(go.Bar(
+        x=scenario_names,
+        y=final_balances,
+        marker_color=['#10B981', '#3B82F6', '#F59E0B', '#EF4444']
+    ))
+    scenario_fig.update_layout(
+        title="Impacto dos Cenários Econômicos no Patrimônio Final",
+        xaxis_title="Cenário Econômico",
+        yaxis_title="Patrimônio Final (R$)",
+        height=400
+    )
+    return scenario_fig
+
+def build_monte_carlo_figure(monte_carlo_result, label, financial_goal):
+    """Faixas P5-P95 e mediana do patrimônio nos cenários do Monte Carlo"""
+    import plotly.graph_objects as go
+
+    bands = monte_carlo_result['bands']
+    fan_fig = go.Figure()
+    # As três faixas são reduzidas juntas para que o preenchimento entre P95 e P5 continue alinhado
+    fan_fig.add_traces(line_traces(monte_carlo_result['dates'].astype('datetime64[D]'), [
+        (bands['p95'], dict(name='P95', mode='lines', line=dict(color='#10B981', width=1))),
+        (bands['p5'], dict(name='P5', mode='lines', line=dict(color='#EF4444', width=1),
+                           fill='tonexty', fillcolor='rgba(59, 130, 246, 0.15)')),
+        (bands['p50'], dict(name='Mediana (P50)', mode='lines', line=dict(color='#3B82F6', width=3)))
+    ]))
+    fan_fig.add_hline(y=financial_goal, line_dash="dash", line_color="orange",
+                      annotation_text=f"Objetivo: R$ {financial_goal:,.2f}",
+                      annotation_position="bottom right")
+    fan_fig.update_layout(
+        title=f"Faixas de Patrimônio - {label}",
+        xaxis_title="Data",
+        yaxis_title="Valor (R$)",
+        height=400
+    )
+    return fan_fig
+
+# Fábrica de figuras única por processo: cada gráfico é montado uma vez por (resultado, tipo) e
+# reestilizado uma vez por tema; as figuras são compartilhadas entre reruns e sessões
+@st.cache_resource
+def get_figure_factory():
+    factory = FigureFactory(FIGURE_THEMES, base_theme='light', maxsize=128, ttl=3600)
+    factory.register('comparison', build_comparison_figure, layouts=TRANSPARENT_LAYOUTS)
+    factory.register('real_vs_nominal', build_real_vs_nominal_figure)
+    factory.register('evolution', build_evolution_figure, layouts=TRANSPARENT_LAYOUTS)
+    factory.register('composition', build_composition_figure)
+    # Gráficos com as mesmas cores nos dois temas
+    factory.register('drawdown', build_drawdown_figure, recolor=False)
+    factory.register('scenario', build_scenario_figure, recolor=False)
+    factory.register('monte_carlo', build_monte_carlo_figure, recolor=False)
+    return factory
+
+def get_simulation_graph(simulator):
+    """Grafo de recálculo incremental da sessão: simulações e gráficos que dependem delas"""
+    graph = st.session_state.get('simulation_graph')
+    if graph is None:
+        graph = SimulationGraph(simulator)
+        for name in ('theme', 'financial_goal', 'monthly_investment'):
+            graph.add_input(name)
+        
+        # Os nós de gráfico pedem a figura à fábrica pelo hash dos dados de que ela depende
+        # (results_key ou history_key): a troca de tema não remonta os traços
+        def add_figure_node(kind, data, key):
+            graph.add_node(f'{kind}_figure',
+                           lambda value, key_value, theme: get_figure_factory().get(kind, key_value, theme, value),
+                           (data, key, 'theme'))
+        add_figure_node('comparison', 'results', 'results_key')
+        add_figure_node('real_vs_nominal', 'results', 'results_key')
+        add_figure_node('composition', 'results', 'results_key')
+        add_figure_node('drawdown', 'risk_metrics', 'history_key')
+        
+        # A inflação vem das tabelas do simulador (rates_version faz parte de history_key)
+        def evolution_figure(balances, financial_goal, monthly_investment, start_date, end_date, history_key, theme):
+            return get_figure_factory().get(
+                'evolution', (history_key, financial_goal, monthly_investment), theme,
+                balances, financial_goal, monthly_investment, start_date, end_date, graph.simulator.inflation_annual
+            )
+        graph.add_node('evolution_figure', evolution_figure,
+                       ('balances', 'financial_goal', 'monthly_investment', 'start_date', 'end_date', 'history_key',
+                        'theme'))
+        graph.add_node('scenario_figure',
+                       lambda results, results_key, theme: get_figure_factory().get(
+                           'scenario', results_key, theme, results, graph.simulator.economic_scenarios),
+                       ('results', 'results_key', 'theme'))
+        st.session_state.simulation_graph = graph
+    # O simulador é recriado a cada rerun; mudanças nas taxas chegam pela entrada rates_version
+    graph.simulator = simulator
+    return graph
 
 # Interface principal
 def main():
@@ -1456,7 +1148,8 @@ def main():
         'monthly_investment', 'quarterly_investment', 'annual_investment',
         'financial_goal', 'simulate_selic', 'simulate_cdb', 'simulate_fii',
         'simulate_stocks', 'simulate_treasury', 'include_ipca', 'include_taxes',
-        'start_date', 'end_date', 'economic_scenario', 'continuous_simulation'
+        'start_date', 'end_date', 'economic_scenario', 'continuous_simulation',
+        'monte_carlo', 'monte_carlo_paths'
     ]
     
     default_values = {
@@ -1474,7 +1167,9 @@ def main():
         'start_date': datetime.date.today(),
         'end_date': datetime.date.today() + timedelta(days=365*5),
         'economic_scenario': 'neutro',
-        'continuous_simulation': False
+        'continuous_simulation': False,
+        'monte_carlo': False,
+        'monte_carlo_paths': 10000
     }
     
     for var in session_vars:
@@ -1498,7 +1193,7 @@ def main():
     st.markdown('<p class="quote-author">- Provérbio Chinês</p>', unsafe_allow_html=True)
     
     # Inicializar simulador
-    simulator = SecureInvestSimulator()
+    simulator = SecureInvestSimulator(result_cache=get_result_cache())
     
     # Sidebar com parâmetros de entrada
     with st.sidebar:
@@ -1586,6 +1281,16 @@ def main():
             key="economic_scenario_input"
         )
         
+        # Simulação estocástica da renda variável
+        monte_carlo = st.checkbox("Simulação Monte Carlo (renda variável)",
+                                  value=st.session_state.monte_carlo,
+                                  key="monte_carlo_input")
+        monte_carlo_paths = st.select_slider("Número de cenários simulados",
+                                             options=[1000, 5000, 10000, 50000],
+                                             value=st.session_state.monte_carlo_paths,
+                                             key="monte_carlo_paths_input",
+                                             disabled=not monte_carlo)
+        
         # Modalidades de investmento
         st.subheader("📈 Modalidades de Investimento")
         simulate_selic = st.checkbox("Tesouro Selic", value=st.session_state.simulate_selic, key="simulate_selic_input")
@@ -1643,91 +1348,64 @@ def main():
         
         # Botão de simulação
         simulate_button = st.button("🚀 Simular Investimentos", type="primary", use_container_width=True)
+        
+        cache_stats = simulator.result_cache.stats()
+        st.caption(f"Cache de simulações: {cache_stats['hits']} acertos, {cache_stats['misses']} falhas, "
+                   f"{cache_stats['size']}/{cache_stats['maxsize']} entradas")
     
     # Conteúdo principal
     if simulate_button:
+        st.session_state.show_results = True
+    
+    selected_modalities = [
+        key for key, enabled in [
+            ('selic', simulate_selic), ('cdb', simulate_cdb), ('fii', simulate_fii),
+            ('stocks', simulate_stocks), ('treasury', simulate_treasury)
+        ] if enabled
+    ]
+    
+    # Depois da primeira simulação os resultados acompanham os parâmetros da barra lateral
+    if st.session_state.get('show_results') and not selected_modalities:
+        st.info("💡 Selecione ao menos uma modalidade de investimento na barra lateral para ver os resultados.")
+    
+    elif st.session_state.get('show_results'):
+        # Plotly só é carregado quando há resultados para desenhar
+        import plotly.graph_objects as go
+        
         # Atualizar session state com os valores atuais
         for var, value in zip(session_vars, [
             monthly_investment, quarterly_investment, annual_investment,
             financial_goal, simulate_selic, simulate_cdb, simulate_fii,
             simulate_stocks, simulate_treasury, include_ipca, include_taxes,
-            start_date, end_date, economic_scenario, continuous_simulation
+            start_date, end_date, economic_scenario, continuous_simulation,
+            monte_carlo, monte_carlo_paths
         ]):
             st.session_state[var] = value
         
-        # Cálculos
-        results = {}
-        monthly_rates = {}
-        results_real = {}  # Resultados considerando inflação
-        monthly_rates_real = {}  # Taxas mensais considerando inflação
-        
-        if simulate_selic:
-            results['selic'] = simulator.calculate_fixed_income(
-                monthly_investment, 'monthly', start_date, end_date, 'selic', False, include_taxes
-            )
-            monthly_rates['selic'] = results['selic']['monthly_rate']
-            
-            if include_ipca:
-                results_real['selic'] = simulator.calculate_fixed_income(
-                    monthly_investment, 'monthly', start_date, end_date, 'selic', True, include_taxes
-                )
-                monthly_rates_real['selic'] = results_real['selic']['monthly_rate']
-        
-        if simulate_cdb:
-            results['cdb'] = simulator.calculate_fixed_income(
-                monthly_investment, 'monthly', start_date, end_date, 'cdb', False, include_taxes
-            )
-            monthly_rates['cdb'] = results['cdb']['monthly_rate']
-            
-            if include_ipca:
-                results_real['cdb'] = simulator.calculate_fixed_income(
-                    monthly_investment, 'monthly', start_date, end_date, 'cdb', True, include_taxes
-                )
-                monthly_rates_real['cdb'] = results_real['cdb']['monthly_rate']
-        
-        if simulate_fii:
-            results['fii'] = simulator.calculate_variable_income(
-                monthly_investment, 'monthly', start_date, end_date, 'fii', None, False, include_taxes
-            )
-            monthly_rates['fii'] = results['fii']['monthly_rate']
-            
-            if include_ipca:
-                results_real['fii'] = simulator.calculate_variable_income(
-                    monthly_investment, 'monthly', start_date, end_date, 'fii', None, True, include_taxes
-                )
-                monthly_rates_real['fii'] = results_real['fii']['monthly_rate']
-        
-        if simulate_stocks:
-            results['stocks'] = simulator.calculate_variable_income(
-                monthly_investment, 'monthly', start_date, end_date, 'stocks', None, False, include_taxes
-            )
-            monthly_rates['stocks'] = results['stocks']['monthly_rate']
-            
-            if include_ipca:
-                results_real['stocks'] = simulator.calculate_variable_income(
-                    monthly_investment, 'monthly', start_date, end_date, 'stocks', None, True, include_taxes
-                )
-                monthly_rates_real['stocks'] = results_real['stocks']['monthly_rate']
+        # Aportes mensais, trimestrais e anuais combinados em um único cronograma
+        contribution_amounts = {
+            'monthly': monthly_investment,
+            'quarterly': quarterly_investment,
+            'annually': annual_investment
+        }
         
-        if simulate_treasury:
-            # Usar o primeiro tesouro selecionado ou um padrão
-            selected_t = 'Tesouro Selic'
-            results['treasury'] = simulator.calculate_treasury(
-                monthly_investment, 'monthly', start_date, end_date, selected_t, False, include_taxes
-            )
-            monthly_rates['treasury'] = results['treasury']['monthly_rate']
-            
-            if include_ipca:
-                results_real['treasury'] = simulator.calculate_treasury(
-                    monthly_investment, 'monthly', start_date, end_date, selected_t, True, include_taxes
-                )
-                monthly_rates_real['treasury'] = results_real['treasury']['monthly_rate']
+        # Cálculos: todas as modalidades, nominais e reais, pelo grafo de recálculo incremental
+        selected_treasury = 'Tesouro Selic'  # Usar o primeiro tesouro selecionado ou um padrão
+        simulation_graph = get_simulation_graph(simulator)
+        simulation_graph.set_inputs(
+            amount=contribution_amounts, start_date=start_date, end_date=end_date,
+            modalities=tuple(selected_modalities),
+            include_inflation=(False, True) if include_ipca else (False,),
+            include_taxes=include_taxes, selected_assets={},
+            selected_treasury=selected_treasury,
+            scenario=economic_scenario, rates_version=simulator.rates_version(),
+            theme=st.session_state.theme, financial_goal=financial_goal, monthly_investment=monthly_investment
+        )
+        batch_results = simulation_graph.get('results')
         
-        # Aplicar cenário econômico
-        for key in list(results.keys()):
-            results[key] = simulator.simulate_economic_scenario(economic_scenario, results[key])
-            if include_ipca and key in results_real:
-                results_real[key] = simulator.simulate_economic_scenario(economic_scenario, results_real[key])
+        results = batch_results[False]
+        results_real = batch_results.get(True, {})  # Resultados considerando inflação
+        monthly_rates = {key: result['monthly_rate'] for key, result in results.items()}
         
         # Exibir resultados em abas
         tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Resumo", "📈 Gráficos", "🎯 Análise de Objetivo", "📋 Detalhes", "⚠️ Análise de Risco"])
@@ -1799,108 +1477,26 @@ def main():
             # Comparativo entre modalidades
             st.subheader("📌 Comparativo entre Modalidades")
             
-            fig_comparison = make_subplots(rows=1, cols=2, subplot_titles=('Rentabilidade Absoluta', 'Rentabilidade Percentual'))
-            
             labels = {'selic': 'Tesouro Selic', 'cdb': 'CDB', 'fii': 'FIIs', 'stocks': 'Ações', 'treasury': 'Tesouro'}
-            modalities = [labels[key] for key in results.keys()]
-            final_balances = [results[key]['final_balance'] for key in results.keys()]
-            earnings = [results[key]['final_balance'] - results[key]['total_contributed'] for key in results.keys()]
-            
-            # CORREÇÃO DO ERRO: Fechamento correto dos colchetes e parênteses
-            earnings_percentages = [
-                ((results[key]['final_balance'] - results[key]['total_contributed']) / 
-                 results[key]['total_contributed'] * 100) if results[key]['total_contributed'] > 0 else 0 
-                for key in results.keys()
-            ]
-            
-            colors = ['#1E3A8A', '#3B82F6', '#10B981', '#EF4444', '#8B5CF6']
-            if st.session_state.theme == 'dark':
-                colors = ['#3B82F6', '#60A5FA', '#10B981', '#EF4444', '#A78BFA']
-            
-            fig_comparison.add_trace(
-                go.Bar(x=modalities, y=earnings, name='Ganho Absoluto', marker_color=colors[:len(modalities)]),
-                row=1, col=1
-            )
-            
-            fig_comparison.add_trace(
-                go.Bar(x=modalities, y=earnings_percentages, name='Ganho Percentual', marker_color=colors[:len(modalities)]),
-                row=1, col=2
-            )
-            
-            # Ajustar tema do gráfico comparativo
-            if st.session_state.theme == 'dark':
-                fig_comparison.update_layout(
-                    template="plotly_dark",
-                    height=400, 
-                    showlegend=False,
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)'
-                )
-            else:
-                fig_comparison.update_layout(
-                    template="plotly_white",
-                    height=400, 
-                    showlegend=False
-                )
-                
-            fig_comparison.update_yaxes(title_text="Rentabilidade (R$)", row=1, col=1)
-            fig_comparison.update_yaxes(title_text="Rentabilidade (%)", row=1, col=2)
             
-            st.plotly_chart(fig_comparison, use_container_width=True)
+            st.plotly_chart(simulation_graph.get('comparison_figure'), use_container_width=True)
             
             # Se estamos considerando inflação, mostrar comparação entre nominal e real
             if include_ipca and results_real:
                 st.subheader("📊 Comparativo: Rentabilidade Nominal vs Real")
-                
-                fig_real_vs_nominal = go.Figure()
-                
-                # Dados nominais
-                nominal_balances = [results[key]['final_balance'] for key in results.keys()]
-                real_balances = [results_real[key]['final_balance'] for key in results_real.keys()]
-                
-                fig_real_vs_nominal.add_trace(go.Bar(
-                    name='Nominal',
-                    x=modalities,
-                    y=nominal_balances,
-                    marker_color=colors[:len(modalities)]
-                ))
-                
-                fig_real_vs_nominal.add_trace(go.Bar(
-                    name='Real (ajustado pela inflação)',
-                    x=modalities,
-                    y=real_balances,
-                    marker_color=['#9CA3AF'] * len(modalities)
-                ))
-                
-                if st.session_state.theme == 'dark':
-                    fig_real_vs_nominal.update_layout(
-                        template="plotly_dark",
-                        barmode='group',
-                        title="Comparação entre Valores Nominais e Reais",
-                        xaxis_title="Modalidade",
-                        yaxis_title="Valor (R$)",
-                        height=400
-                    )
-                else:
-                    fig_real_vs_nominal.update_layout(
-                        template="plotly_white",
-                        barmode='group',
-                        title="Comparação entre Valores Nominais e Reais",
-                        xaxis_title="Modalidade",
-                        yaxis_title="Valor (R$)",
-                        height=400
-                    )
-                
-                st.plotly_chart(fig_real_vs_nominal, use_container_width=True)
+                st.plotly_chart(simulation_graph.get('real_vs_nominal_figure'), use_container_width=True)
             
             # Botões de exportação
             st.subheader("📤 Exportar Resultados")
             col1, col2 = st.columns(2)
             
+            # A tabela de históricos é um nó do grafo (só muda com as simulações); os relatórios
+            # em si só são montados quando os botões são clicados
+            history_table = simulation_graph.get('history_table')
+            
             with col1:
                 # Preparar dados para exportação
                 export_data = {
-                    'Data da Simulação': datetime.datetime.now().strftime('%d/%m/%Y %H:%M'),
                     'Cenário Econômico': f"{economic_scenario.capitalize()} ({simulator.economic_scenarios[economic_scenario]['descricao']})",
                     'Total Aportado': f"R$ {sum(results[key]['total_contributed'] for key in results.keys()):,.2f}",
                     'Patrimônio Final Médio': f"R$ {np.mean([results[key]['final_balance'] for key in results.keys()]):,.2f}",
@@ -1910,187 +1506,183 @@ def main():
                     export_data[f"{labels[key]} - Patrimônio Final"] = f"R$ {result['final_balance']:,.2f}"
                     export_data[f"{labels[key]} - Rentabilidade"] = f"{((result['final_balance'] - result['total_contributed']) / result['total_contributed'] * 100):.2f}%"
                 
-                pdf_buffer = create_pdf(export_data, "Relatório de Investimentos - SecureInvest")
+                # O PDF só é gerado quando o botão é clicado, e uma única vez por resultado e data
+                report_key = simulation_graph.get('results_key')
+                
+                def pdf_report(export_data=export_data, results=results, results_real=results_real,
+                               history_table=history_table):
+                    report_cache = get_report_cache()
+                    summary = stamped_summary(export_data)
+                    cache_key = ('pdf', report_key, summary['Data da Simulação'])
+                    found, pdf_bytes = report_cache.get(cache_key)
+                    if not found:
+                        pdf_bytes = create_pdf(summary, "Relatório de Investimentos - SecureInvest", results, results_real,
+                                               history_table)
+                        report_cache.set(cache_key, pdf_bytes)
+                    return pdf_bytes
+                
                 st.download_button(
                     label="📄 Exportar PDF",
-                    data=pdf_buffer,
+                    data=pdf_report,
                     file_name="relatorio_investimentos.pdf",
                     mime="application/pdf",
                     use_container_width=True
                 )
             
             with col2:
-                excel_buffer = create_excel(export_data)
+                def excel_report(export_data=export_data, results=batch_results, history_table=history_table):
+                    report_cache = get_report_cache()
+                    summary = stamped_summary(export_data)
+                    cache_key = ('xlsx', report_key, summary['Data da Simulação'])
+                    found, excel_bytes = report_cache.get(cache_key)
+                    if not found:
+                        excel_bytes = create_excel(summary, results, history_table)
+                        report_cache.set(cache_key, excel_bytes)
+                    return excel_bytes
+                
                 st.download_button(
                     label="📊 Exportar Excel",
-                    data=excel_buffer,
+                    data=excel_report,
                     file_name="relatorio_investimentos.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                     use_container_width=True
                 )
-        
-        with tab2:
-            st.header("📈 Evolução dos Investimentos")
             
-            fig = go.Figure()
-            
-            colors = {'selic': '#1E3A8A', 'cdb': '#3B82F6', 'fii': '#10B981', 'stocks': '#EF4444', 'treasury': '#8B5CF6'}
-            if st.session_state.theme == 'dark':
-                colors = {'selic': '#3B82F6', 'cdb': '#60A5FA', 'fii': '#10B981', 'stocks': '#EF4444', 'treasury': '#A78BFA'}
-                
-            labels = {'selic': 'Tesouro Selic', 'cdb': 'CDB', 'fii': 'FIIs', 'stocks': 'Ações', 'treasury': 'Tesouro'}
-            
-            for key, result in results.items():
-                if 'history' in result:
-                    dates = [item['date'] for item in result['history']]
-                    balances = [item['balance'] for item in result['history']]
-                    
-                    fig.add_trace(go.Scatter(
-                        x=dates,
-                        y=balances,
-                        name=labels[key],
-                        line=dict(color=colors[key], width=3),
-                        mode='lines'
-                    ))
+            # Históricos completos (todas as modalidades, nominais e reais) em uma tabela colunar
+            history_format = st.radio(
+                "Formato dos históricos", ['Parquet', 'CSV'], horizontal=True, key='history_export_format'
+            )
             
-            # Adicionar linha do objetivo
-            fig.add_hline(y=financial_goal, line_dash="dash", line_color="orange", 
-                         annotation_text=f"Objetivo: R$ {financial_goal:,.2f}", 
-                         annotation_position="bottom right")
+            def history_export(history_format=history_format, history_table=history_table,
+                               scenario=economic_scenario):
+                report_cache = get_report_cache()
+                found, history_bytes = report_cache.get((history_format, report_key))
+                if not found:
+                    history_bytes = create_history_export(history_table, scenario, history_format)
+                    report_cache.set((history_format, report_key), history_bytes)
+                return history_bytes
             
-            # Adicionar linha de referência do IPCA se aplicável
-            if include_ipca:
-                # Calcular evolução da inflação
-                months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
-                monthly_inflation = (1 + simulator.inflation_annual) ** (1/12) - 1
-                inflation_values = [monthly_investment * (1 + monthly_inflation) ** i for i in range(months)]
-                
-                # Ajustar datas para a linha de inflação
-                inflation_dates = [start_date + timedelta(days=30*i) for i in range(months)]
-                
-                fig.add_trace(go.Scatter(
-                    x=inflation_dates,
-                    y=inflation_values,
-                    name="IPCA (Inflação)",
-                    line=dict(color="#9CA3AF", width=2, dash="dot"),
-                    mode='lines'
-                ))
-            
-            # Ajustar tema do gráfico conforme seleção
-            if st.session_state.theme == 'dark':
-                fig.update_layout(
-                    template="plotly_dark",
-                    title="Evolução do Patrimônio",
-                    xaxis_title="Data",
-                    yaxis_title="Valor (R$)",
-                    hovermode='x unified',
-                    height=500,
-                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)'
-                )
-            else:
-                fig.update_layout(
-                    template="plotly_white",
-                    title="Evolução do Patrimônio",
-                    xaxis_title="Data",
-                    yaxis_title="Valor (R$)",
-                    hovermode='x unified',
-                    height=500,
-                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-                )
+            st.download_button(
+                label="🗂️ Exportar Históricos",
+                data=history_export,
+                file_name=f"historicos_simulacao.{history_format.lower()}",
+                mime="application/vnd.apache.parquet" if history_format == 'Parquet' else "text/csv",
+                use_container_width=True
+            )
+        
+        with tab2:
+            st.header("📈 Evolução dos Investimentos")
             
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(simulation_graph.get('evolution_figure'), use_container_width=True)
             
             # Gráfico de composição do patrimônio
             st.subheader("📊 Composição do Patrimônio")
-            
-            fig_pie = go.Figure(data=[go.Pie(
-                labels=[labels[key] for key in results.keys()],
-                values=[results[key]['final_balance'] for key in results.keys()],
-                hole=.4,
-                marker_colors=[colors[key] for key in results.keys()]
-            )])
-            
-            if st.session_state.theme == 'dark':
-                fig_pie.update_layout(template="plotly_dark")
-            else:
-                fig_pie.update_layout(template="plotly_white")
-                
-            st.plotly_chart(fig_pie, use_container_width=True)
+            st.plotly_chart(simulation_graph.get('composition_figure'), use_container_width=True)
         
         with tab3:
             # Análise de objetivo
             st.header("🎯 Análise Específica para o Objetivo Financeiro")
-            st.info("Esta análise calcula quanto tempo levaria para atingir seu objetivo e quais aportes seriam necessários.")
+            st.info("Esta análise calcula quanto tempo levaria para atingir seu objetivo e quais aportes seriam necessários, "
+                    "considerando impostos, inflação e o cenário econômico escolhidos.")
             
             total_months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
             
             labels = {'selic': 'Tesouro Selic', 'cdb': 'CDB', 'fii': 'FIIs', 'stocks': 'Ações', 'treasury': 'Tesouro'}
             
-            for key, monthly_rate in monthly_rates.items():
-                # Calcular cenário para o objetivo
-                goal_scenario = simulator.calculate_goal_scenario(
-                    monthly_rate, financial_goal, monthly_investment, total_months
-                )
-                
-                # Exibir resultados
-                with st.expander(f"Análise para {labels[key]}"):
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        if goal_scenario['time_with_current'] == float('inf'):
-                            st.metric("Tempo para objetivo com aportes atuais", "Não atingível")
-                        else:
-                            st.metric(
-                                "Tempo para objetivo com aportes atuais", 
-                                f"{goal_scenario['time_with_current']:.1f} meses", 
-                                f"{(goal_scenario['time_with_current']/12):.1f} anos"
-                            )
-                        
-                        st.metric(
-                            "Aporte mensal necessário para o objetivo", 
-                            f"R$ {goal_scenario['required_monthly']:,.2f}"
-                        )
-                    
-                    with col2:
-                        st.metric(
-                            "Patrimônio projetado com aportes atuais", 
-                            f"R$ {results[key]['final_balance']:,.2f}"
-                        )
-                        
-                        if goal_scenario['additional_monthly'] > 0:
-                            st.metric(
-                                "Aporte adicional mensal necessário", 
-                                f"R$ {goal_scenario['additional_monthly']:,.2f}"
-                            )
-                        else:
-                            st.metric("Aporte adicional mensal necessário", "R$ 0,00")
-                    
-                    st.subheader("Aportes periódicos necessários para o objetivo:")
-                    col3, col4, col5, col6 = st.columns(4)
-                    
-                    with col3:
-                        st.metric("Mensal", f"R$ {goal_scenario['required_monthly']:,.2f}")
-                    with col4:
-                        st.metric("Trimestral", f"R$ {goal_scenario['required_monthly'] * 3:,.2f}")
-                    with col5:
-                        st.metric("Semestral", f"R$ {goal_scenario['required_monthly'] * 6:,.2f}")
-                    with col6:
-                        st.metric("Anual", f"R$ {goal_scenario['required_monthly'] * 12:,.2f}")
-                    
-                    # Verificar se o objetivo será atingido
-                    if results[key]['final_balance'] >= financial_goal:
-                        st.success(f"🎉 Parabéns! Você atingirá seu objetivo de R$ {financial_goal:,.2f} com {labels[key]}")
-                    else:
-                        st.warning(f"⚠️ Com os aportes atuais, você não atingirá o objetivo de R$ {financial_goal:,.2f} com {labels[key]}")
-                        
-                        if goal_scenario['additional_monthly'] > 0:
-                            st.info(
-                                f"💡 Para atingir seu objetivo no período desejado, você precisaria aportar "
-                                f"**R$ {goal_scenario['additional_monthly']:,.2f} adicionais por mês** "
-                                f"em {labels[key]}"
-                            )
+            # Planos com o mesmo total anual: o atual e cada frequência isolada
+            yearly_total = monthly_investment * 12 + quarterly_investment * 4 + annual_investment
+            plans = {'Plano atual': contribution_amounts if yearly_total > 0 else {'monthly': 1.0}}
+            if yearly_total > 0:
+                for plan_name, plan in [('Só mensal', {'monthly': yearly_total / 12}),
+                                        ('Só trimestral', {'quarterly': yearly_total / 4}),
+                                        ('Só anual', {'annually': yearly_total})]:
+                    if {freq: value for freq, value in contribution_amounts.items() if value > 0} != plan:
+                        plans[plan_name] = plan
+            
+            # Grade de objetivos x prazos, incluindo o objetivo e o prazo escolhidos
+            goal_reference = max(financial_goal, 1000.0)
+            goals = np.union1d(np.linspace(goal_reference * 0.1, goal_reference * 2, 60), [financial_goal])
+            horizons = np.union1d(np.linspace(6, max(total_months * 2, 120), 60).astype(int), [max(total_months, 1)])
+            goal_grid = simulator.solve_goal_grid(
+                goals, horizons, list(plans.values()), list(monthly_rates), start_date,
+                include_inflation=include_ipca, include_taxes=include_taxes,
+                selected_treasury=selected_treasury, scenario=economic_scenario
+            )
+            goal_index = int(np.searchsorted(goals, financial_goal))
+            horizon_index = int(np.searchsorted(horizons, max(total_months, 1)))
+            
+            def format_months(months):
+                if not np.isfinite(months):
+                    return "Não atingível"
+                return f"{months:.1f} meses ({months / 12:.1f} anos)"
+            
+            goal_rows = []
+            for i, key in enumerate(goal_grid['modalities']):
+                required_monthly = goal_grid['required_monthly'][i, 0, goal_index, horizon_index]
+                time_with_current = goal_grid['time_to_goal'][i, 0, goal_index] if yearly_total > 0 else float('inf')
+                row = {
+                    'Modalidade': labels[key],
+                    'Tempo com aportes atuais': format_months(time_with_current),
+                    'Aporte mensal necessário': f"R$ {required_monthly:,.2f}",
+                    'Aporte adicional mensal': f"R$ {max(0, required_monthly - yearly_total / 12):,.2f}",
+                    'Atinge Objetivo': '✅' if time_with_current <= total_months else '❌'
+                }
+                for j, plan_name in enumerate(plans):
+                    if j > 0:
+                        row[f'Tempo ({plan_name.lower()})'] = format_months(goal_grid['time_to_goal'][i, j, goal_index])
+                goal_rows.append(row)
+            
+            st.dataframe(pd.DataFrame(goal_rows), use_container_width=True)
+            st.caption("Aportes mensais equivalentes (total anual / 12) para o plano atual no prazo escolhido. "
+                       "Os demais planos distribuem o mesmo total anual em uma única frequência.")
+            
+            # Mapa de calor: aporte necessário por objetivo e prazo, uma modalidade por vez
+            st.subheader("🗺️ Aporte mensal necessário por objetivo e prazo")
+            
+            fig_goal = go.Figure()
+            for i, key in enumerate(goal_grid['modalities']):
+                required = goal_grid['required_monthly'][i, 0]
+                finite = required[np.isfinite(required)]
+                fig_goal.add_trace(go.Heatmap(
+                    x=horizons,
+                    y=goals,
+                    z=np.where(np.isfinite(required), required, np.nan),
+                    zmin=0,
+                    zmax=float(np.percentile(finite, 95)) if finite.size else None,
+                    colorscale='Viridis',
+                    colorbar=dict(title="R$/mês"),
+                    name=labels[key],
+                    visible=(i == 0),
+                    hovertemplate="Prazo: %{x} meses<br>Objetivo: R$ %{y:,.2f}<br>Aporte: R$ %{z:,.2f}<extra></extra>"
+                ))
+            fig_goal.add_trace(go.Scatter(
+                x=[max(total_months, 1)],
+                y=[financial_goal],
+                mode='markers',
+                marker=dict(color='orange', size=14, symbol='x'),
+                name="Seu objetivo"
+            ))
+            
+            modality_count = len(goal_grid['modalities'])
+            fig_goal.update_layout(
+                template="plotly_dark" if st.session_state.theme == 'dark' else "plotly_white",
+                xaxis_title="Prazo (meses)",
+                yaxis_title="Objetivo (R$)",
+                height=500,
+                showlegend=False,
+                updatemenus=[dict(
+                    buttons=[
+                        dict(label=labels[key], method='update',
+                             args=[{'visible': [j == i for j in range(modality_count)] + [True]}])
+                        for i, key in enumerate(goal_grid['modalities'])
+                    ],
+                    x=0, xanchor='left', y=1.15, yanchor='top'
+                )]
+            )
+            if st.session_state.theme == 'dark':
+                fig_goal.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)')
+            
+            st.plotly_chart(fig_goal, use_container_width=True)
         
         with tab4:
             # Tabela detalhada
@@ -2162,17 +1754,12 @@ def main():
         with tab5:
             st.header("⚠️ Análise de Risco")
             
-            # Calcular métricas de risco para cada modalidade
-            risk_data = {}
-            for key, result in results.items():
-                if 'history' in result:
-                    risk_metrics = simulator.calculate_risk_metrics(result['history'])
-                    risk_data[key] = risk_metrics
+            # Métricas de risco de cada modalidade (só dependem dos históricos)
+            risk_data = simulation_graph.get('risk_metrics')
             
             # Exibir métricas de risco
             if risk_data:
                 cols = st.columns(len(risk_data))
-                colors = ['#3B82F6', '#60A5FA', '#10B981', '#EF4444', '#A78BFA']
                 
                 for i, (key, metrics) in enumerate(risk_data.items()):
                     with cols[i]:
@@ -2186,78 +1773,49 @@ def main():
                 # Gráfico de drawdown
                 st.subheader("📉 Drawdown Máximo por Modalidade")
                 
-                fig_drawdown = go.Figure()
-                
-                modalities = [labels[key] for key in risk_data.keys()]
-                drawdowns = [risk_data[key]['max_drawdown'] for key in risk_data.keys()]
-                
-                fig_drawdown.add_trace(go.Bar(
-                    x=modalities,
-                    y=drawdowns,
-                    marker_color=colors[:len(modalities)]
-                ))
-                
-                if st.session_state.theme == 'dark':
-                    fig_drawdown.update_layout(
-                        template="plotly_dark",
-                        title="Drawdown Máximo por Modalidade",
-                        xaxis_title="Modalidade",
-                        yaxis_title="Drawdown Máximo (%)",
-                        height=400
-                    )
-                else:
-                    fig_drawdown.update_layout(
-                        template="plotly_white",
-                        title="Drawdown Máximo por Modalidade",
-                        xaxis_title="Modalidade",
-                        yaxis_title="Drawdown Máximo (%)",
-                        height=400
-                    )
-                
-                st.plotly_chart(fig_drawdown, use_container_width=True)
+                st.plotly_chart(simulation_graph.get('drawdown_figure'), use_container_width=True)
             
             # Análise de cenários
             st.subheader("🌍 Análise de Cenários Econômicos")
             
-            scenario_results = {}
-            base_key = list(results.keys())[0] if results else None
+            scenario_fig = simulation_graph.get('scenario_figure')
+            if scenario_fig is not None:
+                st.plotly_chart(scenario_fig, use_container_width=True)
             
-            if base_key:
-                for scenario in simulator.economic_scenarios.keys():
-                    scenario_results[scenario] = simulator.simulate_economic_scenario(
-                        scenario, results[base_key]
-                    )
-                
-                scenario_fig = go.Figure()
-                
-                scenarios = list(scenario_results.keys())
-                scenario_names = [f"{s.capitalize()}\n({simulator.economic_scenarios[s]['descricao']})" for s in scenarios]
-                final_balances = [scenario_results[s]['final_balance'] for s in scenarios]
-                
-                scenario_fig.add_trace(go.Bar(
-                    x=scenario_names,
-                    y=final_balances,
-                    marker_color=['#10B981', '#3B82F6', '#F59E0B', '#EF4444']
-                ))
+            # Simulação Monte Carlo para renda variável
+            monte_carlo_keys = [key for key in ['fii', 'stocks'] if key in results]
+            if monte_carlo and monte_carlo_keys:
+                st.subheader("🎲 Simulação Monte Carlo")
+                st.info(f"💡 **{monte_carlo_paths:,} cenários** de retornos mensais aleatórios, com volatilidade calibrada pelos ativos.")
                 
-                if st.session_state.theme == 'dark':
-                    scenario_fig.update_layout(
-                        template="plotly_dark",
-                        title="Impacto dos Cenários Econômicos no Patrimônio Final",
-                        xaxis_title="Cenário Econômico",
-                        yaxis_title="Patrimônio Final (R$)",
-                        height=400
-                    )
-                else:
-                    scenario_fig.update_layout(
-                        template="plotly_white",
-                        title="Impacto dos Cenários Econômicos no Patrimônio Final",
-                        xaxis_title="Cenário Econômico",
-                        yaxis_title="Patrimônio Final (R$)",
-                        height=400
+                for key in monte_carlo_keys:
+                    # Seed derivada das entradas: os mesmos parâmetros sorteiam os mesmos caminhos a
+                    # cada rerun, e o hash serve de chave para a figura
+                    monte_carlo_key = canonical_key('monte_carlo', contribution_amounts, start_date, end_date, key,
+                                                    financial_goal, monte_carlo_paths, include_taxes,
+                                                    simulator.rates_version())
+                    monte_carlo_result = simulator.simulate_monte_carlo(
+                        contribution_amounts, 'monthly', start_date, end_date, key,
+                        financial_goal=financial_goal, n_paths=monte_carlo_paths, include_taxes=include_taxes,
+                        seed=int(monte_carlo_key[:8], 16), executor=get_simulation_executor()
                     )
-                
-                st.plotly_chart(scenario_fig, use_container_width=True)
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric(f"{labels[key]} - Mediana (P50)", f"R$ {monte_carlo_result['final_percentiles']['p50']:,.2f}")
+                    with col2:
+                        st.metric("Faixa P5 - P95",
+                                  f"R$ {monte_carlo_result['final_percentiles']['p5']:,.0f} - R$ {monte_carlo_result['final_percentiles']['p95']:,.0f}")
+                    with col3:
+                        st.metric("Probabilidade de atingir o objetivo", f"{monte_carlo_result['probability_goal'] * 100:.1f}%"
+                                  if monte_carlo_result['probability_goal'] is not None else "-")
+                    
+                    fan_fig = get_figure_factory().get('monte_carlo', monte_carlo_key, st.session_state.theme,
+                                                       monte_carlo_result, labels[key], financial_goal)
+                    
+                    st.plotly_chart(fan_fig, use_container_width=True)
+        
+        # Nós do grafo refeitos neste rerun (simulações e gráficos)
+        st.sidebar.caption("Etapas recalculadas: " + (", ".join(simulation_graph.recomputed) or "nenhuma"))
     
     else:
         # Página inicial quando não há simulação
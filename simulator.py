@@ -0,0 +1,893 @@
+"""Núcleo de cálculo do SecureInvest: cronogramas de aportes, simulações, impostos e metas
+
+Depende apenas de NumPy e pandas (e dos módulos locais de cache, paralelismo e dados de
+mercado); interface (Streamlit, Plotly) e bibliotecas de rede não são importadas aqui.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+from market_data import asset_table_entry, search_asset, search_assets
+from parallel import SimulationExecutor, monte_carlo_kernel
+from result_cache import cached_simulation, canonical_key
+from snapshot import default_snapshot, RATE_FIELDS
+
+
+# Meses em que cada frequência de aporte é realizada (None = todos os meses)
+CONTRIBUTION_MONTHS = {
+    'monthly': None,
+    'quarterly': (1, 4, 7, 10),
+    'annually': (1,)
+}
+
+
+class ContributionSchedule:
+    """Cronograma de aportes armazenado em arrays NumPy (datas, valores e meses decorridos)"""
+    __slots__ = ('dates', 'amounts', 'elapsed_months')
+    
+    def __init__(self, dates, amounts, elapsed_months):
+        self.dates = dates
+        self.amounts = amounts
+        self.elapsed_months = elapsed_months
+        # O cronograma é compartilhado entre modalidades, então os arrays são somente leitura
+        for array in (dates, amounts, elapsed_months):
+            array.flags.writeable = False
+    
+    def __len__(self):
+        return len(self.amounts)
+    
+    @property
+    def total(self):
+        """Total aportado no período"""
+        return float(self.amounts.sum())
+    
+    @classmethod
+    def build(cls, amount, frequency, start_date, end_date):
+        """Monta (ou reaproveita) o cronograma para um valor único ou um dicionário {frequência: valor}"""
+        if isinstance(amount, dict):
+            amounts = tuple(sorted((freq, float(value)) for freq, value in amount.items()))
+        else:
+            amounts = ((frequency, float(amount)),)
+        
+        for freq, _ in amounts:
+            if freq not in CONTRIBUTION_MONTHS:
+                raise ValueError(f"Frequência de aporte desconhecida: {freq}")
+        
+        return _build_contribution_schedule(amounts, start_date, end_date)
+
+
+def _contribution_steps(start_date, end_date):
+    """Quantidade de passos de 30 dias do cronograma entre start_date e end_date"""
+    return (end_date - start_date).days // 30 + 1 if end_date >= start_date else 0
+
+
+@functools.lru_cache(maxsize=128)
+def _build_contribution_schedule(amounts, start_date, end_date):
+    """Gera o cronograma em uma única passada vetorizada (passos de 30 dias)"""
+    n_steps = _contribution_steps(start_date, end_date)
+    steps = np.arange(n_steps, dtype=np.int32)
+    dates = np.datetime64(start_date, 'D') + steps.astype('timedelta64[D]') * 30
+    months_of_year = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    
+    values = np.zeros(n_steps, dtype=np.float64)
+    included = np.zeros(n_steps, dtype=bool)
+    for frequency, amount in amounts:
+        allowed_months = CONTRIBUTION_MONTHS[frequency]
+        if allowed_months is None:
+            mask = np.ones(n_steps, dtype=bool)
+        else:
+            mask = np.isin(months_of_year, allowed_months)
+        values += np.where(mask, amount, 0.0)
+        included |= mask
+    
+    return ContributionSchedule(dates[included], values[included], steps[included])
+
+
+def _uniform_monthly_amount(amount, frequency):
+    """Valor do aporte se o cronograma for mensal e constante, ou None se for irregular"""
+    if isinstance(amount, dict):
+        if any(freq not in CONTRIBUTION_MONTHS or (freq != 'monthly' and float(value) != 0)
+               for freq, value in amount.items()):
+            return None
+        return float(amount.get('monthly', 0))
+    return float(amount) if frequency == 'monthly' else None
+
+
+def _annuity_totals(amount, n_steps, months, appreciation, dividend_rates):
+    """Saldo, dividendos e total aportado de aportes mensais constantes em O(1) (fórmula de anuidade)
+    
+    Equivale a somar o cronograma com _accumulate: o aporte do passo k rende por months - k
+    meses e só entra no saldo se esse prazo for positivo. Aceita taxas escalares ou arrays.
+    """
+    rate = np.asarray(appreciation, dtype=np.float64)
+    dividend_rates = np.asarray(dividend_rates, dtype=np.float64)
+    paying = max(min(n_steps, months), 0)  # aportes que ainda rendem até a data final
+    
+    # Soma geométrica (1+r)^(months-paying+1) + ... + (1+r)^months, estável para r próximo de zero
+    safe_rate = np.where(rate == 0, 1.0, rate)
+    geometric = np.where(rate == 0, paying, np.expm1(paying * np.log1p(rate)) / safe_rate)
+    balance = amount * (1 + rate) ** (months - paying + 1) * geometric
+    # Dividendos lineares (não reinvestidos): soma de months - k para os aportes que rendem
+    dividends = amount * dividend_rates * (paying * months - paying * (paying - 1) / 2)
+    return balance, dividends, amount * n_steps
+
+
+# Percentis das faixas da simulação Monte Carlo
+MONTE_CARLO_PERCENTILES = (5, 50, 95)
+
+
+# Volatilidade anual padrão para ativos sem histórico de volatilidade
+DEFAULT_VOLATILITY = {'fii': 0.15, 'stocks': 0.25}
+
+
+# Classe principal do simulador
+class SecureInvestSimulator:
+    def __init__(self, result_cache=None, snapshot=None):
+        # Cache opcional de resultados (compartilhado entre sessões quando fornecido)
+        self.result_cache = result_cache
+        
+        # Taxas de referência (podem ser atualizadas)
+        self.selic_annual = 0.1175  # 11.75% ao ano
+        self.cdb_monthly = 0.01     # 1% ao mês
+        self.inflation_annual = 0.045  # 4.5% ao ano (IPCA)
+        
+        # Novos parâmetros para impostos e taxas
+        self.income_tax_rates = {
+            'LCI_LCA': 0.00,  # Isentos
+            'tesouro_direto': 0.15,  # 15% fixo
+            'fundos_imobiliarios': 0.20,  # 20% sobre dividendos
+            'acoes': 0.15,  # 15% sobre ganhos de capital
+            'cdb': 0.175,  # 17.5% (varia com tempo)
+        }
+        
+        self.brokerage_fee = 0.005  # 0.5% por operação
+        self.administration_fee = 0.01  # 1% ao ano
+        
+        # Dados históricos de FIIs e ações (valores ilustrativos)
+        self.fii_data = {
+            'KNRI11': {'dividend_yield': 0.085, 'annual_return': 0.12, 'volatility': 0.14, 'nome': 'Kinea Renda Imobiliária', 'segmento': 'Títulos e Val. Mob.'},
+            'HGLG11': {'dividend_yield': 0.068, 'annual_return': 0.10, 'volatility': 0.16, 'nome': 'CSHG Logística', 'segmento': 'Logística'},
+            'XPLG11': {'dividend_yield': 0.072, 'annual_return': 0.11, 'volatility': 0.18, 'nome': 'XP Log', 'segmento': 'Logística'},
+            'VRTA11': {'dividend_yield': 0.078, 'annual_return': 0.13, 'volatility': 0.12, 'nome': 'Vectis Renda Residencial', 'segmento': 'Residencial'},
+            'BCFF11': {'dividend_yield': 0.082, 'annual_return': 0.14, 'volatility': 0.17, 'nome': 'BTG Pactual Fundo de Fundos', 'segmento': 'Fundo de Fundos'}
+        }
+        
+        self.stock_data = {
+            'ITSA4': {'dividend_yield': 0.065, 'annual_return': 0.09, 'volatility': 0.24, 'nome': 'Itaúsa', 'setor': 'Holdings'},
+            'BBAS3': {'dividend_yield': 0.058, 'annual_return': 0.11, 'volatility': 0.32, 'nome': 'Banco do Brasil', 'setor': 'Bancos'},
+            'PETR4': {'dividend_yield': 0.072, 'annual_return': 0.15, 'volatility': 0.38, 'nome': 'Petrobras', 'setor': 'Petróleo e Gás'},
+            'VALE3': {'dividend_yield': 0.084, 'annual_return': 0.13, 'volatility': 0.33, 'nome': 'Vale', 'setor': 'Mineração'},
+            'WEGE3': {'dividend_yield': 0.032, 'annual_return': 0.18, 'volatility': 0.29, 'nome': 'WEG', 'setor': 'Equipamentos Elétricos'}
+        }
+        
+        # Dados para Tesouro Direto (valores ilustrativos)
+        self.treasury_data = {
+            'Tesouro Selic': {'annual_return': 0.1175, 'ipca_linked': False, 'nome': 'Tesouro Selic'},
+            'Tesouro IPCA+ 2026': {'annual_return': 0.065, 'ipca_linked': True, 'nome': 'Tesouro IPCA+ 2026'},
+            'Tesouro IPCA+ 2035': {'annual_return': 0.06, 'ipca_linked': True, 'nome': 'Tesouro IPCA+ 2035'},
+            'Tesouro Prefixado 2026': {'annual_return': 0.12, 'ipca_linked': False, 'nome': 'Tesouro Prefixado 2026'},
+            'Tesouro Prefixado 2029': {'annual_return': 0.125, 'ipca_linked': False, 'nome': 'Tesouro Prefixado 2029'}
+        }
+        
+        # Dicionário para ativos pesquisados
+        self.searched_assets = {'fii': {}, 'stocks': {}, 'treasury': {}}
+        
+        # Sistema de portfólios
+        self.portfolios = {}
+        
+        # Cenários econômicos
+        self.economic_scenarios = {
+            'otimista': {'fator': 1.2, 'descricao': 'Crescimento econômico acelerado'},
+            'neutro': {'fator': 1.0, 'descricao': 'Cenário base de projeção'},
+            'pessimista': {'fator': 0.8, 'descricao': 'Retração econômica moderada'},
+            'crise': {'fator': 0.6, 'descricao': 'Cenário de crise econômica'}
+        }
+        
+        # Snapshot offline de dados de mercado (parâmetro ou variável SECUREINVEST_SNAPSHOT)
+        self.snapshot = None
+        snapshot = snapshot if snapshot is not None else default_snapshot()
+        if snapshot is not None:
+            self.load_snapshot(snapshot)
+    
+    def load_snapshot(self, snapshot):
+        """Aplica as taxas e os ativos de um snapshot de mercado sobre os valores padrão"""
+        for field in RATE_FIELDS:
+            if field not in snapshot.rates:
+                continue
+            value = snapshot.rates[field]
+            if isinstance(value, dict):
+                value = {**getattr(self, field), **value}
+            setattr(self, field, value)
+        
+        self.fii_data.update(snapshot.assets['fii'])
+        self.stock_data.update(snapshot.assets['stocks'])
+        self.treasury_data.update(snapshot.assets['treasury'])
+        self.snapshot = snapshot
+    
+    def search_and_add_asset(self, ticker, asset_type, strict=False):
+        """Busca e adiciona um ativo usando a API
+        
+        Erros de busca voltam no resultado (success False e 'error') ou, com strict,
+        como AssetLookupError.
+        """
+        if ticker in self.searched_assets[asset_type]:
+            return self.searched_assets[asset_type][ticker]
+        
+        asset_info = search_asset(ticker, asset_type, strict=strict)
+        self._register_asset(ticker, asset_type, asset_info)
+        return asset_info
+    
+    def search_and_add_assets(self, tickers, asset_type):
+        """Busca e adiciona vários ativos de uma vez (ex.: uma lista de acompanhamento colada)
+        
+        Retorna {ticker: dados do ativo}; o campo 'success' indica se a busca de cada um funcionou.
+        """
+        known = {ticker: self.searched_assets[asset_type][ticker]
+                 for ticker in tickers if ticker in self.searched_assets[asset_type]}
+        found = search_assets([ticker for ticker in tickers if ticker not in known], asset_type)
+        for ticker, asset_info in found.items():
+            self._register_asset(ticker, asset_type, asset_info)
+        return {ticker: known[ticker] if ticker in known else found[ticker] for ticker in tickers}
+    
+    def _register_asset(self, ticker, asset_type, asset_info):
+        """Adiciona aos ativos pesquisados os dados de uma busca bem-sucedida"""
+        if asset_info['success']:
+            self.searched_assets[asset_type][ticker] = asset_table_entry(asset_type, asset_info)
+    
+    def rates_version(self):
+        """Versão (hash) das tabelas de taxas e ativos usadas nos cálculos"""
+        return canonical_key(
+            self.selic_annual, self.cdb_monthly, self.inflation_annual,
+            self.income_tax_rates, self.fii_data, self.stock_data,
+            self.treasury_data, self.searched_assets
+        )
+    
+    def get_asset_data(self, asset_type):
+        """Retorna dados de ativos incluindo os pesquisados"""
+        if asset_type == 'fii':
+            return {**self.fii_data, **self.searched_assets['fii']}
+        elif asset_type == 'stocks':
+            return {**self.stock_data, **self.searched_assets['stocks']}
+        elif asset_type == 'treasury':
+            return {**self.treasury_data, **self.searched_assets['treasury']}
+        else:
+            return {}
+    
+    @cached_simulation
+    def calculate_fixed_income(self, amount, frequency, start_date, end_date, investment_type, include_inflation=False, include_taxes=False, include_history=True):
+        """Calcula rendimentos da renda fixa"""
+        rates = self._fixed_income_rates(investment_type, include_inflation)
+        return self._simulate(rates, amount, frequency, start_date, end_date, include_taxes, include_history)
+    
+    @cached_simulation
+    def calculate_treasury(self, amount, frequency, start_date, end_date, selected_treasury, include_inflation=False, include_taxes=False, include_history=True):
+        """Calcula rendimentos do Tesouro Direto"""
+        rates = self._treasury_rates(selected_treasury, include_inflation)
+        return self._simulate(rates, amount, frequency, start_date, end_date, include_taxes, include_history)
+    
+    @cached_simulation
+    def calculate_variable_income(self, amount, frequency, start_date, end_date, asset_type, selected_assets=None, include_inflation=False, include_taxes=False, include_history=True):
+        """Calcula rendimentos da renda variável"""
+        rates = self._variable_income_rates(asset_type, selected_assets, include_inflation)
+        return self._simulate(rates, amount, frequency, start_date, end_date, include_taxes, include_history)
+    
+    @cached_simulation
+    def simulate_batch(self, params, modalities, include_inflation=(False, True), include_history=True):
+        """Simula várias modalidades, nominais e reais, em uma única passada vetorizada
+        
+        params: dicionário com amount, frequency, start_date, end_date e, opcionalmente,
+        include_taxes, selected_assets ({modalidade: [ativos]}) e selected_treasury.
+        Retorna {include_inflation: {modalidade: resultado}}. Sem include_history, os
+        resultados vêm com 'history' None (evita montar os DataFrames mês a mês).
+        """
+        start_date = params['start_date']
+        end_date = params['end_date']
+        months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
+        selected_assets = params.get('selected_assets') or {}
+        
+        # Matriz de taxas: uma linha por opção de inflação, uma coluna por modalidade
+        rates = [
+            [self._modality_rates(modality, inflation, selected_assets.get(modality), params.get('selected_treasury'))
+             for modality in modalities]
+            for inflation in include_inflation
+        ]
+        appreciation = np.array([[rate['appreciation'] for rate in row] for row in rates], dtype=np.float64)
+        dividend_rates = np.array([[rate['dividends'] for rate in row] for row in rates], dtype=np.float64)
+        
+        include_taxes = params.get('include_taxes', False)
+        frequency = params.get('frequency', 'monthly')
+        
+        # Aportes mensais constantes sem histórico: fórmula fechada para toda a matriz de taxas
+        monthly_amount = None if include_history else _uniform_monthly_amount(params['amount'], frequency)
+        if monthly_amount is not None:
+            balances, dividends, total = _annuity_totals(
+                monthly_amount, _contribution_steps(start_date, end_date), months, appreciation, dividend_rates
+            )
+            return {
+                inflation: {
+                    modality: self._result_from_totals(
+                        rates[i][j], months, total, float(balances[i, j]), float(dividends[i, j]), include_taxes
+                    )
+                    for j, modality in enumerate(modalities)
+                }
+                for i, inflation in enumerate(include_inflation)
+            }
+        
+        schedule = self._calculate_contributions(params['amount'], frequency, start_date, end_date)
+        balances, dividends = self._accumulate(schedule, months, appreciation, dividend_rates)
+        
+        return {
+            inflation: {
+                modality: self._build_result(
+                    rates[i][j], schedule, months, balances[i, j], dividends[i, j], include_taxes, include_history
+                )
+                for j, modality in enumerate(modalities)
+            }
+            for i, inflation in enumerate(include_inflation)
+        }
+    
+    def _modality_rates(self, modality, include_inflation, selected_assets=None, selected_treasury=None):
+        """Retorna as taxas mensais de uma modalidade (selic, cdb, fii, stocks ou treasury)"""
+        if modality in ['fii', 'stocks']:
+            return self._variable_income_rates(modality, selected_assets, include_inflation)
+        elif modality == 'treasury':
+            return self._treasury_rates(selected_treasury, include_inflation)
+        return self._fixed_income_rates(modality, include_inflation)
+    
+    def _fixed_income_rates(self, investment_type, include_inflation):
+        """Taxas mensais da renda fixa"""
+        if investment_type == 'selic':
+            monthly_rate = (1 + self.selic_annual) ** (1/12) - 1
+        elif investment_type == 'cdb':
+            monthly_rate = self.cdb_monthly
+        else:
+            monthly_rate = 0
+        
+        # Ajustar pela inflação se solicitado
+        if include_inflation:
+            monthly_inflation = (1 + self.inflation_annual) ** (1/12) - 1
+            monthly_rate = ((1 + monthly_rate) / (1 + monthly_inflation)) - 1
+        
+        return {
+            'kind': 'fixed_income',
+            'appreciation': monthly_rate,
+            'dividends': 0.0,
+            'monthly_rate': monthly_rate,
+            'tax_type': investment_type
+        }
+    
+    def _treasury_rates(self, selected_treasury, include_inflation):
+        """Taxas mensais do Tesouro Direto"""
+        # Obter dados do tesouro selecionado
+        treasury_data = self.get_asset_data('treasury')
+        if selected_treasury and selected_treasury in treasury_data:
+            annual_return = treasury_data[selected_treasury]['annual_return']
+            is_ipca_linked = treasury_data[selected_treasury]['ipca_linked']
+        else:
+            # Valores padrão se nenhum tesouro for selecionado
+            annual_return = 0.10
+            is_ipca_linked = False
+        
+        monthly_rate = (1 + annual_return) ** (1/12) - 1
+        
+        # Se for título indexado ao IPCA, o retorno já inclui a inflação
+        # Se não for indexado e queremos considerar a inflação, ajustamos
+        if include_inflation and not is_ipca_linked:
+            monthly_inflation = (1 + self.inflation_annual) ** (1/12) - 1
+            monthly_rate = ((1 + monthly_rate) / (1 + monthly_inflation)) - 1
+        
+        return {
+            'kind': 'treasury',
+            'appreciation': monthly_rate,
+            'dividends': 0.0,
+            'monthly_rate': monthly_rate,
+            'tax_type': 'tesouro_direto',
+            'is_ipca_linked': is_ipca_linked
+        }
+    
+    def _variable_income_rates(self, asset_type, selected_assets, include_inflation):
+        """Taxas mensais de valorização e dividendos da renda variável"""
+        if asset_type == 'fii':
+            data = self.get_asset_data('fii')
+            avg_dividend_yield = 0.075
+            avg_annual_return = 0.12
+            tax_type = 'fundos_imobiliarios'
+        else:  # stocks
+            data = self.get_asset_data('stocks')
+            avg_dividend_yield = 0.062
+            avg_annual_return = 0.13
+            tax_type = 'acoes'
+        
+        # Se ativos específicos foram selecionados, calcular média ponderada
+        if selected_assets:
+            valid_assets = [asset for asset in selected_assets if asset in data]
+            if valid_assets:
+                dividend_yield = np.mean([data[asset]['dividend_yield'] for asset in valid_assets])
+                annual_return = np.mean([data[asset]['annual_return'] for asset in valid_assets])
+            else:
+                dividend_yield = avg_dividend_yield
+                annual_return = avg_annual_return
+        else:
+            dividend_yield = avg_dividend_yield
+            annual_return = avg_annual_return
+        
+        monthly_appreciation = (1 + annual_return) ** (1/12) - 1
+        monthly_dividends = dividend_yield / 12
+        
+        # Ajustar pela inflação se solicitado
+        if include_inflation:
+            monthly_inflation = (1 + self.inflation_annual) ** (1/12) - 1
+            monthly_appreciation = ((1 + monthly_appreciation) / (1 + monthly_inflation)) - 1
+            monthly_dividends = monthly_dividends / (1 + monthly_inflation)
+        
+        return {
+            'kind': 'variable_income',
+            'appreciation': monthly_appreciation,
+            'dividends': monthly_dividends,
+            'monthly_rate': monthly_appreciation + monthly_dividends,
+            'tax_type': tax_type
+        }
+    
+    def _accumulate(self, schedule, months, appreciation, dividend_rates):
+        """Calcula saldos e dividendos acumulados para taxas escalares ou matrizes de taxas
+        
+        Retorna arrays com formato taxas.shape + (n_aportes,).
+        """
+        appreciation = np.asarray(appreciation, dtype=np.float64)[..., np.newaxis]
+        dividend_rates = np.asarray(dividend_rates, dtype=np.float64)[..., np.newaxis]
+        remaining_months = months - schedule.elapsed_months
+        
+        # Aportes sem tempo restante não rendem nem entram no saldo
+        valid = remaining_months > 0
+        growth = (1 + appreciation) ** np.where(valid, remaining_months, 0)
+        future_values = np.where(valid, schedule.amounts * growth, 0.0)
+        # Dividendos (não reinvestidos)
+        dividends = schedule.amounts * dividend_rates * np.maximum(remaining_months, 0)
+        
+        return np.cumsum(future_values, axis=-1), np.cumsum(dividends, axis=-1)
+    
+    def _simulate(self, rates, amount, frequency, start_date, end_date, include_taxes, include_history):
+        """Simula uma modalidade com as taxas informadas
+        
+        Sem histórico e com aportes mensais constantes usa a fórmula fechada (O(1)); nos demais
+        casos monta o cronograma e soma os aportes de forma vetorizada.
+        """
+        months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
+        monthly_amount = None if include_history else _uniform_monthly_amount(amount, frequency)
+        if monthly_amount is not None:
+            balance, dividends, total = _annuity_totals(
+                monthly_amount, _contribution_steps(start_date, end_date), months, rates['appreciation'], rates['dividends']
+            )
+            return self._result_from_totals(rates, months, total, float(balance), float(dividends), include_taxes)
+        
+        schedule = self._calculate_contributions(amount, frequency, start_date, end_date)
+        balances, dividends = self._accumulate(schedule, months, rates['appreciation'], rates['dividends'])
+        return self._build_result(rates, schedule, months, balances, dividends, include_taxes, include_history)
+    
+    def _build_result(self, rates, schedule, months, balances, dividends, include_taxes, include_history=True):
+        """Monta o dicionário de resultado a partir dos saldos acumulados"""
+        history = self._history_frame(rates, schedule, balances, dividends) if include_history else None
+        return self._result_from_totals(
+            rates, months, schedule.total,
+            float(balances[-1]) if len(balances) else 0,
+            float(dividends[-1]) if len(dividends) else 0,
+            include_taxes, history
+        )
+    
+    def _history_frame(self, rates, schedule, balances, dividends):
+        """Histórico aporte a aporte (saldo acumulado e dividendos ou valor aportado)"""
+        if rates['kind'] == 'variable_income':
+            return pd.DataFrame({
+                'date': schedule.dates,
+                'balance': balances + dividends,
+                'dividends': dividends
+            })
+        return pd.DataFrame({
+            'date': schedule.dates,
+            'balance': balances,
+            'contribution': schedule.amounts
+        })
+    
+    def _result_from_totals(self, rates, months, total_contributed, balance, dividends_accumulated, include_taxes, history=None):
+        """Monta o dicionário de resultado a partir do saldo, dividendos e total aportado"""
+        final_balance = balance + dividends_accumulated
+        earnings = final_balance - total_contributed
+        
+        # Calcular impostos se solicitado
+        taxes = 0
+        if include_taxes:
+            taxes = self.calculate_taxes(rates['tax_type'], earnings, months)
+            earnings -= taxes
+        
+        if rates['kind'] == 'variable_income':
+            return {
+                'final_balance': final_balance - taxes,
+                'total_contributed': total_contributed,
+                'earnings': earnings,
+                'taxes': taxes,
+                'dividends': dividends_accumulated,
+                'history': history,
+                'monthly_rate': rates['monthly_rate']
+            }
+        
+        result = {
+            'final_balance': final_balance - taxes,
+            'total_contributed': total_contributed,
+            'earnings': earnings,
+            'taxes': taxes,
+            'earnings_percentage': (earnings / total_contributed) * 100 if total_contributed > 0 else 0,
+            'history': history,
+            'monthly_rate': rates['monthly_rate']
+        }
+        if rates['kind'] == 'treasury':
+            result['is_ipca_linked'] = rates['is_ipca_linked']
+        return result
+    
+    def _calculate_contributions(self, amount, frequency, start_date, end_date):
+        """Retorna o cronograma de aportes do período (compartilhado entre modalidades)"""
+        return ContributionSchedule.build(amount, frequency, start_date, end_date)
+    
+    def calculate_taxes(self, investment_type, earnings, months):
+        """Calcula impostos sobre os rendimentos"""
+        if investment_type in self.income_tax_rates:
+            return earnings * float(self._income_tax_rate(investment_type, months))
+        return 0
+    
+    def _income_tax_rate(self, investment_type, months):
+        """Alíquota de IR pelo prazo em meses (aceita arrays); 0 para modalidades isentas"""
+        months = np.asarray(months)
+        if investment_type not in self.income_tax_rates:
+            return np.zeros(months.shape)
+        
+        # Ajustar taxa para CDB baseado no tempo (regressivo)
+        if investment_type == 'cdb':
+            return np.select([months <= 6, months <= 12, months <= 24], [0.225, 0.20, 0.175], 0.15)
+        return np.full(months.shape, float(self.income_tax_rates[investment_type]))
+    
+    def calculate_fees(self, total_contributed, months):
+        """Calcula taxas de administração"""
+        monthly_fee = self.administration_fee / 12
+        return total_contributed * monthly_fee * months
+    
+    def calculate_time_to_goal(self, monthly_investment, monthly_rate, goal_amount):
+        """Calcula o tempo necessário para atingir um objetivo"""
+        if monthly_rate <= 0 or monthly_investment <= 0:
+            return float('inf')
+        
+        try:
+            months_needed = np.log(1 + (goal_amount * monthly_rate) / monthly_investment) / np.log(1 + monthly_rate)
+            return max(0, months_needed)
+        except:
+            return float('inf')
+    
+    def calculate_required_contribution(self, monthly_rate, goal_amount, months_available):
+        """Calcula o aporte necessário para atingir o objetivo no tempo especificado"""
+        if months_available <= 0:
+            raise ValueError("o prazo para atingir o objetivo deve ser de ao menos um mês")
+        if monthly_rate <= 0:
+            return goal_amount / months_available
+        
+        try:
+            required_monthly = (goal_amount * monthly_rate) / ((1 + monthly_rate) ** months_available - 1)
+            return max(0, required_monthly)
+        except:
+            return float('inf')
+    
+    def calculate_goal_scenario(self, monthly_rate, goal_amount, current_monthly_investment, total_months):
+        """Calcula cenário completo para atingir o objetivo"""
+        # Tempo necessário com aportes atuais
+        time_with_current = self.calculate_time_to_goal(
+            current_monthly_investment, monthly_rate, goal_amount
+        )
+        
+        # Aporte necessário para atingir no período definido
+        required_monthly = self.calculate_required_contribution(
+            monthly_rate, goal_amount, total_months
+        )
+        
+        # Aporte adicional necessário
+        additional_monthly = max(0, required_monthly - current_monthly_investment)
+        
+        return {
+            'time_with_current': time_with_current,
+            'required_monthly': required_monthly,
+            'additional_monthly': additional_monthly,
+            'additional_quarterly': additional_monthly * 3,
+            'additional_semiannual': additional_monthly * 6,
+            'additional_annual': additional_monthly * 12
+        }
+    
+    @cached_simulation
+    def solve_goal_grid(self, goals, horizons, mixes, modalities, start_date, include_inflation=False,
+                        include_taxes=False, selected_assets=None, selected_treasury=None, scenario=None,
+                        max_months=600):
+        """Resolve o objetivo financeiro em uma grade (modalidade x plano de aportes x objetivo x prazo)
+        
+        goals: valores-alvo (R$); horizons: prazos em meses a partir de start_date; mixes: planos
+        de aportes {frequência: valor}, como o amount das simulações. Considera impostos, inflação
+        e o fator do cenário econômico, com a mesma semântica do cronograma de aportes.
+        
+        O saldo líquido é proporcional à escala do plano (o IR incide sobre a fração de rendimentos),
+        então o aporte necessário sai direto da raiz da equação linear. O tempo até o objetivo é a
+        primeira raiz de saldo(prazo) = objetivo na grade mensal até max_months, interpolada entre
+        os meses vizinhos (inf se o objetivo não é atingido).
+        
+        Retorna um dicionário com os eixos e os arrays:
+            required_scale   (modalidade, plano, objetivo, prazo): multiplicador do plano
+            required_monthly (modalidade, plano, objetivo, prazo): aporte mensal equivalente
+            time_to_goal     (modalidade, plano, objetivo): meses com o plano como está
+        """
+        goals = np.asarray(goals, dtype=np.float64)
+        horizons = np.asarray(horizons, dtype=np.int64)
+        selected_assets = selected_assets or {}
+        last_month = int(max(max_months, horizons.max(initial=0)))
+        months = np.arange(last_month + 1)
+        
+        # Passos de 30 dias até cada prazo (mesma data do mês, limitada ao último dia)
+        first_month = np.datetime64(start_date, 'M')
+        month_starts = (first_month + months).astype('datetime64[D]')
+        month_lengths = ((first_month + months + 1).astype('datetime64[D]') - month_starts).astype(np.int64)
+        end_dates = month_starts + np.minimum(start_date.day, month_lengths) - 1
+        elapsed_days = (end_dates - np.datetime64(start_date, 'D')).astype(np.int64)
+        n_steps = elapsed_days // 30 + 1
+        paying = np.minimum(n_steps, months)  # aportes que rendem até o fim do prazo
+        
+        rates = [self._modality_rates(modality, include_inflation, selected_assets.get(modality), selected_treasury)
+                 for modality in modalities]
+        factor = self.economic_scenarios[scenario]['fator'] if scenario in self.economic_scenarios else 1.0
+        
+        # Saldo líquido de cada plano por prazo, para toda a grade mensal: (modalidade, plano, mês)
+        net = np.empty((len(rates), len(mixes), len(months)))
+        yearly_totals = np.empty(len(mixes))
+        for j, mix in enumerate(mixes):
+            schedule = self._calculate_contributions(mix, 'monthly', start_date, end_dates[-1].item())
+            steps, amounts = schedule.elapsed_months, schedule.amounts
+            yearly_totals[j] = sum(
+                float(value) * (12 if CONTRIBUTION_MONTHS[freq] is None else len(CONTRIBUTION_MONTHS[freq]))
+                for freq, value in mix.items()
+            )
+            
+            # Somas prefixadas: total aportado, soma de k*aporte e soma de aporte*(1+r)^-k
+            counted = np.searchsorted(steps, n_steps)
+            growing = np.searchsorted(steps, paying)
+            contributed = np.concatenate(([0.0], np.cumsum(amounts)))
+            weighted = np.concatenate(([0.0], np.cumsum(amounts * steps)))
+            for i, rate in enumerate(rates):
+                discounted = np.concatenate(([0.0], np.cumsum(amounts * (1 + rate['appreciation']) ** -steps.astype(np.float64))))
+                balance = (1 + rate['appreciation']) ** months * discounted[growing]
+                balance += rate['dividends'] * (months * contributed[growing] - weighted[growing])
+                total = contributed[counted]
+                if include_taxes:
+                    balance -= (balance - total) * self._income_tax_rate(rate['tax_type'], months)
+                net[i, j] = balance * factor
+        
+        # Aporte necessário: o saldo líquido é linear na escala do plano
+        horizon_net = net[:, :, horizons][:, :, None, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            required_scale = np.where(horizon_net > 0, goals[:, None] / horizon_net, np.inf)
+        required_scale[..., goals <= 0, :] = 0.0
+        
+        # Tempo até o objetivo: primeira passagem pelo valor-alvo (máximo acumulado é monotônico)
+        reached = np.maximum.accumulate(net, axis=-1)
+        time_to_goal = np.full((len(rates), len(mixes), len(goals)), np.inf)
+        for i in range(len(rates)):
+            for j in range(len(mixes)):
+                crossing = np.searchsorted(reached[i, j], goals)
+                inside = crossing < len(months)
+                month = np.minimum(crossing, len(months) - 1)
+                before = reached[i, j, np.maximum(month - 1, 0)]
+                after = reached[i, j, month]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    fraction = np.where(after > before, (goals - before) / (after - before), 1.0)
+                time_to_goal[i, j] = np.where(inside, np.where(month > 0, month - 1 + fraction, 0.0), np.inf)
+        
+        # Plano sem aportes: escala infinita vezes zero (NaN) no aporte mensal equivalente
+        with np.errstate(invalid='ignore'):
+            required_monthly = required_scale * (yearly_totals / 12)[None, :, None, None]
+        
+        result = {
+            'modalities': list(modalities),
+            'goals': goals,
+            'horizons': horizons,
+            'mixes': [dict(mix) for mix in mixes],
+            'required_scale': required_scale,
+            'required_monthly': required_monthly,
+            'time_to_goal': time_to_goal
+        }
+        # Os arrays ficam no cache de resultados, então são somente leitura
+        for value in result.values():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+        return result
+    
+    def simulate_partial_withdrawal(self, amount, frequency, start_date, end_date, 
+                                  withdrawal_amount, withdrawal_date, investment_type, 
+                                  selected_assets=None, include_inflation=False, include_taxes=False):
+        """Simula resgates parciais durante o período de investimento"""
+        # Implementação simplificada para resgates parciais
+        months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
+        withdrawal_months = (withdrawal_date.year - start_date.year) * 12 + (withdrawal_date.month - start_date.month)
+        
+        # Calcular até o resgate
+        if investment_type in ['selic', 'cdb']:
+            result_until_withdrawal = self.calculate_fixed_income(
+                amount, frequency, start_date, withdrawal_date, investment_type, include_inflation, include_taxes
+            )
+        elif investment_type == 'treasury':
+            result_until_withdrawal = self.calculate_treasury(
+                amount, frequency, start_date, withdrawal_date, selected_assets, include_inflation, include_taxes
+            )
+        else:
+            result_until_withdrawal = self.calculate_variable_income(
+                amount, frequency, start_date, withdrawal_date, investment_type, selected_assets, include_inflation, include_taxes
+            )
+        
+        # Aplicar resgate
+        balance_after_withdrawal = max(0, result_until_withdrawal['final_balance'] - withdrawal_amount)
+        
+        # Calcular do resgate até o final
+        remaining_months = months - withdrawal_months
+        if remaining_months > 0:
+            if investment_type in ['selic', 'cdb']:
+                monthly_rate = result_until_withdrawal['monthly_rate']
+                final_balance = balance_after_withdrawal * (1 + monthly_rate) ** remaining_months
+            elif investment_type == 'treasury':
+                monthly_rate = result_until_withdrawal['monthly_rate']
+                final_balance = balance_after_withdrawal * (1 + monthly_rate) ** remaining_months
+            else:
+                monthly_rate = result_until_withdrawal['monthly_rate']
+                final_balance = balance_after_withdrawal * (1 + monthly_rate) ** remaining_months
+        else:
+            final_balance = balance_after_withdrawal
+        
+        # Ajustar resultados
+        result_until_withdrawal['final_balance'] = final_balance
+        result_until_withdrawal['withdrawal_amount'] = withdrawal_amount
+        result_until_withdrawal['balance_after_withdrawal'] = balance_after_withdrawal
+        
+        return result_until_withdrawal
+    
+    def calculate_risk_metrics(self, historical_data):
+        """Calcula métricas de risco (volatilidade, drawdown)"""
+        # Aceita tanto DataFrame quanto lista de dicionários
+        history = pd.DataFrame(historical_data) if historical_data is not None else pd.DataFrame()
+        if len(history) < 2:
+            return {
+                'volatility': 0,
+                'max_drawdown': 0,
+                'sharpe_ratio': 0
+            }
+        
+        # Extrair valores de balance
+        balances = history['balance'].tolist()
+        
+        # Calcular retornos
+        returns = []
+        for i in range(1, len(balances)):
+            if balances[i-1] > 0:
+                returns.append((balances[i] - balances[i-1]) / balances[i-1])
+            else:
+                returns.append(0)
+        
+        # Volatilidade (anualizada)
+        volatility = np.std(returns) * np.sqrt(12) * 100 if returns else 0
+        
+        # Drawdown máximo
+        peak = balances[0]
+        max_drawdown = 0
+        for balance in balances:
+            if balance > peak:
+                peak = balance
+            drawdown = (peak - balance) / peak * 100
+            if drawdown > max_drawdown:
+                max_drawdown = drawdown
+        
+        # Ratio de Sharpe (simplificado)
+        sharpe_ratio = (np.mean(returns) * 12 - self.inflation_annual) / (np.std(returns) * np.sqrt(12)) if returns and np.std(returns) > 0 else 0
+        
+        return {
+            'volatility': volatility,
+            'max_drawdown': max_drawdown,
+            'sharpe_ratio': sharpe_ratio
+        }
+    
+    def simulate_economic_scenario(self, scenario, base_result):
+        """Aplica um cenário econômico aos resultados
+        
+        O fator do cenário multiplica o saldo final, os rendimentos, os dividendos e os impostos
+        (o saldo líquido continua igual ao saldo bruto menos os impostos).
+        """
+        if scenario in self.economic_scenarios:
+            factor = self.economic_scenarios[scenario]['fator']
+            adjusted_result = base_result.copy()
+            adjusted_result['final_balance'] *= factor
+            adjusted_result['earnings'] *= factor
+            for key in ('dividends', 'taxes'):
+                if key in adjusted_result:
+                    adjusted_result[key] *= factor
+            return adjusted_result
+        return base_result
+    
+    def simulate_monte_carlo(self, amount, frequency, start_date, end_date, asset_type, selected_assets=None,
+                             financial_goal=None, n_paths=10000, include_inflation=False, include_taxes=False,
+                             seed=None, chunk_months=60, band_points=120, executor=None):
+        """Simula caminhos estocásticos de renda variável e retorna faixas de percentis (P5/P50/P95)
+        
+        A valorização mensal é log-normal, com média igual à da simulação determinística e
+        volatilidade calibrada a partir dos ativos; os dividendos seguem o modelo determinístico
+        (rendimento linear sobre o capital aportado, sem reinvestimento) e somam o mesmo valor a
+        todos os caminhos. Os caminhos são gerados em lotes e em blocos de meses, guardando
+        apenas os saldos de no máximo band_points meses do horizonte. Com um SimulationExecutor
+        os lotes são distribuídos entre processos; o resultado para uma mesma seed não depende
+        do número de processos.
+        """
+        months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
+        parameters = self._monte_carlo_parameters(asset_type, selected_assets, include_inflation)
+        schedule = self._calculate_contributions(amount, frequency, start_date, end_date)
+        contributions = self._monthly_contributions(schedule, months)
+        
+        # Meses em que as faixas de percentis são calculadas
+        band_months = np.unique(np.linspace(0, months - 1, min(band_points, months)).round().astype(np.int64)) if months > 0 else np.zeros(0, dtype=np.int64)
+        
+        # Saldos dos caminhos nos meses das faixas (meses_faixa × caminhos)
+        executor = executor or SimulationExecutor(max_workers=1)
+        paths = executor.run_sharded(
+            monte_carlo_kernel, n_paths, (len(band_months), n_paths),
+            args=(contributions, band_months, parameters['drift'], parameters['volatility'], chunk_months),
+            seed=seed
+        )
+        if months > 0 and parameters['dividends']:
+            # Dividendos até o fim de cada mês das faixas: taxa × Σ aporte × meses investidos
+            elapsed = np.arange(months)
+            contributed = np.cumsum(contributions)[band_months]
+            weighted = np.cumsum(contributions * elapsed)[band_months]
+            paths += (parameters['dividends'] * ((band_months + 1) * contributed - weighted)).astype(paths.dtype)[:, None]
+        bands = np.percentile(paths, MONTE_CARLO_PERCENTILES, axis=1) if months > 0 else np.zeros((len(MONTE_CARLO_PERCENTILES), 0))
+        
+        # Impostos sobre o ganho de cada caminho no resgate
+        total_contributed = schedule.total
+        final_balances = paths[-1].astype(np.float64) if months > 0 else np.zeros(n_paths)
+        taxes = np.zeros(n_paths)
+        if include_taxes:
+            taxes = self.calculate_taxes(parameters['tax_type'], np.maximum(final_balances - total_contributed, 0), months)
+        final_balances = final_balances - taxes
+        
+        return {
+            'dates': np.datetime64(start_date, 'M') + band_months + 1,
+            'bands': {f"p{p}": bands[i] for i, p in enumerate(MONTE_CARLO_PERCENTILES)},
+            'final_percentiles': {f"p{p}": float(value) for p, value in zip(MONTE_CARLO_PERCENTILES, np.percentile(final_balances, MONTE_CARLO_PERCENTILES))},
+            'mean_final_balance': float(final_balances.mean()),
+            'probability_goal': float(np.mean(final_balances >= financial_goal)) if financial_goal else None,
+            'total_contributed': total_contributed,
+            'mean_taxes': float(np.mean(taxes)),
+            'n_paths': n_paths,
+            'drift': parameters['drift'],
+            'volatility': parameters['volatility']
+        }
+    
+    def _monte_carlo_parameters(self, asset_type, selected_assets, include_inflation):
+        """Drift e volatilidade mensais (log-retornos) da valorização e taxa mensal de dividendos
+        
+        Valorização e dividendos vêm das mesmas taxas da simulação determinística; a
+        volatilidade é a média dos ativos (selecionados ou, sem seleção, todos os da classe).
+        """
+        rates = self._variable_income_rates(asset_type, selected_assets, include_inflation)
+        data = self.get_asset_data(asset_type)
+        default_volatility = DEFAULT_VOLATILITY.get(asset_type, 0.25)
+        assets = [asset for asset in (selected_assets or []) if asset in data] or list(data)
+        annual_volatility = np.mean([data[asset].get('volatility', default_volatility) for asset in assets])
+        
+        monthly_volatility = annual_volatility / np.sqrt(12)
+        return {
+            # Correção de convexidade: a média dos caminhos cresce à taxa de valorização
+            'drift': float(np.log1p(rates['appreciation']) - monthly_volatility ** 2 / 2),
+            'volatility': float(monthly_volatility),
+            'dividends': float(rates['dividends']),
+            'tax_type': rates['tax_type']
+        }
+    
+    def _monthly_contributions(self, schedule, months):
+        """Soma os aportes por mês decorrido (apenas os que ainda rendem até a data final)"""
+        valid = schedule.elapsed_months < months
+        return np.bincount(schedule.elapsed_months[valid], weights=schedule.amounts[valid], minlength=max(months, 0))
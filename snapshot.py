@@ -0,0 +1,346 @@
+"""Snapshots offline dos dados de mercado (taxas, parâmetros dos ativos e históricos de preços)
+
+Formato do arquivo (versão 1), pensado para ser mapeado em memória:
+
+    8 bytes   assinatura b'SISNAP\\x00\\x00'
+    4 bytes   versão do formato (uint32, little-endian)
+    4 bytes   tamanho do cabeçalho (uint32, little-endian)
+    N bytes   cabeçalho JSON (taxas, ativos, símbolos e a posição de cada array)
+    ...       arrays NumPy contíguos, alinhados em 64 bytes
+
+Os históricos de todos os ativos ficam concatenados em três arrays (datas, fechamentos e
+dividendos) com um array de offsets por símbolo, de modo que carregar um snapshot com
+milhares de ativos lê apenas o cabeçalho; os preços são acessados direto do arquivo mapeado.
+
+Uso pela linha de comando:
+
+    python snapshot.py build saida.sisnap --fii KNRI11,HGLG11 --stocks PETR4,VALE3
+    python snapshot.py build saida.sisnap --csv pasta_com_csvs
+    python snapshot.py info saida.sisnap
+"""
+import argparse
+import datetime
+import json
+import os
+import struct
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from market_data import (
+    asset_info_from_metrics, asset_table_entry, compact_history, history_metrics, split_download,
+    HISTORY_AUTO_ADJUST, HISTORY_PERIOD
+)
+
+SNAPSHOT_MAGIC = b'SISNAP\x00\x00'
+SNAPSHOT_VERSION = 1
+
+# Alinhamento dos arrays dentro do arquivo (permite visões NumPy sem cópia)
+ALIGNMENT = 64
+
+# Campos de taxas do simulador que um snapshot pode substituir
+RATE_FIELDS = (
+    'selic_annual', 'cdb_monthly', 'inflation_annual', 'income_tax_rates',
+    'brokerage_fee', 'administration_fee'
+)
+
+ASSET_TYPES = ('fii', 'stocks', 'treasury')
+
+_PREAMBLE = struct.Struct('<8sII')
+
+
+class SnapshotError(ValueError):
+    """Arquivo de snapshot inválido ou de versão não suportada"""
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class MarketSnapshot:
+    """Snapshot carregado: taxas, tabelas de ativos e históricos mapeados em memória"""
+
+    def __init__(self, header, arrays, path=None):
+        self.path = path
+        self.version = header['format_version']
+        self.created_at = header.get('created_at')
+        self.source = header.get('source', '')
+        self.rates = header.get('rates', {})
+        self.assets = {asset_type: header.get('assets', {}).get(asset_type, {}) for asset_type in ASSET_TYPES}
+        self.symbols = header.get('symbols', [])
+        self._positions = {symbol: position for position, symbol in enumerate(self.symbols)}
+        self._arrays = arrays
+
+    def __contains__(self, symbol):
+        return symbol in self._positions
+
+    def history(self, symbol):
+        """Histórico compacto (fechamento e dividendos) de um ativo, ou None se não existir"""
+        position = self._positions.get(symbol)
+        if position is None:
+            return None
+        start, end = self._arrays['offsets'][position:position + 2]
+        return pd.DataFrame({
+            'close': self._arrays['close'][start:end],
+            'dividends': self._arrays['dividends'][start:end]
+        }, index=pd.DatetimeIndex(self._arrays['dates'][start:end]))
+
+    def describe(self):
+        """Resumo do conteúdo do snapshot"""
+        return {
+            'path': self.path,
+            'format_version': self.version,
+            'created_at': self.created_at,
+            'source': self.source,
+            'rates': sorted(self.rates),
+            'assets': {asset_type: len(table) for asset_type, table in self.assets.items()},
+            'histories': len(self.symbols),
+            'price_points': int(self._arrays['offsets'][-1]) if len(self._arrays['offsets']) else 0
+        }
+
+
+def write_snapshot(path, rates=None, assets=None, histories=None, source=''):
+    """Grava um snapshot em path
+
+    rates: dicionário com campos de RATE_FIELDS; assets: {tipo: {ticker: parâmetros}} no formato
+    das tabelas do simulador; histories: {ticker: histórico compacto (colunas close e dividends)}.
+    """
+    rates = dict(rates or {})
+    unknown = set(rates) - set(RATE_FIELDS)
+    if unknown:
+        raise ValueError(f"Taxas desconhecidas: {', '.join(sorted(unknown))}")
+    assets = assets or {}
+    histories = histories or {}
+
+    symbols = sorted(histories)
+    lengths = [len(histories[symbol]) for symbol in symbols]
+    offsets = np.zeros(len(symbols) + 1, dtype='<i8')
+    np.cumsum(lengths, out=offsets[1:])
+
+    def column(name, dtype):
+        if not symbols:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate([np.asarray(histories[symbol][name], dtype=dtype) for symbol in symbols])
+
+    arrays = {
+        'offsets': offsets,
+        'dates': np.concatenate([
+            pd.DatetimeIndex(histories[symbol].index).values.astype('datetime64[D]') for symbol in symbols
+        ]).astype('<M8[D]') if symbols else np.empty(0, dtype='<M8[D]'),
+        'close': column('close', '<f4'),
+        'dividends': column('dividends', '<f4')
+    }
+
+    header = {
+        'format_version': SNAPSHOT_VERSION,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'source': source,
+        'rates': rates,
+        'assets': {asset_type: assets.get(asset_type, {}) for asset_type in ASSET_TYPES},
+        'symbols': symbols,
+        'arrays': {}
+    }
+
+    # As posições dos arrays são relativas ao início da área de dados (logo após o cabeçalho)
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+    encoded = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    data_start = _align(_PREAMBLE.size + len(encoded))
+
+    # Grava em um arquivo temporário e substitui o destino de uma vez
+    temporary = f"{path}.tmp-{os.getpid()}"
+    with open(temporary, 'wb') as file:
+        file.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(encoded)))
+        file.write(encoded)
+        for name, array in arrays.items():
+            file.seek(data_start + header['arrays'][name]['offset'])
+            file.write(np.ascontiguousarray(array).tobytes())
+        file.truncate(data_start + offset)
+    os.replace(temporary, path)
+    return path
+
+
+def load_snapshot(path):
+    """Carrega um snapshot mapeando os arrays do arquivo em memória (sem copiá-los)"""
+    with open(path, 'rb') as file:
+        preamble = file.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            raise SnapshotError(f"{path}: arquivo de snapshot truncado")
+        magic, version, header_size = _PREAMBLE.unpack(preamble)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"{path}: não é um snapshot do SecureInvest")
+        if version > SNAPSHOT_VERSION:
+            raise SnapshotError(f"{path}: versão {version} do formato não suportada (máximo {SNAPSHOT_VERSION})")
+        header = json.loads(file.read(header_size).decode('utf-8'))
+
+    data_start = _align(_PREAMBLE.size + header_size)
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for name, layout in header['arrays'].items():
+        dtype = np.dtype(layout['dtype'])
+        count = int(np.prod(layout['shape']))
+        start = data_start + layout['offset']
+        arrays[name] = mapped[start:start + count * dtype.itemsize].view(dtype).reshape(layout['shape'])
+    return MarketSnapshot(header, arrays, path=path)
+
+
+_default_snapshot = None
+_default_snapshot_lock = threading.Lock()
+
+
+def default_snapshot():
+    """Snapshot indicado pela variável SECUREINVEST_SNAPSHOT (carregado uma vez por processo)"""
+    global _default_snapshot
+    path = os.environ.get('SECUREINVEST_SNAPSHOT')
+    if not path:
+        return None
+    with _default_snapshot_lock:
+        if _default_snapshot is None or _default_snapshot.path != path:
+            _default_snapshot = load_snapshot(path)
+        return _default_snapshot
+
+
+def build_from_yfinance(tickers, rates=None, max_workers=8):
+    """Monta um snapshot a partir do Yahoo Finance
+
+    tickers: {tipo: [tickers]} para 'fii' e 'stocks' (títulos do Tesouro não existem no Yahoo).
+    Retorna (assets, histories) prontos para write_snapshot.
+    """
+    import yfinance as yf
+
+    symbols = {f"{ticker}.SA": (asset_type, ticker) for asset_type in ('fii', 'stocks') for ticker in tickers.get(asset_type, [])}
+    frame = yf.download(
+        list(symbols), period=HISTORY_PERIOD, actions=True, group_by='ticker',
+        auto_adjust=HISTORY_AUTO_ADJUST, progress=False, threads=True
+    )
+    downloaded = split_download(frame, list(symbols))
+
+    def fetch_info(symbol):
+        try:
+            return yf.Ticker(symbol).info
+        except Exception:
+            return {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        infos = dict(zip(downloaded, pool.map(fetch_info, downloaded)))
+
+    assets = {asset_type: {} for asset_type in ASSET_TYPES}
+    histories = {}
+    for symbol, history in downloaded.items():
+        asset_type, ticker = symbols[symbol]
+        asset_info = asset_info_from_metrics(ticker, infos[symbol], history_metrics(history))
+        assets[asset_type][ticker] = asset_table_entry(asset_type, asset_info)
+        histories[ticker] = history
+    return assets, histories
+
+
+def build_from_csv(directory):
+    """Monta um snapshot a partir de CSVs
+
+    Arquivos esperados em directory:
+        assets.csv           asset_type, ticker e, opcionalmente, nome, dividend_yield, annual_return,
+                             volatility, segmento, setor, ipca_linked (campos vazios são
+                             calculados a partir do histórico, quando houver)
+        histories/<TICKER>.csv   Date, Close e, opcionalmente, Dividends
+        rates.csv            (opcional) name, value; ex.: selic_annual ou income_tax_rates.cdb
+
+    Retorna (rates, assets, histories) prontos para write_snapshot.
+    """
+    histories = {}
+    history_dir = os.path.join(directory, 'histories')
+    if os.path.isdir(history_dir):
+        for name in sorted(os.listdir(history_dir)):
+            if name.lower().endswith('.csv'):
+                frame = pd.read_csv(os.path.join(history_dir, name), index_col=0, parse_dates=True)
+                histories[os.path.splitext(name)[0]] = compact_history(frame.dropna(subset=['Close']))
+
+    assets = {asset_type: {} for asset_type in ASSET_TYPES}
+    for row in pd.read_csv(os.path.join(directory, 'assets.csv'), dtype=str).fillna('').to_dict('records'):
+        asset_type, ticker = row['asset_type'].strip(), row['ticker'].strip()
+        if asset_type not in ASSET_TYPES:
+            raise ValueError(f"Tipo de ativo desconhecido em assets.csv: {asset_type}")
+
+        history = histories.get(ticker)
+        if history is not None:
+            asset_info = asset_info_from_metrics(ticker, {}, history_metrics(history))
+        else:
+            asset_info = {'nome': ticker, 'volatility': None, 'setor': 'Não especificado', 'segmento': 'Não especificado'}
+        for field in ('nome', 'setor', 'segmento'):
+            if row.get(field):
+                asset_info[field] = row[field]
+        for field in ('dividend_yield', 'annual_return', 'volatility'):
+            if row.get(field):
+                asset_info[field] = float(row[field])
+        asset_info['ipca_linked'] = row.get('ipca_linked', '').strip().lower() in ('1', 'true', 'sim', 'yes')
+
+        required = ('annual_return',) if asset_type == 'treasury' else ('dividend_yield', 'annual_return')
+        missing = [field for field in required if field not in asset_info]
+        if missing:
+            raise ValueError(f"{ticker}: informe {', '.join(missing)} em assets.csv ou o histórico do ativo")
+        assets[asset_type][ticker] = asset_table_entry(asset_type, asset_info)
+
+    return read_rates_csv(os.path.join(directory, 'rates.csv')), assets, histories
+
+
+def read_rates_csv(path):
+    """Lê um CSV name,value de taxas (nomes com ponto indicam campos de dicionário)"""
+    rates = {}
+    if not os.path.exists(path):
+        return rates
+    for row in pd.read_csv(path, dtype={'name': str}).to_dict('records'):
+        name, value = row['name'].strip(), float(row['value'])
+        if '.' in name:
+            field, key = name.split('.', 1)
+            rates.setdefault(field, {})[key] = value
+        else:
+            rates[name] = value
+    return rates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Snapshots offline de dados de mercado do SecureInvest')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='gera um snapshot a partir do Yahoo Finance ou de CSVs')
+    build.add_argument('output', help='arquivo de saída (.sisnap)')
+    build.add_argument('--csv', metavar='DIR', help='pasta com assets.csv, histories/ e rates.csv')
+    build.add_argument('--fii', default='', help='FIIs separados por vírgula (Yahoo Finance)')
+    build.add_argument('--stocks', default='', help='ações separadas por vírgula (Yahoo Finance)')
+    build.add_argument('--rates', metavar='CSV', help='CSV name,value com as taxas de referência')
+
+    info = commands.add_parser('info', help='mostra o conteúdo de um snapshot')
+    info.add_argument('path')
+
+    args = parser.parse_args(argv)
+    if args.command == 'info':
+        print(json.dumps(load_snapshot(args.path).describe(), indent=2, ensure_ascii=False))
+        return 0
+
+    if args.csv:
+        rates, assets, histories = build_from_csv(args.csv)
+        source = f"csv:{os.path.abspath(args.csv)}"
+    else:
+        tickers = {
+            'fii': [ticker.strip() for ticker in args.fii.split(',') if ticker.strip()],
+            'stocks': [ticker.strip() for ticker in args.stocks.split(',') if ticker.strip()]
+        }
+        if not tickers['fii'] and not tickers['stocks']:
+            parser.error('informe --csv ou ao menos um ticker em --fii/--stocks')
+        rates = {}
+        assets, histories = build_from_yfinance(tickers)
+        source = 'yfinance'
+    if args.rates:
+        rates.update(read_rates_csv(args.rates))
+
+    write_snapshot(args.output, rates, assets, histories, source=source)
+    print(json.dumps(load_snapshot(args.output).describe(), indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
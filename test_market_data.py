@@ -0,0 +1,50 @@
+"""Testes do QuoteFetcher com o provedor local (sem rede): python -m pytest"""
+import asyncio
+import time
+
+import market_data
+from market_data import FakeQuoteProvider, QuoteFetcher
+
+
+def test_refresh_fetches_only_new_bars():
+    provider = FakeQuoteProvider({'PETR4.SA': 30.0})
+    fetcher = QuoteFetcher(provider)
+
+    first = asyncio.run(fetcher.refresh(['PETR4.SA']))
+    asyncio.run(fetcher.refresh(['PETR4.SA']))
+
+    assert set(first) == {'PETR4.SA'}
+    (_, since_first), (_, since_second) = provider.calls
+    assert since_first is None
+    # A segunda consulta parte da última barra já recebida
+    assert since_second == fetcher._bars['PETR4.SA'].index[-1]
+    assert len(fetcher._bars['PETR4.SA']) <= fetcher.max_bars
+
+
+def test_failing_symbol_waits_growing_backoff(monkeypatch):
+    provider = FakeQuoteProvider(failing_symbols=['BTC-USD'])
+    fetcher = QuoteFetcher(provider, base_backoff=60, max_backoff=3600)
+    clock = [time.monotonic()]
+    monkeypatch.setattr(market_data.time, 'monotonic', lambda: clock[0])
+
+    def called(symbol):
+        return sum(1 for name, _ in provider.calls if name == symbol)
+
+    quotes = asyncio.run(fetcher.refresh(['BTC-USD', 'VALE3.SA']))
+    assert set(quotes) == {'VALE3.SA'}
+    assert called('BTC-USD') == 1
+
+    # Dentro do intervalo só o símbolo saudável é consultado
+    asyncio.run(fetcher.refresh(['BTC-USD', 'VALE3.SA']))
+    assert (called('BTC-USD'), called('VALE3.SA')) == (1, 2)
+
+    # Depois de 60 s há uma nova tentativa; a próxima espera passa a 120 s
+    clock[0] += 61
+    asyncio.run(fetcher.refresh(['BTC-USD']))
+    assert called('BTC-USD') == 2
+    clock[0] += 61
+    asyncio.run(fetcher.refresh(['BTC-USD']))
+    assert called('BTC-USD') == 2
+    clock[0] += 60
+    asyncio.run(fetcher.refresh(['BTC-USD']))
+    assert called('BTC-USD') == 3